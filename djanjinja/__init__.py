@@ -7,14 +7,27 @@ from djanjinja.environment import is_safe
 
 
 __all__ = [
+    'batch',
     'bccache',
+    'blocks',
     'bundles',
+    'caches',
+    'dependencies',
     'environment',
     'extensions',
+    'fragments',
+    'freshness',
     'generic',
     'handlers',
+    'i18n',
     'loader',
+    'management',
+    'memo',
+    'memory',
     'middleware',
+    'perflint',
+    'pool',
+    'profiling',
     'views',
 ]
 
@@ -36,3 +49,124 @@ def get_template(template_name):
     """Return the specified template."""
     
     return get_env().get_template(template_name)
+
+
+def select_template(template_names):
+    
+    """
+    Return the first of the specified templates which exists.
+    
+    Lookups of missing templates are cached in production (see
+    ``environment.Environment.is_missing()``), so long lists of fallbacks do
+    not have to be searched for on every request.
+    """
+    
+    return get_env().select_template(template_names)
+
+
+def preload(templates=None):
+    
+    """
+    Warm up the template environment, e.g. before a server forks.
+    
+    This bootstraps the environment (loading all the bundles specified in
+    ``DJANJINJA_BUNDLES``), and then loads each of the given templates into
+    the environment's cache, compiling them or fetching their bytecode as
+    necessary. ``templates`` is a list of template names and glob patterns,
+    which defaults to the ``JINJA_PRELOAD_TEMPLATES`` setting; patterns are
+    matched against the templates found by ``environment.list_templates()``.
+    
+    Returns a report, as a dictionary with the following keys:
+    
+    ``bootstrap``
+        The number of seconds spent bootstrapping (``0`` if the environment
+        had already been bootstrapped).
+    ``bundles``
+        A list of the bundle specifiers loaded from the settings.
+    ``templates``
+        A dictionary mapping each warmed template name to the number of
+        seconds spent loading it.
+    ``errors``
+        A dictionary mapping the names of any templates which could not be
+        loaded to the exception raised.
+    ``cache_size``
+        The number of templates the environment's cache holds (``None`` if it
+        is unlimited); see the ``JINJA_CACHE_SIZE`` setting.
+    ``evicted``
+        The number of templates loaded which didn't fit in the cache, and so
+        will have to be loaded again. A warning is issued if this isn't ``0``.
+    ``total``
+        The total number of seconds taken.
+    """
+    
+    import fnmatch
+    import time
+    import warnings
+    
+    from django.conf import settings
+    
+    start = time.time()
+    report = {'bootstrap': 0, 'templates': {}, 'errors': {},
+        'bundles': list(getattr(settings, 'DJANJINJA_BUNDLES', []))}
+    
+    if not environment.TEMPLATE_ENVIRONMENT:
+        environment.bootstrap()
+        report['bootstrap'] = time.time() - start
+    env = environment.TEMPLATE_ENVIRONMENT
+    
+    if templates is None:
+        templates = getattr(settings, 'JINJA_PRELOAD_TEMPLATES', ())
+    
+    names, available = [], None
+    for pattern in templates:
+        if not [char for char in '*?[' if char in pattern]:
+            names.append(pattern)
+            continue
+        if available is None:
+            available = environment.list_templates()
+        names.extend(fnmatch.filter(available, pattern))
+    
+    for name in names:
+        if name in report['templates'] or name in report['errors']:
+            continue
+        template_start = time.time()
+        try:
+            env.get_template(name)
+        # pylint: disable-msg=W0703
+        except Exception, exc:
+            report['errors'][name] = exc
+        else:
+            report['templates'][name] = time.time() - template_start
+    
+    # An unlimited cache is a plain dictionary, and a disabled one is `None`.
+    if env.cache is None:
+        report['cache_size'] = 0
+    else:
+        report['cache_size'] = getattr(env.cache, 'capacity', None)
+    report['evicted'] = 0
+    if report['cache_size'] is not None:
+        report['evicted'] = max(0,
+            len(report['templates']) - report['cache_size'])
+    if report['evicted']:
+        warnings.warn('%d of the %d templates preloaded did not fit in the '
+            'template cache; consider raising JINJA_CACHE_SIZE (currently '
+            '%d).' % (report['evicted'], len(report['templates']),
+                report['cache_size']), RuntimeWarning)
+    
+    report['total'] = time.time() - start
+    return report
+
+
+def render_many(template_name, contexts, workers=None, batch_size=100):
+    
+    """
+    Render a template with each of a sequence of contexts, in parallel.
+    
+    This yields a ``(content, error)`` pair for each context, in order. See
+    ``batch.render_many()`` for more information.
+    """
+    
+    from djanjinja import batch
+    
+    return batch.render_many(template_name, contexts, workers=workers,
+        batch_size=batch_size)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rendering of large numbers of templates in parallel processes.
+
+``render_many()`` (also available as ``djanjinja.render_many()``) renders a
+stream of contexts on a pool of worker processes, yielding the results in
+order as they become available. The environment is bootstrapped, and the
+templates preloaded, before the workers are forked, so each of them starts
+with the compiled templates already in its cache; the database connection and
+cache clients are closed first, so that the workers don't share their sockets.
+
+Contexts are sent to the workers in batches, and only a few batches per
+worker are outstanding at any time, so memory use stays bounded however many
+contexts there are (as long as they are given as an iterator).
+"""
+
+from collections import deque
+import traceback
+
+
+class RenderError(Exception):
+    
+    """
+    Describes the failure to render a single item in ``render_many()``.
+    
+    Exceptions from worker processes can't always be sent back to the parent,
+    so this carries the formatted traceback from the worker instead.
+    """
+    
+    def __init__(self, message, traceback=None):
+        super(RenderError, self).__init__(message)
+        self.traceback = traceback
+
+
+def render_many(template_name, contexts, workers=None, batch_size=100):
+    
+    """
+    Render a template with each of a sequence of contexts, in parallel.
+    
+    ``contexts`` may be any iterable of dictionaries (or Django contexts). If
+    ``template_name`` is ``None``, it should instead be an iterable of
+    ``(template_name, context)`` pairs; these are read in full and grouped by
+    template, so that each batch renders a single template. Each batch of
+    ``batch_size`` contexts is rendered by one of ``workers`` processes (by
+    default, one per CPU); with ``workers=0``, everything is rendered in this
+    process.
+    
+    Yields a ``(content, error)`` pair for each context, in order. One of the
+    two is always ``None``; ``error`` is a ``RenderError`` if rendering that
+    context failed, which doesn't stop the rest from being rendered.
+    """
+    
+    import multiprocessing
+    
+    from djanjinja import preload
+    
+    if template_name is not None:
+        preload([template_name])
+        items = enumerate((template_name, context) for context in contexts)
+    else:
+        pairs = list(contexts)
+        preload(sorted(set(name for name, context in pairs)))
+        # Sorting is stable, so the contexts for each template stay in order.
+        items = sorted(enumerate(pairs), key=lambda item: item[1][0])
+    batches = iter_batches(items, batch_size)
+    
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers:
+        completed = render_in_pool(batches, workers)
+    else:
+        completed = ((indices, render_batch(batch))
+            for indices, batch in batches)
+    try:
+        for result in in_order(completed):
+            yield result
+    finally:
+        # This also stops the pool if the caller stops iterating early.
+        completed.close()
+
+
+def render_in_pool(batches, workers):
+    """Render batches on a pool of processes, yielding their results."""
+    
+    import multiprocessing
+    
+    # The workers mustn't share this process's database and cache sockets.
+    close_connections()
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = deque()
+        for indices, batch in batches:
+            pending.append((indices, pool.apply_async(render_batch, (batch,))))
+            # Keep a couple of batches queued for each worker, but no more.
+            if len(pending) >= workers * 2:
+                indices, result = pending.popleft()
+                yield indices, result.get()
+        while pending:
+            indices, result = pending.popleft()
+            yield indices, result.get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def close_connections():
+    
+    """
+    Close the database connection and cache clients of this process.
+    
+    This is done before forking, so that the children don't share (and
+    corrupt the protocol streams of) the parent's sockets. Both reconnect
+    when next used.
+    """
+    
+    from django.core import cache
+    from django.db import connection
+    
+    from djanjinja import caches
+    
+    connection.close()
+    for django_cache in [cache.cache] + caches.CACHES.values():
+        if hasattr(django_cache, 'close'):
+            django_cache.close()
+
+
+def iter_batches(items, size):
+    
+    """
+    Split indexed ``(template_name, context)`` pairs into batches.
+    
+    Yields ``(indices, pairs)`` for each batch of (at most) ``size`` pairs;
+    every pair in a batch has the same template.
+    """
+    
+    from djanjinja.views import context_to_dict
+    
+    indices, batch = [], []
+    for index, (name, context) in items:
+        if batch and (len(batch) >= size or name != batch[0][0]):
+            yield indices, batch
+            indices, batch = [], []
+        indices.append(index)
+        batch.append((name, context_to_dict(context)))
+    if batch:
+        yield indices, batch
+
+
+def in_order(completed):
+    """Yield the results of ``(indices, results)`` batches in index order."""
+    
+    waiting, next_index = {}, 0
+    for indices, results in completed:
+        waiting.update(zip(indices, unpack_results(results)))
+        while next_index in waiting:
+            yield waiting.pop(next_index)
+            next_index += 1
+
+
+def render_batch(batch):
+    
+    """
+    Render a batch of ``(template_name, context)`` pairs.
+    
+    Returns a list of ``(content, error)`` pairs, where ``error`` is a
+    ``(message, traceback)`` pair (or ``None``), since not every exception can
+    be pickled.
+    """
+    
+    from djanjinja import get_env
+    
+    environment = get_env()
+    results = []
+    for template_name, context in batch:
+        try:
+            content = environment.get_template(template_name).render(context)
+        # pylint: disable-msg=W0703
+        except Exception, exc:
+            results.append((None,
+                ('%s: %s' % (type(exc).__name__, exc), traceback.format_exc())))
+        else:
+            results.append((content, None))
+    return results
+
+
+def unpack_results(results):
+    """Turn the errors in a list of results into ``RenderError``s."""
+    
+    for content, error in results:
+        if error is not None:
+            error = RenderError(*error)
+        yield content, error
@@ -2,7 +2,15 @@
 
 """A Jinja2 bytecode cache which uses the Django caching framework."""
 
+import imp
+import marshal
+import os
+import struct
+import threading
+import time
+
 import jinja2
+from jinja2.bccache import bc_magic
 
 
 class B64CacheClient(object):
@@ -26,34 +34,474 @@ class B64CacheClient(object):
         if data is not None:
             return data.decode('base64')
     
+    def get_many(self, keys):
+        """Fetch several keys from the cache, base64-decoding the results."""
+        return dict((key, data.decode('base64'))
+            for key, data in self.cache.get_many(keys).iteritems()
+            if data is not None)
+    
     def set(self, key, value, timeout=None):
         """Set a value in the cache, performing base64 encoding beforehand."""
         if timeout is not None:
             self.cache.set(key, value.encode('base64'), timeout)
         else:
             self.cache.set(key, value.encode('base64'))
+    
+    def add(self, key, value, timeout=None):
+        """Set a value only if the key is not already in the cache."""
+        return self.cache.add(key, value.encode('base64'), timeout)
+    
+    def delete(self, key):
+        """Delete a key from the cache."""
+        self.cache.delete(key)
+
+
+class DjangoBytecodeCache(jinja2.MemcachedBytecodeCache):
+    
+    """
+    A memcached-style bytecode cache which supports prefetching.
+    
+    ``prefetch()`` fetches the bytecode for several templates from the client
+    in one batch (using its ``get_many()`` or ``get_multi()`` method, if it
+    has one). Prefetched bytecode is held per-thread until those templates
+    are loaded, and is used instead of a round trip to the cache. Like any
+    other bytecode, it is discarded if the template source has changed.
+    
+    If ``lease_timeout`` is given, processes which need to compile a template
+    first take out a lease on it (using the client's atomic ``add()``), so
+    that when many processes miss the same template at once, only one of them
+    compiles it; the others poll the cache for up to ``lease_timeout``
+    seconds, waiting for its bytecode to appear.
+    """
+    
+    lease_prefix = 'jinja2/lease/'
+    # The number of seconds to wait between polls for leased bytecode.
+    lease_poll_interval = 0.05
+    
+    def __init__(self, client, prefix='jinja2/bytecode/', timeout=None,
+            lease_timeout=None):
+        super(DjangoBytecodeCache, self).__init__(client, prefix=prefix,
+            timeout=timeout)
+        self.lease_timeout = lease_timeout
+        self.prefetched = threading.local()
+    
+    def acquire_lease(self, key):
+        """Try to take the lease on compiling a template, returning success."""
+        
+        if not self.lease_timeout or not hasattr(self.client, 'add'):
+            return True
+        return bool(self.client.add(self.lease_prefix + key, '1',
+            self.lease_timeout))
+    
+    def release_lease(self, key):
+        """Give up the lease on compiling a template."""
+        
+        if self.lease_timeout and hasattr(self.client, 'delete'):
+            self.client.delete(self.lease_prefix + key)
+    
+    def wait_for_bucket(self, bucket):
+        """Poll for bytecode compiled by the lease holder, giving up in time."""
+        
+        deadline = time.time() + (self.lease_timeout or 0)
+        while bucket.code is None and time.time() < deadline:
+            time.sleep(self.lease_poll_interval)
+            self.load_bytecode(bucket)
+    
+    def prefetch(self, keys):
+        """Fetch the bytecode for several keys in one batch."""
+        
+        get_many = getattr(self.client, 'get_many',
+            getattr(self.client, 'get_multi', None))
+        if get_many is None:
+            return
+        
+        if not hasattr(self.prefetched, 'data'):
+            self.prefetched.data = {}
+        keys = [self.prefix + key for key in keys
+            if key not in self.prefetched.data]
+        if not keys:
+            return
+        for key, value in get_many(keys).iteritems():
+            self.prefetched.data[key[len(self.prefix):]] = value
+    
+    def load_bytecode(self, bucket):
+        """Load bytecode, using any which has been prefetched."""
+        
+        code = getattr(self.prefetched, 'data', {}).pop(bucket.key, None)
+        if code is not None:
+            bucket.bytecode_from_string(code)
+        else:
+            super(DjangoBytecodeCache, self).load_bytecode(bucket)
+
+
+class VariantBytecodeCache(jinja2.BytecodeCache):
+    
+    """
+    Wraps a bytecode cache, qualifying all of its keys with a variant name.
+    
+    This is used to store the bytecode for different variants of the same
+    template (such as the per-language variants created by
+    ``Environment.for_language()``) in one underlying cache.
+    """
+    
+    def __init__(self, cache, variant):
+        self.cache = cache
+        self.variant = variant
+    
+    def get_cache_key(self, name, filename=None):
+        """Return the wrapped cache's key, qualified with the variant name."""
+        
+        return '%s:%s' % (
+            self.cache.get_cache_key(name, filename), self.variant)
+    
+    def load_bytecode(self, bucket):
+        """Load bytecode into the bucket from the wrapped cache."""
+        
+        self.cache.load_bytecode(bucket)
+    
+    def dump_bytecode(self, bucket):
+        """Dump bytecode from the bucket into the wrapped cache."""
+        
+        self.cache.dump_bytecode(bucket)
+    
+    def prefetch(self, keys):
+        """Prefetch bytecode from the wrapped cache, if it supports it."""
+        
+        if hasattr(self.cache, 'prefetch'):
+            self.cache.prefetch(keys)
+    
+    def acquire_lease(self, key):
+        """Take a compilation lease from the wrapped cache, if it has them."""
+        
+        return acquire_lease(self.cache, key)
+    
+    def release_lease(self, key):
+        """Release a compilation lease taken from the wrapped cache."""
+        
+        release_lease(self.cache, key)
+    
+    def wait_for_bucket(self, bucket):
+        """Wait for bytecode compiled by another process, if supported."""
+        
+        wait_for_bucket(self.cache, bucket)
+    
+    def clear(self):
+        """Clear the wrapped cache."""
+        
+        self.cache.clear()
+
+
+class MmapBytecodeCache(jinja2.BytecodeCache):
+    
+    """
+    A bytecode cache shared by all processes on a host via a mapped file.
+    
+    Pre-forked worker processes would each normally fetch (or compile) and
+    keep their own copy of every template's bytecode. This cache stores
+    marshalled bytecode in a single append-only file, which every process
+    maps into memory read-only; code objects are unmarshalled directly from
+    the mapping. Each record carries the checksum of the template source it
+    was compiled from, and newer records for a template supersede older ones.
+    
+    Records are appended under an exclusive ``flock()``, so whichever process
+    compiles a template first (or a preload step, such as
+    ``djanjinja.preload()``) populates the file for all of the others. An
+    optional ``fallback`` bytecode cache is consulted on misses, and is
+    written to whenever this cache is.
+    
+    The file only ever grows; call ``clear()`` (e.g. on deploy) to empty it.
+    This replaces the file with a new one, rather than truncating it, since
+    other processes may be reading the old one; they notice the replacement
+    and reopen the file. A process also reopens the file after forking, since
+    ``flock()`` locks belong to the open file, which a forked child shares
+    with its parent.
+    """
+    
+    # Identifies the file format, Jinja2 bytecode version and Python version.
+    header = 'DJBC' + bc_magic + imp.get_magic()
+    # Each record is prefixed with the length of its key, checksum and code.
+    record = struct.Struct('>HHI')
+    
+    def __init__(self, filename, fallback=None):
+        self.filename = filename
+        self.fallback = fallback
+        # Maps keys to `(checksum, offset, length)` triples.
+        self.index = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.mmap = None
+        # The process which opened `file`.
+        self.pid = None
+        # The offset up to which the file has been read into the index.
+        self.scanned = 0
+    
+    def load_bytecode(self, bucket):
+        """Load bytecode from the mapped file, or from the fallback cache."""
+        
+        self.lock.acquire()
+        try:
+            self._refresh()
+            entry = self.index.get(bucket.key)
+            if entry is not None and entry[0] == bucket.checksum:
+                offset, length = entry[1:]
+                # `marshal` can read directly from a buffer over the mapping.
+                bucket.code = marshal.loads(buffer(self.mmap, offset, length))
+                return
+        finally:
+            self.lock.release()
+        
+        if self.fallback is not None:
+            self.fallback.load_bytecode(bucket)
+            if bucket.code is not None:
+                self._append(bucket)
+    
+    def dump_bytecode(self, bucket):
+        """Append bytecode to the mapped file (and the fallback cache)."""
+        
+        if self.fallback is not None:
+            self.fallback.dump_bytecode(bucket)
+        self._append(bucket)
+    
+    def prefetch(self, keys):
+        """Prefetch any keys not in the mapped file from the fallback cache."""
+        
+        if not hasattr(self.fallback, 'prefetch'):
+            return
+        self.lock.acquire()
+        try:
+            self._refresh()
+            keys = [key for key in keys if key not in self.index]
+        finally:
+            self.lock.release()
+        if keys:
+            self.fallback.prefetch(keys)
+    
+    def acquire_lease(self, key):
+        """Take a compilation lease from the fallback cache, if it has them."""
+        
+        return acquire_lease(self.fallback, key)
+    
+    def release_lease(self, key):
+        """Release a compilation lease taken from the fallback cache."""
+        
+        release_lease(self.fallback, key)
+    
+    def wait_for_bucket(self, bucket):
+        """Wait for bytecode compiled by another process, if supported."""
+        
+        wait_for_bucket(self.fallback, bucket)
+        if bucket.code is not None:
+            self._append(bucket)
+    
+    def clear(self):
+        """Replace the mapped file with an empty one, and clear the fallback."""
+        
+        import fcntl
+        
+        self.lock.acquire()
+        try:
+            self._lock_file()
+            try:
+                self._replace_file()
+            finally:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self._refresh()
+        finally:
+            self.lock.release()
+        
+        if self.fallback is not None:
+            self.fallback.clear()
+    
+    def _append(self, bucket):
+        """Append a record for the bucket, unless an identical one exists."""
+        
+        import fcntl
+        
+        code = marshal.dumps(bucket.code)
+        key, checksum = str(bucket.key), str(bucket.checksum)
+        
+        self.lock.acquire()
+        try:
+            self._lock_file()
+            try:
+                # Another process may have got here first.
+                self._refresh()
+                entry = self.index.get(key)
+                if entry is None or entry[0] != checksum:
+                    self.file.seek(0, os.SEEK_END)
+                    self.file.write(
+                        self.record.pack(len(key), len(checksum), len(code)) +
+                        key + checksum + code)
+                    self.file.flush()
+            finally:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self._refresh()
+        finally:
+            self.lock.release()
+    
+    def _lock_file(self):
+        """Open the current file and lock it exclusively. Requires the lock."""
+        
+        import fcntl
+        
+        self._open()
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        # The file may have been replaced while waiting for the lock.
+        while self._replaced():
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self._open()
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+    
+    def _open(self):
+        
+        """
+        Open (and if necessary, initialize) the file.
+        
+        The file is opened again if it has been replaced (see ``clear()``), or
+        if it was opened by the process this one was forked from. A file
+        written by an incompatible version is replaced with an empty one, so
+        that records appended from now on can be read by every process.
+        """
+        
+        import fcntl
+        
+        if self.file is not None:
+            if self.pid == os.getpid() and not self._replaced():
+                return
+            self._close()
+        while True:
+            self.file = open(self.filename, 'a+b')
+            self.pid = os.getpid()
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            try:
+                if os.fstat(self.file.fileno()).st_size == 0:
+                    self.file.write(self.header)
+                    self.file.flush()
+                    return
+                self.file.seek(0)
+                if self.file.read(len(self.header)) == self.header:
+                    return
+                # Another process may have replaced it while we waited.
+                if not self._replaced():
+                    self._replace_file()
+            finally:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self._close()
+    
+    def _replace_file(self):
+        """Replace the file with an empty one. Requires the file lock."""
+        
+        import stat
+        import tempfile
+        
+        fd, temp_filename = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.filename)))
+        try:
+            os.write(fd, self.header)
+            os.fchmod(fd, stat.S_IMODE(os.fstat(self.file.fileno()).st_mode))
+        finally:
+            os.close(fd)
+        # Processes still using the old file keep a valid mapping of it until
+        # they notice that it has been replaced.
+        os.rename(temp_filename, self.filename)
+    
+    def _replaced(self):
+        """Return whether the open file is no longer at ``filename``."""
+        
+        try:
+            current = os.stat(self.filename)
+        except OSError:
+            return True
+        opened = os.fstat(self.file.fileno())
+        return (current.st_ino, current.st_dev) != (opened.st_ino,
+            opened.st_dev)
+    
+    def _close(self):
+        """Close the file and its mapping, and forget its index."""
+        
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.file.close()
+        self.file = None
+        self.index.clear()
+        self.scanned = 0
+    
+    def _refresh(self):
+        """Re-map the file and index any new records. Requires the lock."""
+        
+        import mmap
+        
+        self._open()
+        size = os.fstat(self.file.fileno()).st_size
+        if size == self.scanned:
+            return
+        
+        if self.mmap is not None:
+            self.mmap.close()
+        self.mmap = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        
+        if self.scanned == 0:
+            # `_open()` has checked the header.
+            self.scanned = len(self.header)
+        
+        while self.scanned + self.record.size <= size:
+            key_length, checksum_length, code_length = self.record.unpack(
+                self.mmap[self.scanned:self.scanned + self.record.size])
+            key_offset = self.scanned + self.record.size
+            code_offset = key_offset + key_length + checksum_length
+            if code_offset + code_length > size:
+                # A partially-visible write; pick it up next time.
+                break
+            key = self.mmap[key_offset:key_offset + key_length]
+            checksum = self.mmap[key_offset + key_length:code_offset]
+            self.index[key] = (checksum, code_offset, code_length)
+            self.scanned = code_offset + code_length
+
+
+def acquire_lease(bytecode_cache, key):
+    """Take a compilation lease from a bytecode cache, if it has them."""
+    
+    if hasattr(bytecode_cache, 'acquire_lease'):
+        return bytecode_cache.acquire_lease(key)
+    return True
+
+
+def release_lease(bytecode_cache, key):
+    """Release a compilation lease taken from a bytecode cache."""
+    
+    if hasattr(bytecode_cache, 'release_lease'):
+        bytecode_cache.release_lease(key)
+
+
+def wait_for_bucket(bytecode_cache, bucket):
+    """Wait for another process to store a bucket's bytecode, if supported."""
+    
+    if hasattr(bytecode_cache, 'wait_for_bucket'):
+        bytecode_cache.wait_for_bucket(bucket)
 
 
 def get_cache():
     """Get a Jinja2 bytecode cache which uses the configured Django cache."""
     
     from django.conf import settings
-    from django.core import cache
     
-    cache_backend = cache.parse_backend_uri(settings.CACHE_BACKEND)[0]
-    memcached_client = None
+    from djanjinja import caches
     
-    if cache_backend == 'memcached':
-        # We can get the actual memcached client object itself. This will
-        # avoid the Django problem of storing binary data (as Django tries to
-        # coerce everything to Unicode).
-        
-        # Here, we look for either `cache.cache._cache` or
-        # `cache.cache._client`; I believe there is some discrepancy between
-        # different versions of Django and where they put this.
-        memcached_client = getattr(
-            cache.cache, '_cache', getattr(cache.cache, '_client', None))
+    # This is the default Django cache, unless a separate one has been
+    # configured with `JINJA_BYTECODE_CACHE_BACKEND`. DjanJinja's own
+    # memcached caches store binary data as it is; Django's try to coerce it
+    # to Unicode, so it has to be Base64-encoded for them.
+    client = caches.get_cache('JINJA_BYTECODE_CACHE_BACKEND')
+    if not isinstance(client, caches.MemcachedCache):
+        client = B64CacheClient(client)
     
-    memcached_client = memcached_client or B64CacheClient(cache.cache)
+    bytecode_cache = DjangoBytecodeCache(client,
+        lease_timeout=getattr(settings, 'JINJA_COMPILE_LEASE_TIMEOUT', None))
     
-    return jinja2.MemcachedBytecodeCache(memcached_client)
+    # If a file has been specified, share bytecode between all the processes
+    # on this host, using the Django cache as a second tier.
+    filename = getattr(settings, 'JINJA_BYTECODE_CACHE_FILE', None)
+    if filename:
+        return MmapBytecodeCache(filename, fallback=bytecode_cache)
+    return bytecode_cache
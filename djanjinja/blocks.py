@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rendering of single blocks from templates.
+
+``Template.render_block()`` (and ``djanjinja.views.render_block()``) renders
+just one ``{% block %}`` of a template, as it would appear in the whole page:
+the most-derived definition of the block is used, ``super()`` works, and any
+variables, imports and macros defined at the top level of the template or its
+ancestors are available. This is useful for responding to AJAX requests with
+part of a page, without keeping the markup in a separate template.
+
+The inheritance chain is found from the ``{% extends %}`` tags in the sources
+of the templates, so the names of parent templates must be string literals.
+The chain, the blocks and the top-level definitions (compiled into a small
+template of their own) are resolved once, and kept on the template object;
+they are resolved again whenever any of the templates in the chain changes.
+"""
+
+import sys
+
+from jinja2 import nodes
+from jinja2.exceptions import TemplateError, TemplateRuntimeError
+from jinja2.utils import concat
+
+
+# The nodes at the top level of a template which define variables that its
+# blocks may use.
+DEFINITION_NODES = (nodes.Assign, nodes.Import, nodes.FromImport,
+    nodes.Macro)
+
+
+class BlockNotFound(TemplateError):
+    """Raised when a template and its ancestors have no block with a name."""
+
+
+class BlockResolution(object):
+    
+    """The blocks and top-level definitions of a template and its parents."""
+    
+    def __init__(self, template):
+        # The template and its ancestors, most-derived first.
+        self.chain = []
+        # Maps block names to their render functions, most-derived first.
+        self.blocks = {}
+        # Templates which define the top-level variables of each template in
+        # the chain (where there are any), most-derived first.
+        self.definitions = []
+        
+        current = template
+        while current is not None:
+            if current in self.chain:
+                raise TemplateRuntimeError('Template %r extends itself.' % (
+                    current.name,))
+            self.chain.append(current)
+            for name, block in current.blocks.iteritems():
+                self.blocks.setdefault(name, []).append(block)
+            template_ast = parse(current)
+            definitions = definitions_template(current, template_ast)
+            if definitions is not None:
+                self.definitions.append(definitions)
+            current = parent_template(current, template_ast)
+    
+    def is_up_to_date(self):
+        """Return whether every template in the chain is up-to-date."""
+        
+        for template in self.chain:
+            if not template.is_up_to_date:
+                return False
+        return True
+
+
+def resolve(template):
+    """Return the (possibly cached) ``BlockResolution`` of a template."""
+    
+    resolution = getattr(template, 'block_resolution', None)
+    if resolution is None or (template.environment.auto_reload and
+            not resolution.is_up_to_date()):
+        resolution = template.block_resolution = BlockResolution(template)
+    return resolution
+
+
+def render_block(template, name, *args, **kwargs):
+    
+    """
+    Render a single block of a template.
+    
+    The remaining arguments give the context, as for ``Template.render()``.
+    Raises ``BlockNotFound`` if neither the template nor its ancestors define
+    the block.
+    """
+    
+    resolution = resolve(template)
+    if name not in resolution.blocks:
+        raise BlockNotFound('Template %r has no block %r.' % (
+            template.name, name))
+    
+    context = template.new_context(dict(*args, **kwargs))
+    context.blocks = dict((block_name, list(blocks))
+        for block_name, blocks in resolution.blocks.iteritems())
+    try:
+        # The top level of each template runs before that of its parent, so
+        # the parent's definitions take precedence.
+        for definitions in resolution.definitions:
+            definitions_context = definitions.new_context(context.get_all())
+            concat(definitions.root_render_func(definitions_context))
+            context.vars.update(definitions_context.vars)
+        return concat(resolution.blocks[name][0](context))
+    # pylint: disable-msg=W0702
+    except:
+        exc_info = sys.exc_info()
+    return template.environment.handle_exception(exc_info, True)
+
+
+def parse(template):
+    """Parse the source of a template loaded by name."""
+    
+    environment = template.environment
+    if template.name is None:
+        raise TemplateRuntimeError("Blocks can only be rendered from "
+            "templates loaded by name.")
+    source, filename = environment.loader.get_source(environment,
+        template.name)[:2]
+    return environment.parse(source, template.name, filename)
+
+
+def definitions_template(template, template_ast):
+    """Compile a template's top-level definitions, if it has any."""
+    
+    body = [node for node in template_ast.body
+        if isinstance(node, DEFINITION_NODES)]
+    if not body:
+        return None
+    return template.environment.from_string(nodes.Template(body, lineno=1))
+
+
+def parent_template(template, template_ast):
+    """Load the template which a template extends, if any."""
+    
+    extends = [node for node in template_ast.body
+        if isinstance(node, nodes.Extends)]
+    if not extends:
+        if template_ast.find(nodes.Extends) is not None:
+            raise TemplateRuntimeError("The parent of template %r can't be "
+                "found, since it extends another conditionally." % (
+                    template.name,))
+        return None
+    
+    parent = extends[0].template
+    if not (isinstance(parent, nodes.Const) and
+            isinstance(parent.value, basestring)):
+        raise TemplateRuntimeError("The parent of template %r can't be "
+            "found, since its name is chosen at render time." % (
+                template.name,))
+    return template.environment.get_template(parent.value,
+        parent=template.name)
@@ -6,4 +6,4 @@ interface which DjanJinja expects. Some of these bundles are simple ports of
 existing Django functionality, others are DjanJinja-specific.
 """
 
-__all__ = ['cache', 'humanize', 'site']
\ No newline at end of file
+__all__ = ['cache', 'db', 'humanize', 'site']
\ No newline at end of file
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers for iterating over large querysets in templates.
+
+Looping over a queryset in a template loads every row into memory, since the
+queryset caches its results. The ``chunked()`` and ``iterate()`` functions
+added by this bundle instead fetch the rows in batches of a fixed size, and
+keep none of them once they have been rendered. Used with a streamed response
+(see ``djanjinja.views.stream_to_response()``), this keeps memory use flat
+however many rows are rendered.
+"""
+
+from itertools import islice
+
+from djanjinja.loader import Bundle
+
+
+# The default number of rows fetched per query.
+DEFAULT_CHUNK_SIZE = 1000
+
+
+bundle = Bundle()
+
+
+@bundle.function
+def chunked(queryset, size=DEFAULT_CHUNK_SIZE):
+    
+    """
+    Iterate over a queryset in lists of (at most) ``size`` objects.
+    
+    Each list is fetched with a separate query. Unordered querysets of model
+    instances are paged through by primary key (i.e. ``pk > last_pk``), which
+    stays fast however far in the rows are; any others are sliced by offset,
+    so that their ordering is preserved. Other iterables are simply split up
+    into lists.
+    """
+    
+    if not hasattr(queryset, 'query'):
+        iterator = iter(queryset)
+        chunk = list(islice(iterator, size))
+        while chunk:
+            yield chunk
+            chunk = list(islice(iterator, size))
+        return
+    
+    if pageable_by_pk(queryset):
+        queryset = queryset.order_by('pk')
+        chunk = list(queryset[:size])
+        while chunk:
+            yield chunk
+            if len(chunk) < size:
+                return
+            chunk = list(queryset.filter(pk__gt=chunk[-1].pk)[:size])
+        return
+    
+    offset = 0
+    while True:
+        chunk = list(queryset[offset:offset + size])
+        if chunk:
+            yield chunk
+        if len(chunk) < size:
+            return
+        offset += size
+
+
+@bundle.function
+def iterate(queryset, size=DEFAULT_CHUNK_SIZE):
+    """Iterate over a queryset's objects, fetching ``size`` at a time."""
+    
+    for chunk in chunked(queryset, size=size):
+        for obj in chunk:
+            yield obj
+
+
+def pageable_by_pk(queryset):
+    """Return whether a queryset can be paged through by primary key."""
+    
+    from django.db.models.query import ValuesQuerySet
+    
+    query = queryset.query
+    return not (isinstance(queryset, ValuesQuerySet) or
+        query.order_by or query.model._meta.ordering or
+        query.low_mark or query.high_mark is not None)
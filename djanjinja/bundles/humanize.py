@@ -1,13 +1,203 @@
 # -*- coding: utf-8 -*-
 
-"""Port of django.contrib.humanize to Jinja2."""
+"""
+Port of django.contrib.humanize to Jinja2.
+
+The ``intcomma``, ``intword``, ``apnumber``, ``naturalday`` and ``ordinal``
+filters are reimplemented here, since they are often used on every row of a
+table: they give exactly the same output as Django's, but ``intcomma`` groups
+digits in a single pass (rather than with a recursive regex substitution),
+the words used by ``ordinal`` and ``apnumber`` are translated once per
+language and then kept in ``WORDS``, rather than being looked up on every
+call, and ``naturalday`` parses each date format once, keeping the result in
+``DATE_FORMATS``. Any other filters are copied from Django's register as they
+are.
+"""
+
+import datetime
+import re
 
 from django.contrib.humanize.templatetags import humanize
+from django.utils import dateformat
+from django.utils.encoding import force_unicode
+from django.utils.translation import get_language, ugettext as _, ungettext
+
 from djanjinja.loader import Bundle
 
 
 bundle = Bundle()
 # All of the humanize filters are plain functions too, and Django's way of
 # storing filters is very similar; we just update our bundle's `filters`
-# attribute using humanize's register.
+# attribute using humanize's register. The native filters below then replace
+# their originals.
 bundle.filters.update(humanize.register.filters)
+
+# Maps language codes to the translated words used by the filters (see
+# `words()`).
+WORDS = {}
+
+# Maps date format strings to their parsed pieces (see `format_date()`).
+DATE_FORMATS = {}
+
+# The leading (optionally negative) integer in a string.
+LEADING_INTEGER = re.compile(r'-?\d+')
+
+# The upper limit, divisor and message for each of `intword`'s units.
+INTWORD_UNITS = (
+    (1000000000, 1000000.0, '%(value).1f million'),
+    (1000000000000, 1000000000.0, '%(value).1f billion'),
+    (1000000000000000, 1000000000000.0, '%(value).1f trillion'),
+)
+
+
+def words():
+    """Return the translated words for the active language."""
+    
+    language = get_language()
+    try:
+        return WORDS[language]
+    except KeyError:
+        WORDS[language] = {
+            'ordinals': (_('th'), _('st'), _('nd'), _('rd'), _('th'),
+                _('th'), _('th'), _('th'), _('th'), _('th')),
+            'numbers': (_('one'), _('two'), _('three'), _('four'), _('five'),
+                _('six'), _('seven'), _('eight'), _('nine')),
+        }
+        return WORDS[language]
+
+
+@bundle.filter
+def ordinal(value):
+    """Convert an integer to its ordinal, e.g. 1 to '1st' and 2 to '2nd'."""
+    
+    try:
+        value = int(value)
+    except ValueError:
+        return value
+    suffixes = words()['ordinals']
+    if value % 100 in (11, 12, 13):
+        return u'%d%s' % (value, suffixes[0])
+    return u'%d%s' % (value, suffixes[value % 10])
+
+
+@bundle.filter
+def intcomma(value):
+    """Put commas between every three digits of an integer, e.g. '45,000'."""
+    
+    # Only the leading integer of a string (e.g. of a float) is grouped.
+    if type(value) in (int, long):
+        text = unicode(value)
+        start, end = int(value < 0), len(text)
+    else:
+        text = force_unicode(value)
+        match = LEADING_INTEGER.match(text)
+        if match is None:
+            return text
+        start, end = int(text[0] == u'-'), match.end()
+    
+    length = end - start
+    if length <= 3:
+        return text
+    head = start + (length % 3 or 3)
+    groups = [text[:head]]
+    groups.extend(text[i:i + 3] for i in xrange(head, end, 3))
+    return u','.join(groups) + text[end:]
+
+
+@bundle.filter
+def intword(value):
+    """Convert a large integer to words, e.g. 1200000 to '1.2 million'."""
+    
+    value = int(value)
+    if value < 1000000:
+        return value
+    for limit, divisor, message in INTWORD_UNITS:
+        if value < limit:
+            new_value = value / divisor
+            # The plural form depends on the value, so this can't be cached.
+            return ungettext(message, message, new_value) % {
+                'value': new_value}
+    return value
+
+
+@bundle.filter
+def apnumber(value):
+    """Spell out the numbers 1 to 9, following Associated Press style."""
+    
+    try:
+        value = int(value)
+    except ValueError:
+        return value
+    if not 0 < value < 10:
+        return value
+    return words()['numbers'][value - 1]
+
+
+@bundle.filter
+def naturalday(value, arg=None):
+    
+    """
+    Describe a date as 'yesterday', 'today' or 'tomorrow', if it is one.
+    
+    Other dates are formatted with ``arg``, or ``settings.DATE_FORMAT``.
+    """
+    
+    from django.conf import settings
+    
+    try:
+        value = datetime.date(value.year, value.month, value.day)
+    except (AttributeError, ValueError):
+        # Either it wasn't a date, or it was out of range.
+        return value
+    # Only one word is needed, so it isn't worth looking up the language.
+    days = (value - datetime.date.today()).days
+    if days == 0:
+        return _(u'today')
+    elif days == 1:
+        return _(u'tomorrow')
+    elif days == -1:
+        return _(u'yesterday')
+    if arg is None:
+        arg = settings.DATE_FORMAT
+    return format_date(value, arg)
+
+
+def format_date(value, format_string):
+    
+    """
+    Format a date, like the ``date`` filter, with a cached format string.
+    
+    ``django.utils.dateformat`` splits the format string with a regex every
+    time it's used; here, the pieces are kept in ``DATE_FORMATS``.
+    """
+    
+    try:
+        pieces = DATE_FORMATS[format_string]
+    except KeyError:
+        pieces = DATE_FORMATS[format_string] = parse_date_format(
+            format_string)
+    
+    formatter, output = dateformat.DateFormat(value), []
+    try:
+        for method, text in pieces:
+            if method is None:
+                output.append(text)
+            else:
+                output.append(force_unicode(getattr(formatter, method)()))
+    except AttributeError:
+        # Like the `date` filter, for e.g. times in the format of a date.
+        return ''
+    return u''.join(output)
+
+
+def parse_date_format(format_string):
+    """Split a date format into ``(method, text)`` pairs (one is ``None``)."""
+    
+    pieces = []
+    for i, piece in enumerate(dateformat.re_formatchars.split(
+            force_unicode(format_string))):
+        if i % 2:
+            pieces.append((piece, None))
+        elif piece:
+            pieces.append((None, dateformat.re_escaped.sub(r'\1', piece)))
+    return pieces
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dedicated Django caches for template data.
+
+By default, DjanJinja stores bytecode, fragments and other template data in
+the default Django cache, alongside (and competing for space with) everything
+else. Two settings let you give them caches of their own, as Django cache
+backend URIs:
+
+``JINJA_BYTECODE_CACHE_BACKEND``
+    Used for compiled bytecode and the template dependency graph.
+``JINJA_FRAGMENT_CACHE_BACKEND``
+    Used by the ``{% cache %}`` tag and for static pages (see
+    ``djanjinja.generic.render_static()``).
+
+Settings with the same URI share a cache. For memcached URIs, no Django cache
+backend is used; instead, a ``MemcachedCache`` creates and owns the client: if
+``pylibmc`` is installed, a pool of ``JINJA_CACHE_POOL_SIZE`` (10) connections
+is shared between all threads; otherwise a ``python-memcached`` client is used,
+which keeps one connection per thread. Either way, socket operations time out
+after ``JINJA_CACHE_SOCKET_TIMEOUT`` (3) seconds.
+"""
+
+import threading
+
+
+# Maps backend URIs to the caches created for them.
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+
+class PooledClient(object):
+    
+    """
+    A memcached client which uses a connection from a pool for each call.
+    
+    The pool must behave like ``pylibmc.ClientPool``, i.e. have a
+    ``reserve()`` method returning a context manager for a client.
+    """
+    
+    def __init__(self, pool):
+        self.pool = pool
+    
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            with self.pool.reserve(block=True) as client:
+                return getattr(client, name)(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+
+class MemcachedCache(object):
+    
+    """
+    A minimal Django-style cache, owning a thread-safe memcached client.
+    
+    This provides the ``get()``, ``set()``, ``add()``, ``delete()`` and
+    ``get_many()`` methods used by DjanJinja, storing values as they are
+    given (so bytecode needn't be Base64-encoded). Timeouts of ``None`` mean
+    the ``timeout`` given in the backend URI (300 seconds by default).
+    """
+    
+    def __init__(self, servers, params=None):
+        params = params or {}
+        self.servers = servers
+        self.client = memcached_client(servers)
+        self.default_timeout = int(params.get('timeout', 300))
+    
+    def get(self, key, default=None):
+        """Fetch a key from the cache, returning ``default`` if missing."""
+        
+        value = self.client.get(smart_key(key))
+        if value is None:
+            return default
+        return value
+    
+    def get_many(self, keys):
+        """Fetch several keys from the cache in one round trip."""
+        
+        keys = dict((smart_key(key), key) for key in keys)
+        return dict((keys[key], value) for key, value
+            in self.client.get_multi(keys.keys()).iteritems())
+    
+    def set(self, key, value, timeout=None):
+        """Store a value in the cache."""
+        
+        self.client.set(smart_key(key), value, self._timeout(timeout))
+    
+    def add(self, key, value, timeout=None):
+        """Store a value only if the key isn't already in the cache."""
+        
+        return self.client.add(smart_key(key), value, self._timeout(timeout))
+    
+    def delete(self, key):
+        """Delete a key from the cache."""
+        
+        self.client.delete(smart_key(key))
+    
+    def close(self):
+        """Replace the client, dropping its connections (e.g. to fork)."""
+        
+        self.client = memcached_client(self.servers)
+    
+    def _timeout(self, timeout):
+        """Return the timeout to give the client for a given timeout."""
+        
+        if timeout is None:
+            return self.default_timeout
+        return timeout
+
+
+def smart_key(key):
+    """Return a cache key as a bytestring, as memcached clients need."""
+    
+    if isinstance(key, unicode):
+        return key.encode('utf-8')
+    return key
+
+
+def get_cache(setting):
+    
+    """
+    Return the cache selected by a setting.
+    
+    If the setting isn't set, the default Django cache is returned. For
+    memcached URIs, a ``MemcachedCache`` is returned; any other URI is given
+    to Django's ``get_cache()``.
+    """
+    
+    from django.conf import settings
+    from django.core import cache
+    
+    backend_uri = getattr(settings, setting, None)
+    if backend_uri is None:
+        return cache.cache
+    
+    selected = CACHES.get(backend_uri)
+    if selected is None:
+        CACHES_LOCK.acquire()
+        try:
+            selected = CACHES.get(backend_uri)
+            if selected is None:
+                scheme, host, params = cache.parse_backend_uri(backend_uri)
+                if scheme == 'memcached':
+                    selected = MemcachedCache(host.split(';'), params)
+                else:
+                    selected = cache.get_cache(backend_uri)
+                CACHES[backend_uri] = selected
+        finally:
+            CACHES_LOCK.release()
+    return selected
+
+
+def memcached_client(servers):
+    """Create a thread-safe memcached client for a list of servers."""
+    
+    from django.conf import settings
+    
+    size = getattr(settings, 'JINJA_CACHE_POOL_SIZE', 10)
+    timeout = getattr(settings, 'JINJA_CACHE_SOCKET_TIMEOUT', 3)
+    
+    try:
+        import pylibmc
+    except ImportError:
+        import memcache
+        # `memcache.Client` is a `threading.local`, so each thread already
+        # gets its own connections.
+        return memcache.Client(servers, socket_timeout=timeout)
+    
+    client = pylibmc.Client(servers, behaviors={
+        'connect_timeout': int(timeout * 1000),
+        'send_timeout': int(timeout * 1000000),
+        'receive_timeout': int(timeout * 1000000)})
+    return PooledClient(pylibmc.ClientPool(client, size))
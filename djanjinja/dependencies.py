@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tracking of dependencies between templates.
+
+Every DjanJinja environment has a ``dependencies`` attribute, a
+``DependencyGraph`` recording which templates each template extends, includes
+or imports. Dependencies with literal names are recorded when a template is
+compiled; any others are recorded the first time they are loaded at render
+time.
+
+The graph is used to invalidate exactly the dependents of a changed template
+(see ``Environment.invalidate()``), and, if ``JINJA_PREFETCH_DEPENDENCIES`` is
+``True``, to fetch the bytecode for a template and everything it depends on
+from the bytecode cache in one batch when it is first loaded. In the latter
+case the dependencies of each template are also persisted in the Django cache
+(under a key per template), so that new processes can prefetch templates they
+have never compiled.
+"""
+
+import hashlib
+import threading
+
+from jinja2 import nodes
+
+
+# The format of the Django cache keys under which the dependencies of each
+# template are persisted, and their timeout.
+GRAPH_CACHE_KEY_FORMAT = 'jinja_dependencies_%s'
+GRAPH_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# The nodes which cause one template to load another.
+DEPENDENCY_NODES = (nodes.Extends, nodes.Include, nodes.Import,
+    nodes.FromImport)
+
+
+class DependencyGraph(object):
+    
+    """A thread-safe, directed graph of dependencies between templates."""
+    
+    def __init__(self):
+        # Maps template names to the set of names they depend on, and vice
+        # versa.
+        self.edges = {}
+        self.reverse_edges = {}
+        self.lock = threading.Lock()
+    
+    def __contains__(self, name):
+        return name in self.edges
+    
+    def set_dependencies(self, name, dependencies):
+        """Replace the recorded dependencies of a template."""
+        
+        self.lock.acquire()
+        try:
+            for dependency in self.edges.pop(name, ()):
+                self.reverse_edges.get(dependency, set()).discard(name)
+            self.edges[name] = set()
+            for dependency in dependencies:
+                self._add(name, dependency)
+        finally:
+            self.lock.release()
+    
+    def add_dependency(self, name, dependency):
+        """Record that one template depends on another."""
+        
+        # This is called on every render, so avoid the lock where possible.
+        if dependency in self.edges.get(name, ()):
+            return
+        self.lock.acquire()
+        try:
+            self._add(name, dependency)
+        finally:
+            self.lock.release()
+    
+    def _add(self, name, dependency):
+        """Add a single edge to the graph. Requires the lock."""
+        
+        self.edges.setdefault(name, set()).add(dependency)
+        self.reverse_edges.setdefault(dependency, set()).add(name)
+    
+    def dependencies(self, name):
+        """Return the set of templates which a template directly depends on."""
+        
+        return set(self.edges.get(name, ()))
+    
+    def dependents(self, name):
+        """Return the set of templates which directly depend on a template."""
+        
+        return set(self.reverse_edges.get(name, ()))
+    
+    def closure(self, name):
+        """Return a template and everything it (transitively) depends on."""
+        
+        return self._walk(name, self.edges)
+    
+    def dependents_closure(self, name):
+        """Return a template and everything which (transitively) uses it."""
+        
+        return self._walk(name, self.reverse_edges)
+    
+    def _walk(self, name, edges):
+        """Return the set of names reachable from a name via some edges."""
+        
+        seen, pending = set([name]), [name]
+        while pending:
+            for other in list(edges.get(pending.pop(), ())):
+                if other not in seen:
+                    seen.add(other)
+                    pending.append(other)
+        return seen
+    
+    def as_dict(self):
+        """Return the graph as a dictionary mapping names to sorted lists."""
+        
+        self.lock.acquire()
+        try:
+            return dict((name, sorted(dependencies))
+                for name, dependencies in self.edges.iteritems())
+        finally:
+            self.lock.release()
+    
+    def update(self, graph):
+        """Record dependencies from a dictionary such as ``as_dict()``'s."""
+        
+        for name, dependencies in graph.iteritems():
+            self.set_dependencies(name, dependencies)
+
+
+def find_dependencies(template_ast):
+    """Find the literal names of all the templates which an AST depends on."""
+    
+    names = set()
+    for node in template_ast.find_all(DEPENDENCY_NODES):
+        # `{% include %}` may be given a list of templates to select from.
+        if isinstance(node.template, (nodes.Tuple, nodes.List)):
+            candidates = node.template.items
+        else:
+            candidates = [node.template]
+        for candidate in candidates:
+            if (isinstance(candidate, nodes.Const) and
+                    isinstance(candidate.value, basestring)):
+                names.add(candidate.value)
+    return names
+
+
+def load_graph(graph, names=None):
+    
+    """
+    Update a graph with the dependencies persisted in the Django cache.
+    
+    ``names`` are the templates whose dependencies are loaded (every template
+    found by ``djanjinja.environment.list_templates()``, by default); they are
+    fetched in one batch.
+    """
+    
+    from djanjinja import caches
+    from djanjinja.environment import list_templates
+    
+    if names is None:
+        names = list_templates()
+    keys = dict((graph_cache_key(name), name) for name in names)
+    graph_cache = caches.get_cache('JINJA_BYTECODE_CACHE_BACKEND')
+    for key, dependencies in graph_cache.get_many(keys.keys()).iteritems():
+        graph.set_dependencies(keys[key], dependencies)
+
+
+def save_dependencies(graph, name):
+    
+    """
+    Persist the dependencies of one template in the Django cache.
+    
+    Each template's dependencies are stored under a key of their own, which
+    only the process compiling that template writes, so concurrent compiles
+    of different templates never overwrite each other's edges.
+    """
+    
+    from djanjinja import caches
+    
+    caches.get_cache('JINJA_BYTECODE_CACHE_BACKEND').set(
+        graph_cache_key(name), sorted(graph.dependencies(name)),
+        GRAPH_CACHE_TIMEOUT)
+
+
+def graph_cache_key(name):
+    """Return the Django cache key for the dependencies of a template."""
+    
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return GRAPH_CACHE_KEY_FORMAT % (hashlib.sha1(name).hexdigest(),)
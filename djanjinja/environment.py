@@ -8,25 +8,154 @@ functions which help use Jinja2 from within your Django projects.
 """
 
 from functools import wraps
+import threading
+import time
+import weakref
 try:
     set
 except NameError:
     from sets import Set as set
 
+from django.template import TemplateDoesNotExist
 import jinja2
 
+from djanjinja.memo import MemoStore, RenderVars, attach_store, memoize
+from djanjinja.pool import background, wait
+
 
 TEMPLATE_ENVIRONMENT = None
 
+# A `djanjinja.freshness.SourceTracker`, if interval-based checking is enabled.
+TEMPLATE_TRACKER = None
+
+# Every live copy of an environment (see `Environment.copy()`), as keys.
+# (`weakref.WeakSet` only exists from Python 2.7.)
+ENVIRONMENT_COPIES = weakref.WeakKeyDictionary()
+
+
+class TemplateNotFound(jinja2.TemplateNotFound, TemplateDoesNotExist):
+    
+    """
+    Raised when a template could not be found.
+    
+    This is both a ``jinja2.TemplateNotFound`` (so that Jinja2 can fall back
+    to other templates in ``select_template()`` and ``{% include %}``) and a
+    ``django.template.TemplateDoesNotExist``.
+    """
+
+
+class Template(jinja2.Template):
+    
+    """A template whose renders get a memo store, profiling and fragments."""
+    
+    def render(self, *args, **kwargs):
+        """Render the template, profiling its queries if enabled."""
+        
+        return self.instrumented(super(Template, self).render, args, kwargs)
+    
+    def render_block(self, name, *args, **kwargs):
+        """Render a single block of the template (see `djanjinja.blocks`)."""
+        
+        from djanjinja import blocks
+        
+        return self.instrumented(
+            lambda *args, **kwargs: blocks.render_block(self, name, *args,
+                **kwargs),
+            args, kwargs)
+    
+    def instrumented(self, render, args, kwargs):
+        """Call a render function, profiling its queries if enabled."""
+        
+        from djanjinja import profiling
+        
+        profile = profiling.start(self)
+        if profile is None:
+            return self.render_fragments(render, args, kwargs)
+        try:
+            return self.render_fragments(render, args, kwargs)
+        finally:
+            profiling.stop(self, profile)
+    
+    def render_fragments(self, render, args, kwargs):
+        """Call a render function, splicing in any parallel fragments."""
+        
+        if not getattr(self.environment, 'parallel_fragments', False):
+            return render(*args, **kwargs)
+        
+        from djanjinja.extensions.cache import PENDING, PendingFragments
+        
+        previous = (getattr(PENDING, 'fragments', None),
+            getattr(PENDING, 'suspended', None))
+        pending = PENDING.fragments = PendingFragments()
+        PENDING.suspended = []
+        try:
+            output = render(*args, **kwargs)
+        finally:
+            PENDING.fragments, PENDING.suspended = previous
+        return pending.splice(output)
+    
+    def new_context(self, vars=None, shared=False, locals=None):
+        """Create a new context, with a fresh store unless it is shared."""
+        
+        if shared:
+            store = getattr(vars, 'memo_store', None) or MemoStore()
+        else:
+            # Build the variables as Jinja2 would, but as `RenderVars`.
+            vars, store = RenderVars(self.globals, **(vars or {})), MemoStore()
+        context = super(Template, self).new_context(vars=vars, shared=True,
+            locals=locals)
+        attach_store(context, store)
+        return context
+
 
 class Environment(jinja2.Environment):
     
     """An environment with decorators for filters, functions and tests."""
     
+    template_class = Template
+    
+    # The language whose translations are inlined into templates compiled by
+    # this environment (see `for_language()`).
+    language = None
+    
     def __init__(self, *args, **kwargs):
         super(Environment, self).__init__(*args, **kwargs)
         # Add a `set()` attribute which stores the loaded bundles.
         self.loaded_bundles = set()
+        # If true, templates are loaded from per-language variants of this
+        # environment, according to the active Django language.
+        self.i18n_variants = False
+        self.variants = {}
+        # The graph of dependencies between templates (see
+        # `djanjinja.dependencies`), and whether to use it for prefetching.
+        from djanjinja.dependencies import DependencyGraph
+        self.dependencies = DependencyGraph()
+        self.prefetch_dependencies = False
+        # A `jinja2.utils.LRUCache` of the names of templates which could not
+        # be found, if negative lookups are being cached.
+        self.missing_templates = None
+        # A `threading.local()` holding each thread's own dictionary of
+        # templates, if enabled, and the generation of the cache it reflects.
+        self.thread_cache = None
+        self.cache_generation = 0
+        self.reset_compile_locks()
+    
+    def reset_compile_locks(self):
+        """Give this environment its own set of per-template compile locks."""
+        
+        # Maps template names to a `(lock, waiters)` pair, for as long as any
+        # thread is loading the template (see `_load_template()`).
+        self.compile_locks = {}
+        self.compile_locks_lock = threading.Lock()
+    
+    def overlay(self, *args, **kwargs):
+        """Create an overlay, with its own per-thread and compile state."""
+        
+        overlay = super(Environment, self).overlay(*args, **kwargs)
+        if self.thread_cache is not None:
+            overlay.thread_cache = threading.local()
+        overlay.reset_compile_locks()
+        return overlay
     
     def load(self, app_label, bundle_name, reload=False):
         """Load the specified bundle into this environment."""
@@ -43,18 +172,272 @@ class Environment(jinja2.Environment):
         copy = self.overlay()
         for attr in ['loaded_bundles', 'globals', 'filters', 'tests']:
             setattr(copy, attr, getattr(self, attr).copy())
+        copy.variants = {}
+        ENVIRONMENT_COPIES[copy] = True
         
         return copy
     
+    def for_language(self, language):
+        
+        """
+        Return the variant of this environment for the given language.
+        
+        Variants are overlays which share everything with this environment
+        except for the template cache; templates they compile have the
+        translations of literal strings inlined (see ``djanjinja.i18n``), and
+        their bytecode is cached under language-qualified keys.
+        """
+        
+        variant = self.variants.get(language)
+        if variant is None:
+            from djanjinja.bccache import VariantBytecodeCache
+            
+            bytecode_cache = self.bytecode_cache
+            if bytecode_cache is not None:
+                bytecode_cache = VariantBytecodeCache(bytecode_cache, language)
+            # Give the variant a fresh cache of the same size as ours.
+            if self.cache is None:
+                cache_size = 0
+            else:
+                cache_size = getattr(self.cache, 'capacity', -1)
+            
+            variant = self.overlay(cache_size=cache_size,
+                bytecode_cache=bytecode_cache)
+            variant.language = language
+            variant.i18n_variants = False
+            variant.variants = {}
+            variant = self.variants.setdefault(language, variant)
+        return variant
+    
+    def _parse(self, source, name, filename):
+        
+        """
+        Parse a template, recording its dependencies and transforming it.
+        
+        Any extensions with a ``transform(template_ast, name)`` method are
+        given the chance to transform the parsed template (in priority order),
+        after which translations are inlined for language variants.
+        """
+        
+        from djanjinja import dependencies
+        
+        template_ast = super(Environment, self)._parse(source, name, filename)
+        if name is not None:
+            self.dependencies.set_dependencies(name,
+                dependencies.find_dependencies(template_ast))
+        for extension in self.iter_extensions():
+            if hasattr(extension, 'transform'):
+                template_ast = extension.transform(template_ast, name)
+        # Transformations (e.g. inlined includes) may record dependencies too.
+        if name is not None and self.prefetch_dependencies:
+            dependencies.save_dependencies(self.dependencies, name)
+        # New-style gettext handles variable expansion and escaping itself, so
+        # its calls can't be replaced with a simple constant.
+        if self.language is not None and not getattr(
+                self, 'newstyle_gettext', False):
+            from djanjinja import i18n
+            template_ast = i18n.inline_translations(template_ast, self.language)
+        return template_ast
+    
+    def _load_template(self, name, globals):
+        
+        """
+        Load a template, from the active language's variant if enabled.
+        
+        When several threads miss the same template at once, only the first
+        loads (and compiles) it; the others wait for it to finish, and then
+        take the template from the cache.
+        
+        If the per-thread cache is enabled (see ``thread_templates()``),
+        templates are looked up there before the shared cache.
+        """
+        
+        if self.missing_templates is not None and self.is_missing(name):
+            raise TemplateNotFound(name)
+        if self.i18n_variants:
+            from django.utils import translation
+            return self.for_language(translation.get_language())._load_template(
+                name, globals)
+        if self.cache is None:
+            return self._load_uncached_template(name, globals)
+        
+        templates = self.thread_templates()
+        if templates is not None:
+            template = templates.get(name)
+            if template is not None and (
+                    not self.auto_reload or template.is_up_to_date):
+                return template
+        
+        template = self.cache.get(name)
+        if template is None or (
+                self.auto_reload and not template.is_up_to_date):
+            lock = self.acquire_compile_lock(name)
+            try:
+                # Jinja2 checks the cache again, which will find the template
+                # if another thread loaded it while we were waiting.
+                template = self._load_uncached_template(name, globals)
+            finally:
+                self.release_compile_lock(name, lock)
+        
+        if templates is not None:
+            # Don't hold on to more templates than the shared cache would.
+            if len(templates) >= getattr(self.cache, 'capacity', 0) > 0:
+                templates.clear()
+            templates[name] = template
+        return template
+    
+    def _load_uncached_template(self, name, globals):
+        """Load a template which was not found in the cache."""
+        
+        if (self.prefetch_dependencies and self.cache is not None and
+                name not in self.cache):
+            self.prefetch(name)
+        try:
+            return super(Environment, self)._load_template(name, globals)
+        except jinja2.TemplateNotFound:
+            if self.missing_templates is not None:
+                self.missing_templates[name] = (current_generation(),
+                    time.time())
+            raise
+    
+    def thread_templates(self):
+        
+        """
+        Return the current thread's dictionary of templates, if enabled.
+        
+        Each thread keeps its own mapping of names to templates taken from the
+        shared cache, so that repeated lookups don't have to go through the
+        shared ``LRUCache`` (which reorders its queue on every hit). The
+        mappings are discarded whenever templates are invalidated, which
+        increments ``cache_generation``.
+        """
+        
+        local = self.thread_cache
+        if local is None:
+            return None
+        if getattr(local, 'generation', None) != self.cache_generation:
+            local.templates = {}
+            local.generation = self.cache_generation
+        return local.templates
+    
+    def acquire_compile_lock(self, name):
+        """Acquire (and return) the lock for loading a template."""
+        
+        self.compile_locks_lock.acquire()
+        try:
+            lock, waiters = self.compile_locks.get(name, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self.compile_locks[name] = (lock, waiters + 1)
+        finally:
+            self.compile_locks_lock.release()
+        lock.acquire()
+        return lock
+    
+    def release_compile_lock(self, name, lock):
+        """Release the lock for loading a template, discarding it if unused."""
+        
+        lock.release()
+        self.compile_locks_lock.acquire()
+        try:
+            waiters = self.compile_locks[name][1]
+            if waiters == 1:
+                del self.compile_locks[name]
+            else:
+                self.compile_locks[name] = (lock, waiters - 1)
+        finally:
+            self.compile_locks_lock.release()
+    
+    def is_missing(self, name):
+        
+        """
+        Return whether a template is known to be missing.
+        
+        Templates are remembered as missing until the template tracker (if
+        there is one; see ``djanjinja.freshness``) notices that any template
+        has changed, or for at most one of its checking intervals.
+        """
+        
+        entry = self.missing_templates.get(name)
+        if entry is None:
+            return False
+        generation, timestamp = entry
+        if TEMPLATE_TRACKER is not None and (
+                generation != TEMPLATE_TRACKER.generation or
+                time.time() - timestamp >= TEMPLATE_TRACKER.interval):
+            return False
+        return True
+    
+    def get_template(self, name, parent=None, globals=None):
+        """Load a template, recording any dependency on a parent template."""
+        
+        # Templates pass their own name as `parent` when extending, including
+        # or importing other templates.
+        if parent is not None and not isinstance(name, jinja2.Template):
+            name = self.join_path(name, parent)
+            self.dependencies.add_dependency(parent, name)
+            parent = None
+        return super(Environment, self).get_template(name, parent=parent,
+            globals=globals)
+    
+    def prefetch(self, name):
+        
+        """
+        Prefetch the bytecode for a template and everything it depends on.
+        
+        The names of the dependencies are taken from the dependency graph, and
+        those which are not already in this environment's cache are fetched
+        from the bytecode cache in one batch (if it supports doing so).
+        """
+        
+        bytecode_cache = self.bytecode_cache
+        if not hasattr(bytecode_cache, 'prefetch'):
+            return
+        # Our loader passes the template name as the filename, too.
+        keys = [bytecode_cache.get_cache_key(other, other)
+            for other in self.dependencies.closure(name)
+            if other not in self.cache]
+        if keys:
+            bytecode_cache.prefetch(keys)
+    
+    def invalidate(self, name):
+        
+        """
+        Remove a template and everything which depends on it from the cache.
+        
+        This applies to the caches of this environment and its language
+        variants, and returns the set of template names invalidated.
+        """
+        
+        names = self.dependencies.dependents_closure(name)
+        for environment in [self] + self.variants.values():
+            if environment.cache is not None:
+                for other in names:
+                    try:
+                        del environment.cache[other]
+                    except KeyError:
+                        pass
+            # Only after the shared cache no longer has the old templates can
+            # the per-thread caches be discarded.
+            environment.cache_generation += 1
+        if self.missing_templates is not None:
+            try:
+                del self.missing_templates[name]
+            except KeyError:
+                pass
+        return names
+    
     # pylint: disable-msg=C0111
-    def adder(attribute, wrapper, name, docstring):
+    def adder(attribute, wrapper, name, docstring, filters=None):
         
         """
         Generate decorator methods for adding filters, functions and tests.
         
         Note that this function is not a method; it is deleted before the end
         of the class definition and is only used to generate the decorator
-        methods. It helps to remove a lot of boilerplate.
+        methods. It helps to remove a lot of boilerplate. ``filters`` maps the
+        names of any filters which the added functions need to be useful to
+        the filters themselves; these are added alongside the first of them.
         """
         
         def adder_(self, function, name=None):
@@ -63,6 +446,8 @@ class Environment(jinja2.Environment):
             key = name or function.__name__
             value = wrapper and wrapper(function) or function
             getattr(self, attribute)[key] = value
+            for filter_name, filter_function in (filters or {}).iteritems():
+                self.filters.setdefault(filter_name, filter_function)
             return function
         
         def decorator(self, *args, **kwargs):
@@ -106,11 +491,102 @@ class Environment(jinja2.Environment):
     ctxfunction = adder('globals', jinja2.contextfunction, 'ctxfunction',
         'Decorate a function as a global context function.')
     
+    ## Memoized
+    
+    memofunction = adder('globals', memoize, 'memofunction',
+        'Decorate a function as a global function memoized per render.')
+    
+    ## Asynchronous
+    # These return `djanjinja.pool.Job`s, to be resolved with the `wait`
+    # filter, which is only added along with them.
+    
+    asyncfilter = adder('filters', background, 'asyncfilter',
+        'Decorate a function as a filter run in the background.',
+        {'wait': wait})
+    
+    asyncfunction = adder('globals', background, 'asyncfunction',
+        'Decorate a function as a global function run in the background.',
+        {'wait': wait})
+    
     # Clean up the namespace. Also, without this, `type` will try to convert
     # `adder()` into a method. Which it most certainly is not.
     del adder
 
 
+class TemplateLoader(jinja2.FunctionLoader):
+    
+    """
+    A ``jinja2.FunctionLoader`` which understands inlined templates.
+    
+    If templates are compiled with other templates inlined into them (see
+    ``djanjinja.extensions.inline``), their bytecode depends on the sources of
+    those other templates too. When using the bytecode cache, this loader
+    checksums the sources of a template's dependencies along with its own. If
+    they aren't known yet (e.g. in a freshly-started process), the template is
+    parsed to find them, which is still much cheaper than compiling it.
+    
+    If the bytecode cache hands out compilation leases (see
+    ``djanjinja.bccache.DjangoBytecodeCache``), a process which misses the
+    cache only compiles the template if it gets the lease; otherwise it waits
+    for the holder of the lease to store the bytecode.
+    """
+    
+    def load(self, environment, name, globals=None):
+        """Load a template, via the bytecode cache if possible."""
+        
+        if globals is None:
+            globals = {}
+        source, filename, uptodate = self.get_source(environment, name)
+        
+        from djanjinja import bccache
+        
+        code, bucket, leased = None, None, False
+        bytecode_cache = environment.bytecode_cache
+        if bytecode_cache is not None:
+            bucket = bytecode_cache.get_bucket(environment, name, filename,
+                self.checksum_source(environment, name, source, filename))
+            code = bucket.code
+            if code is None:
+                leased = bccache.acquire_lease(bytecode_cache, bucket.key)
+                if not leased:
+                    bccache.wait_for_bucket(bytecode_cache, bucket)
+                    code = bucket.code
+        
+        try:
+            if code is None:
+                code = environment.compile(source, name, filename)
+                if bytecode_cache is not None:
+                    bucket.code = code
+                    bytecode_cache.set_bucket(bucket)
+        finally:
+            if leased:
+                bccache.release_lease(bytecode_cache, bucket.key)
+        
+        return environment.template_class.from_code(
+            environment, code, globals, uptodate)
+    
+    def checksum_source(self, environment, name, source, filename=None):
+        """Return the source to checksum for a template."""
+        
+        from django.template import TemplateDoesNotExist
+        
+        if not getattr(environment, 'inline_includes', False):
+            return source
+        if name not in environment.dependencies:
+            # Parsing records the dependencies, including inlined templates.
+            environment.parse(source, name, filename)
+        
+        sources = [source]
+        for other in sorted(environment.dependencies.closure(name)):
+            if other == name:
+                continue
+            try:
+                sources.append(self.get_source(environment, other)[0])
+            except (jinja2.TemplateNotFound, TemplateDoesNotExist):
+                sources.append(u'')
+        return u'\0'.join(sources)
+
+
 def get_template_source(name):
     
     """
@@ -125,16 +601,92 @@ def get_template_source(name):
     from django.template import loader
     # `loader.find_template_source()` returns a 2-tuple of the source and a
     # `LoaderOrigin` object. 
-    source = loader.find_template_source(name)[0]
+    try:
+        source = loader.find_template_source(name)[0]
+    except TemplateDoesNotExist:
+        # Jinja2 only knows about its own exception.
+        raise TemplateNotFound(name)
     
     # `jinja2.FunctionLoader` expects a triple of the source of the template,
     # the name used to load it, and a 0-ary callable which will return whether
-    # or not the template needs to be reloaded. The callable will only ever be
-    # called if auto-reload is on. In this case, we'll just assume that the
-    # template does need to be reloaded.
+    # or not the template is up-to-date. The callable will only ever be
+    # called if auto-reload is on. If a tracker has been set up, it will check
+    # the source periodically; otherwise, we'll just assume that the template
+    # does need to be reloaded.
+    if TEMPLATE_TRACKER is not None:
+        return (source, name, TEMPLATE_TRACKER.loaded(name, source))
     return (source, name, lambda: False)
 
 
+def current_generation():
+    """Return the template tracker's current generation (or ``0``)."""
+    
+    if TEMPLATE_TRACKER is None:
+        return 0
+    return TEMPLATE_TRACKER.generation
+
+
+def get_template_dirs():
+    """Return the directories searched by the configured Django loaders."""
+    
+    from django.conf import settings
+    
+    template_dirs = list(getattr(settings, 'TEMPLATE_DIRS', ()))
+    loaders = getattr(settings, 'TEMPLATE_LOADERS', ())
+    if [loader for loader in loaders if 'app_directories' in loader]:
+        from django.template.loaders.app_directories import app_template_dirs
+        template_dirs.extend(app_template_dirs)
+    return template_dirs
+
+
+def list_templates():
+    
+    """
+    List the names of all the templates available to the environment.
+    
+    Django template loaders have no way of listing the templates they can
+    load, so this walks the directories searched by the filesystem and app
+    directories loaders. Templates from any other loaders will not be listed.
+    """
+    
+    import os
+    
+    names = set()
+    for template_dir in get_template_dirs():
+        for dirpath, dirnames, filenames in os.walk(template_dir):
+            # Skip hidden directories (e.g. those used by version control).
+            dirnames[:] = [name for name in dirnames
+                if not name.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                names.add(os.path.relpath(path, template_dir).replace(
+                    os.path.sep, '/'))
+    return sorted(names)
+
+
+def compile_variant(environment):
+    
+    """
+    Return a name for the settings which change how templates are compiled.
+    
+    Extensions whose output depends on settings declare them with a
+    ``bytecode_variant()`` method, returning a string (or ``None`` if they
+    compile templates as they would be compiled without the extension). The
+    result is ``None`` if no extension declares a variant.
+    """
+    
+    variants = []
+    for identifier in sorted(environment.extensions):
+        extension = environment.extensions[identifier]
+        if hasattr(extension, 'bytecode_variant'):
+            variant = extension.bytecode_variant()
+            if variant:
+                variants.append(variant)
+    return variants and '+'.join(variants) or None
+
+
 def bootstrap():
     """Load the TEMPLATE_ENVIRONMENT global variable."""
     
@@ -156,17 +708,55 @@ def bootstrap():
     autoescape = getattr(settings, 'JINJA_AUTOESCAPE', False)
     if autoescape:
         default_extensions.add('jinja2.ext.autoescape')
+    if getattr(settings, 'JINJA_MINIFY', False):
+        default_extensions.add(
+            'djanjinja.extensions.minify.MinifyExtension')
     
     extensions = list(set(getattr(settings, 'JINJA_EXTENSIONS', [])).union(default_extensions))
     
-    # Set up global `TEMPLATE_ENVIRONMENT` variable.
-    global TEMPLATE_ENVIRONMENT
+    # Set up global `TEMPLATE_ENVIRONMENT` and `TEMPLATE_TRACKER` variables.
+    global TEMPLATE_ENVIRONMENT, TEMPLATE_TRACKER
     
+    auto_reload = getattr(settings, 'DEBUG', True)
+    check_interval = getattr(settings, 'JINJA_TEMPLATE_CHECK_INTERVAL', None)
+    if check_interval is not None:
+        from djanjinja.freshness import SourceTracker
+        TEMPLATE_TRACKER = SourceTracker(check_interval,
+            watch=getattr(settings, 'JINJA_TEMPLATE_WATCHER', False))
+        auto_reload = True
+    
+    # Jinja2 keeps 50 templates by default; `-1` keeps every template loaded.
     TEMPLATE_ENVIRONMENT = Environment(
-        loader=jinja2.FunctionLoader(get_template_source),
-        auto_reload=getattr(settings, 'DEBUG', True), autoescape=autoescape,
+        loader=TemplateLoader(get_template_source),
+        auto_reload=auto_reload, autoescape=autoescape,
+        cache_size=getattr(settings, 'JINJA_CACHE_SIZE', 50),
         bytecode_cache=bytecode_cache, extensions=extensions)
     
+    # Templates compiled with different settings (e.g. with minification on
+    # and off) mustn't share bytecode, in case of a mixed deploy.
+    variant = compile_variant(TEMPLATE_ENVIRONMENT)
+    if bytecode_cache is not None and variant is not None:
+        TEMPLATE_ENVIRONMENT.bytecode_cache = bccache.VariantBytecodeCache(
+            bytecode_cache, variant)
+    
+    if getattr(settings, 'JINJA_THREAD_CACHE', False):
+        TEMPLATE_ENVIRONMENT.thread_cache = threading.local()
+    
+    TEMPLATE_ENVIRONMENT.parallel_fragments = getattr(settings,
+        'JINJA_PARALLEL_FRAGMENTS', False)
+    
+    if not auto_reload or TEMPLATE_TRACKER is not None:
+        # Lookups of missing templates can be cached, since new templates
+        # will either need a restart or be noticed by the tracker.
+        from jinja2.utils import LRUCache
+        TEMPLATE_ENVIRONMENT.missing_templates = LRUCache(
+            getattr(settings, 'JINJA_MISSING_TEMPLATES_SIZE', 1000))
+    
+    if TEMPLATE_TRACKER is not None:
+        # Changed templates are reloaded by Jinja2 itself, but anything which
+        # depends on them (e.g. by inlining them) needs to be reloaded too.
+        TEMPLATE_TRACKER.listeners.append(TEMPLATE_ENVIRONMENT.invalidate)
+    
     if getattr(settings, 'USE_I18N', False):
         # The `django.utils.translation` module behaves like a singleton of
         # `gettext.GNUTranslations`, since it exports all the necessary
@@ -174,11 +764,24 @@ def bootstrap():
         from django.utils import translation
         # pylint: disable-msg=E1101
         TEMPLATE_ENVIRONMENT.install_gettext_translations(translation)
+        TEMPLATE_ENVIRONMENT.i18n_variants = getattr(
+            settings, 'JINJA_I18N_VARIANTS', False)
+    
+    if getattr(settings, 'JINJA_PREFETCH_DEPENDENCIES', False):
+        from djanjinja import dependencies
+        TEMPLATE_ENVIRONMENT.prefetch_dependencies = True
+        dependencies.load_graph(TEMPLATE_ENVIRONMENT.dependencies)
     
     bundles = getattr(settings, 'DJANJINJA_BUNDLES', [])
     for bundle_specifier in bundles:
         app_label, bundle_name = bundle_specifier.rsplit('.', 1)
         TEMPLATE_ENVIRONMENT.load(app_label, bundle_name)
+    
+    if getattr(settings, 'JINJA_CACHE_ERROR_PAGES', False):
+        # Render the error pages now, so that serving them later on doesn't
+        # involve any template loading or rendering.
+        from djanjinja import handlers
+        handlers.prerender(environment=TEMPLATE_ENVIRONMENT)
 
 
 def is_safe(function):
@@ -28,15 +28,53 @@ To generate the key, the tuple is marshalled, the SHA1 hash of the resulting
 string is taken and base64-encoded, with newlines and padding stripped, and
 this is appended to the string ``jinja_frag_``. For more information, consult
 the code (located in ``djanjinja/extensions/cache.py``).
+
+Fragments marked ``parallel`` may be rendered concurrently:
+    
+    {% cache ("article", article.id), 3600 parallel %}
+        ...
+    {% endcache %}
+
+If the environment's ``parallel_fragments`` attribute is true (see the
+``JINJA_PARALLEL_FRAGMENTS`` setting), each such fragment is looked up in the
+cache (and rendered, if it misses) on the ``'fragment'`` thread pool, and a
+placeholder is output in its place; ``Template.render()`` then waits for the fragments and
+splices them into the output, in document order. The values of the variables
+used in a parallel fragment are passed to it when the tag is reached, so it
+sees exactly what it would have if rendered in place; since the ``loop``
+variable of an enclosing ``{% for %}`` can't be captured like this, parallel
+fragments may not use it.
+
+A placeholder only survives if it's written straight to the template's output,
+so everything rendered by a ``{% filter %}``, ``{% macro %}`` or ``{% call %}``
+block (whose output may be transformed), including any templates it includes,
+renders its fragments in place, as do ``self.<block>()`` and ``super()`` calls
+whose output isn't printed directly. This is arranged when the template is
+compiled. Each placeholder carries a random token chosen for its render, so
+template data can't forge one.
 """
 
 import hashlib
 import marshal
+import os
+import re
+import threading
 
-from jinja2 import nodes
+from jinja2 import Markup, nodes
 from jinja2.ext import Extension
 
 
+# Holds the `PendingFragments` of the render in progress in each thread.
+PENDING = threading.local()
+
+# Placeholders hold a token chosen for each render, and a job index.
+PLACEHOLDER_FORMAT = u'\x00fragment:%s:%d\x00'
+PLACEHOLDER_RE_FORMAT = ur'\x00fragment:%s:(\d+)\x00'
+
+# The nodes whose output may be transformed before it reaches the template's.
+CAPTURING_NODES = (nodes.FilterBlock, nodes.Macro, nodes.CallBlock)
+
+
 class CacheExtension(Extension):
     
     """Fragment caching using the Django cache system."""
@@ -44,11 +82,23 @@ class CacheExtension(Extension):
     tags = set(['cache'])
     cache_key_format = 'jinja_frag_%(hash)s'
     
+    # Run after other transformations (e.g. inlining includes).
+    priority = 150
+    
     def __init__(self, environment):
         super(CacheExtension, self).__init__(environment)
         
-        # Extend the environment with the default cache key prefix.
-        environment.extend(cache_key_format=self.cache_key_format)
+        # Extend the environment with the default cache key prefix, and
+        # render parallel fragments in place until told otherwise.
+        environment.extend(cache_key_format=self.cache_key_format,
+            parallel_fragments=False)
+    
+    def bytecode_variant(self):
+        """Qualify bytecode cache keys while fragments are being recorded."""
+        
+        if recording():
+            return 'record'
+        return None
         
     def parse(self, parser):
         """Parse a fragment cache block in a Jinja2 template."""
@@ -66,24 +116,118 @@ class CacheExtension(Extension):
             args.append(parser.parse_expression())
         else:
             args.append(nodes.Const(None))
+        parallel = parser.stream.skip_if('name:parallel')
         # Here, we parse up to {% endcache %} and drop the needle, which will
         # be the `endcache` tag itself.
         body = parser.parse_statements(['name:endcache'], drop_needle=True)
         
+        # If fragments are being recorded (see `djanjinja.fragments`), also
+        # pass in the template name and the line number. Recorded and parallel
+        # fragments get the values of the variables used in the fragment.
+        kwargs, caller_args = [], []
+        if recording():
+            kwargs.append(nodes.Keyword('template_name',
+                nodes.Const(parser.name)))
+            kwargs.append(nodes.Keyword('lineno', nodes.Const(lineno)))
+        if parallel:
+            if uses_enclosing_loop(body):
+                parser.fail("Parallel cache blocks can't use the 'loop' "
+                    "variable of an enclosing loop.", lineno)
+            kwargs.append(nodes.Keyword('parallel', nodes.Const(True)))
+        if kwargs:
+            names = sorted(input_names(body))
+            kwargs.append(nodes.Keyword('inputs', nodes.Dict([
+                nodes.Pair(nodes.Const(name), nodes.Name(name, 'load'))
+                for name in names])))
+            # The body of a parallel fragment takes its variables as
+            # arguments, rather than looking them up when it's rendered.
+            if parallel:
+                caller_args = [nodes.Name(name, 'param') for name in names]
+        
         # Now return a `CallBlock` node which calls the `_cache` method on the
         # extension.
         return nodes.CallBlock(
-            self.call_method('_cache', args), [], [], body
+            self.call_method('_cache', args, kwargs), caller_args, [], body
         ).set_lineno(lineno)
     
-    def _cache(self, parameters, timeout, caller):
+    def transform(self, template_ast, name):
+        
+        """
+        Render fragments in place wherever their output may be transformed.
+        
+        The bodies of capturing blocks are bracketed by calls which suspend
+        parallel rendering, and block references whose output isn't printed
+        directly are called with it suspended.
+        """
+        
+        printed = set()
+        for output in template_ast.find_all(nodes.Output):
+            printed.update(id(node) for node in output.nodes)
+        
+        for node in list(template_ast.find_all(CAPTURING_NODES)):
+            if not (isinstance(node, nodes.CallBlock) and self.owns(node)):
+                node.body = ([self.output_call('_suspend', node.lineno)] +
+                    node.body + [self.output_call('_resume', node.lineno)])
+        for node in list(template_ast.find_all(nodes.Call)):
+            if is_block_reference(node) and id(node) not in printed:
+                node.args = [node.node] + node.args
+                node.node = self.attr('_call_serially', lineno=node.lineno)
+                node.node.set_environment(self.environment)
+        return template_ast
+    
+    def output_call(self, name, lineno):
+        """Return a node outputting a call to a method of this extension."""
+        
+        return nodes.Output([self.call_method(name, lineno=lineno)],
+            lineno=lineno).set_environment(self.environment)
+    
+    def owns(self, call_block):
+        """Return whether a call block is one of this extension's."""
+        
+        call = call_block.call
+        return (isinstance(call, nodes.Call) and
+            isinstance(call.node, nodes.ExtensionAttribute) and
+            call.node.identifier == self.identifier)
+    
+    def _suspend(self):
+        """Render parallel fragments in place until ``_resume()``."""
+        
+        suspended = getattr(PENDING, 'suspended', None)
+        if suspended is not None:
+            suspended.append(PENDING.fragments)
+            PENDING.fragments = None
+        return u''
+    
+    def _resume(self):
+        """Resume the rendering suspended by ``_suspend()``."""
+        
+        suspended = getattr(PENDING, 'suspended', None)
+        if suspended:
+            PENDING.fragments = suspended.pop()
+        return u''
+    
+    def _call_serially(self, function, *args, **kwargs):
+        """Call a function, rendering any parallel fragments in place."""
+        
+        self._suspend()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._resume()
+    
+    def _cache(self, parameters, timeout, template_name=None, lineno=None,
+            parallel=False, inputs=None, caller=None):
         """Helper method for fragment caching."""
         
+        if parallel:
+            caller = bind(caller, inputs)
+        
         # This is lazily loaded so that it can be set up without Django. If
         # you try to use it without Django, it will just render the fragment
         # as usual.
         try:
-            from django.core import cache
+            from djanjinja import caches, fragments
+            fragment_cache = caches.get_cache('JINJA_FRAGMENT_CACHE_BACKEND')
         except ImportError:
             # `caller()` will render whatever is between {% cache %} and
             # {% endcache %}.
@@ -91,15 +235,64 @@ class CacheExtension(Extension):
         
         key = self._generate_key(parameters)
         
+        if lineno is not None:
+            fragments.get_log().record(key, template_name, lineno, parameters,
+                timeout, dict((name, value)
+                    for name, value in inputs.iteritems()
+                    if name not in self.environment.globals))
+        
+        # A parallel fragment is looked up (and if need be, rendered) on the
+        # pool, so its lookup overlaps with the rest of the render.
+        pending = getattr(PENDING, 'fragments', None)
+        if pending is not None and parallel:
+            return pending.submit(self._render_fragment, fragment_cache, key,
+                caller, timeout)
+        
         # If the fragment is cached, return it. Otherwise, render it, set the
         # key in the cache, and return it.
-        retrieved_value = cache.cache.get(key)
+        retrieved_value = fragment_cache.get(key)
         if retrieved_value is not None:
             return retrieved_value
         
         value = caller()
-        cache.cache.set(key, value, timeout)
+        # Any parallel fragments inside this one must be spliced in before it
+        # is cached.
+        if pending is not None:
+            value = pending.splice(value)
+        self._cache_set(key, value, timeout)
         return value
+    
+    def _render_fragment(self, fragment_cache, key, caller, timeout):
+        """Fetch (or render and cache) a parallel fragment on a worker."""
+        
+        value = fragment_cache.get(key)
+        if value is None:
+            value = caller()
+            self._cache_set(key, value, timeout)
+        return value
+    
+    def _cache_set(self, key, value, timeout):
+        
+        """
+        Store a rendered fragment in the Django cache.
+        
+        If ``JINJA_ASYNC_FRAGMENT_CACHE`` is ``True``, the fragment is stored
+        on the ``'background'`` pool (see ``djanjinja.pool``), so that the
+        render doesn't wait for the cache. Returns the ``Job`` in that case.
+        This only covers writes: a fragment rendered in place has to be looked
+        up before the render can carry on, so only parallel fragments are
+        looked up off the rendering thread.
+        """
+        
+        from django.conf import settings
+        from djanjinja import caches
+        
+        fragment_cache = caches.get_cache('JINJA_FRAGMENT_CACHE_BACKEND')
+        if getattr(settings, 'JINJA_ASYNC_FRAGMENT_CACHE', False):
+            from djanjinja.pool import get_pool
+            return get_pool('background').submit(fragment_cache.set, key,
+                value, timeout)
+        fragment_cache.set(key, value, timeout)
         
     def _generate_key(self, parameters):
         """Generate a cache key from some parameters (maybe a sequence)."""
@@ -113,4 +306,89 @@ class CacheExtension(Extension):
             .encode('base64')
             .rstrip('\r\n='))
         
-        return self.environment.cache_key_format % {'hash': digest}
\ No newline at end of file
+        return self.environment.cache_key_format % {'hash': digest}
+
+
+def recording():
+    """Return whether fragment keys are being recorded."""
+    
+    try:
+        from django.conf import settings
+        return getattr(settings, 'JINJA_RECORD_FRAGMENTS', False)
+    except ImportError:
+        return False
+
+
+def input_names(body):
+    """Return the names of the variables used (but not set) in some nodes."""
+    
+    loaded, stored = set(), set()
+    for node in body:
+        for name in node.find_all(nodes.Name):
+            if name.ctx == 'store':
+                stored.add(name.name)
+            else:
+                loaded.add(name.name)
+    return loaded - stored - set(['loop', 'caller'])
+
+
+def uses_enclosing_loop(body):
+    """Return whether some nodes use the ``loop`` of an enclosing loop."""
+    
+    for node in body:
+        if isinstance(node, nodes.Name) and node.name == 'loop':
+            return True
+        if isinstance(node, nodes.For):
+            # A loop's own body (and filter) refers to its own `loop`.
+            children = [node.target, node.iter] + node.else_
+        else:
+            children = node.iter_child_nodes()
+        if uses_enclosing_loop(children):
+            return True
+    return False
+
+
+def is_block_reference(call):
+    """Return whether a call renders a block (``self.<name>()``, ``super()``)."""
+    
+    function = call.node
+    if isinstance(function, nodes.Name):
+        return function.name == 'super'
+    return (isinstance(function, nodes.Getattr) and
+        isinstance(function.node, nodes.Name) and function.node.name == 'self')
+
+
+def bind(caller, inputs):
+    """Bind the body of a parallel fragment to the values of its variables."""
+    
+    return lambda: caller(**inputs)
+
+
+class PendingFragments(object):
+    
+    """The parallel fragments being rendered for a single render."""
+    
+    def __init__(self):
+        self.jobs = []
+        self.token = os.urandom(8).encode('hex')
+        self.placeholder_re = re.compile(PLACEHOLDER_RE_FORMAT % (
+            self.token,))
+    
+    def submit(self, function, *args):
+        """Run a function on the fragment pool, and return a placeholder."""
+        
+        from djanjinja.pool import get_pool
+        
+        self.jobs.append(get_pool('fragment').submit(function, *args))
+        return Markup(PLACEHOLDER_FORMAT % (self.token, len(self.jobs) - 1))
+    
+    def splice(self, output):
+        """Replace the placeholders in some output with their fragments."""
+        
+        if not self.jobs or u'\x00' not in output:
+            return output
+        spliced = self.placeholder_re.sub(
+            lambda match: self.jobs[int(match.group(1))].get(), output)
+        if isinstance(output, Markup):
+            return Markup(spliced)
+        return spliced
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compile-time inlining of included templates.
+
+Each ``{% include %}`` normally costs a template lookup, a new context and a
+separate call to the included template's render function, every time the
+including template is rendered. With this extension loaded (add
+``'djanjinja.extensions.inline.InlineIncludeExtension'`` to
+``JINJA_EXTENSIONS``), includes are instead compiled directly into the
+including template, inside a scope of their own, wherever this can be done
+without changing their behaviour. That is, for includes which:
+
+* name a single template with a string literal,
+* are not marked ``ignore missing`` or ``without context``, and
+* include a template which does not extend another, define blocks or refer
+  to ``self``.
+
+Everything else is left to be included at render time, as usual. Line numbers
+in tracebacks from inlined templates refer to the included template's source,
+but the name of the including template.
+
+Because the bytecode for a template then depends on the sources of the
+templates inlined into it, every template inlined (directly or through other
+inlined templates) is recorded as a dependency of the including template, and
+``djanjinja.environment.TemplateLoader`` includes their sources in its
+bytecode cache checksums. ``Environment.invalidate()`` should be used to
+recompile the dependents of a changed template.
+"""
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.parser import Parser
+from jinja2.visitor import NodeTransformer
+
+from djanjinja.dependencies import find_dependencies
+
+
+class InlineIncludeExtension(Extension):
+    
+    """Inline static ``{% include %}``s into the including template."""
+    
+    def __init__(self, environment):
+        super(InlineIncludeExtension, self).__init__(environment)
+        environment.inline_includes = True
+    
+    def transform(self, template_ast, name):
+        """Inline the includes in a freshly-parsed template."""
+        
+        inliner = IncludeInliner(self.environment, [name])
+        template_ast = inliner.visit(template_ast)
+        if name is not None:
+            # The bytecode depends on every template inlined into this one,
+            # not just on those it includes directly.
+            for inlined in inliner.inlined:
+                self.environment.dependencies.add_dependency(name, inlined)
+        return template_ast
+
+
+class IncludeInliner(NodeTransformer):
+    
+    """Replace ``Include`` nodes with a ``Scope`` containing the template."""
+    
+    def __init__(self, environment, stack, inlined=None):
+        self.environment = environment
+        # The names of the templates currently being inlined, innermost last.
+        # This prevents recursive includes from being inlined forever.
+        self.stack = stack
+        # The names of all the templates inlined so far, at any depth.
+        if inlined is None:
+            inlined = set()
+        self.inlined = inlined
+    
+    def visit_Include(self, node):
+        """Inline the include, if it can be."""
+        
+        if (node.ignore_missing or not node.with_context or
+                not isinstance(node.template, nodes.Const) or
+                not isinstance(node.template.value, basestring)):
+            return node
+        
+        name = self.environment.join_path(node.template.value, self.stack[-1])
+        if name in self.stack:
+            return node
+        
+        try:
+            source, filename = self.environment.loader.get_source(
+                self.environment, name)[:2]
+        # pylint: disable-msg=W0703
+        except Exception:
+            # Leave it to fail (or not) at render time, as it would have.
+            return node
+        
+        # Parse the template directly, bypassing the environment's own
+        # transformations (which include this one).
+        template_ast = Parser(self.environment, source, name,
+            filename).parse()
+        if not inlinable(template_ast):
+            return node
+        
+        # Record the template's own dependencies, since it may never be
+        # compiled by itself.
+        self.environment.dependencies.set_dependencies(name,
+            find_dependencies(template_ast))
+        self.inlined.add(name)
+        template_ast = IncludeInliner(self.environment, self.stack + [name],
+            self.inlined).visit(template_ast)
+        return nodes.Scope(template_ast.body, lineno=node.lineno,
+            environment=self.environment)
+
+
+def inlinable(template_ast):
+    """Return whether a template's AST can be inlined into another's."""
+    
+    if template_ast.find(nodes.Extends) or template_ast.find(nodes.Block):
+        return False
+    for name in template_ast.find_all(nodes.Name):
+        if name.name == 'self':
+            return False
+    return True
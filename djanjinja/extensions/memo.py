@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""
+A Jinja2 template tag for memoizing macro calls within a render.
+
+Add ``'djanjinja.extensions.memo.MemoExtension'`` to ``JINJA_EXTENSIONS``, and
+then call a macro (or any other function) with:
+    
+    {% memo badge(user, size=32) %}
+
+This outputs the result of the call, just like ``{{ badge(user, size=32) }}``,
+but calls with the same arguments later in the same render reuse the first
+result. See ``djanjinja.memo`` for more information.
+"""
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from djanjinja import memo
+
+
+class MemoExtension(Extension):
+    
+    """Memoize function and macro calls within each render."""
+    
+    tags = set(['memo'])
+    
+    def parse(self, parser):
+        """Parse a ``{% memo %}`` tag, which must contain a single call."""
+        
+        lineno = parser.stream.next().lineno
+        call = parser.parse_expression()
+        if not isinstance(call, nodes.Call):
+            parser.fail('memo tag requires a function or macro call', lineno)
+        
+        return nodes.Output([self.call_method('_memo',
+            [nodes.ContextReference(), call.node] + call.args, call.kwargs,
+            call.dyn_args, call.dyn_kwargs)]).set_lineno(lineno)
+    
+    def _memo(self, context, function, *args, **kwargs):
+        """Helper method for memoized calls."""
+        
+        # Macros take their caller from the call site, so can't be memoized.
+        if 'caller' in kwargs:
+            return function(*args, **kwargs)
+        return memo.get_store(context).call(function, args, kwargs, context)
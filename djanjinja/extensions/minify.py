@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compile-time minification of whitespace in HTML templates.
+
+With this extension loaded (set ``JINJA_MINIFY = True``, or add
+``'djanjinja.extensions.minify.MinifyExtension'`` to ``JINJA_EXTENSIONS``),
+each run of whitespace in the literal text of a template is collapsed to a
+single character (a newline if the run contained one, otherwise a space) when
+the template is compiled, so rendering costs nothing extra. The contents of
+``<pre>``, ``<textarea>`` and ``<script>`` elements are left alone, as is
+anything output by template expressions.
+
+Only templates whose names end with one of ``JINJA_MINIFY_EXTENSIONS``
+(``.html``, ``.htm``, ``.xhtml`` and ``.xml`` by default) are minified. The
+number of bytes saved in each template is recorded in the environment's
+``minify_savings`` dictionary.
+
+Minified bytecode is cached under keys qualified with the minified extensions
+(see ``djanjinja.environment.compile_variant()``), so it doesn't need clearing
+after turning minification on or off.
+"""
+
+import os
+import re
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+DEFAULT_MINIFY_EXTENSIONS = ('.html', '.htm', '.xhtml', '.xml')
+
+# Matches the start and end tags of elements whose content is left alone.
+RAW_TAG_RE = re.compile(r'<(/?)(pre|textarea|script)\b', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class MinifyExtension(Extension):
+    
+    """Collapse insignificant whitespace in templates as they're compiled."""
+    
+    # Run after other transformations (e.g. inlining includes).
+    priority = 200
+    
+    def __init__(self, environment):
+        from django.conf import settings
+        
+        super(MinifyExtension, self).__init__(environment)
+        environment.extend(minify_savings={})
+        self.extensions = tuple(getattr(settings, 'JINJA_MINIFY_EXTENSIONS',
+            DEFAULT_MINIFY_EXTENSIONS))
+    
+    def bytecode_variant(self):
+        """Qualify bytecode cache keys with the minified extensions."""
+        
+        return 'minify=%s' % (','.join(self.extensions),)
+    
+    def transform(self, template_ast, name):
+        """Minify the literal text of a freshly-parsed template."""
+        
+        if name is None or not name.lower().endswith(self.extensions):
+            return template_ast
+        
+        saved, raw = 0, None
+        for node in template_ast.find_all(nodes.TemplateData):
+            data, raw = minify(node.data, raw)
+            saved += len(node.data.encode('utf-8')) - len(data.encode('utf-8'))
+            node.data = data
+        self.environment.minify_savings[name] = saved
+        return template_ast
+
+
+def minify(data, raw=None):
+    
+    """
+    Collapse the whitespace in a piece of template text.
+    
+    ``raw`` is the name of the element (e.g. ``'pre'``) whose content the text
+    starts in, if any. Returns the minified text, and the name of the element
+    whose content it ends in (if any).
+    """
+    
+    pieces, position = [], 0
+    for match in RAW_TAG_RE.finditer(data):
+        closing, tag = match.group(1), match.group(2).lower()
+        if raw is None and not closing:
+            pieces.append(collapse(data[position:match.start()]))
+            position, raw = match.start(), tag
+        elif raw == tag and closing:
+            pieces.append(data[position:match.end()])
+            position, raw = match.end(), None
+    
+    if raw is None:
+        pieces.append(collapse(data[position:]))
+    else:
+        pieces.append(data[position:])
+    return u''.join(pieces), raw
+
+
+def collapse(text):
+    """Collapse each run of whitespace to a newline or a single space."""
+    
+    return WHITESPACE_RE.sub(
+        lambda match: '\n' in match.group() and u'\n' or u' ', text)
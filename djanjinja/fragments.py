@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recording and replaying of fragment cache traffic.
+
+If ``JINJA_RECORD_FRAGMENTS`` is ``True``, the ``{% cache %}`` tag records
+each fragment key it sees, along with the name of the template, the line of
+the tag, the key parameters and timeout, the variables used inside the
+fragment (its *inputs*) and the number of times the key was used. Inputs are
+recorded by their types; only plain values (strings, numbers, dates and small
+lists, tuples and dictionaries of them) are recorded themselves, since saving
+anything else (e.g. pickling a queryset) could run the very queries the cache
+is there to avoid. The records are kept in memory, and merged into the file
+named by ``JINJA_FRAGMENT_LOG`` on the ``'background'`` pool (see
+``djanjinja.pool``) at most once every ``JINJA_FRAGMENT_LOG_INTERVAL`` seconds
+(60 by default), and when the process exits.
+
+After the fragment cache has been emptied (e.g. by restarting memcached),
+``warm()`` (or ``./manage.py jinja_warm_fragments``) renders the hottest
+fragments again, filling the cache before it sees any traffic. The body of
+each fragment is compiled as a template of its own, and rendered with the
+recorded inputs as the context (or with a context produced by a factory), so
+the rest of the template, and whatever loops the fragment sits in, are not
+rendered at all. Fragments with inputs which weren't recorded are skipped,
+unless their template has a factory.
+
+Templates have to be compiled with recording on for their inputs to be
+recorded; their bytecode is cached under keys qualified with ``record`` (see
+``djanjinja.environment.compile_variant()``), so it's kept apart from that of
+templates compiled with recording off.
+"""
+
+import atexit
+import cPickle as pickle
+import datetime
+import decimal
+import os
+import threading
+import time
+
+
+# The fragment log for this process (see `get_log()`).
+FRAGMENT_LOG = None
+
+# Input values of these types are recorded as they are, as are lists, tuples
+# and dictionaries of them with at most `MAX_INPUT_SIZE` items in all.
+PLAIN_TYPES = (basestring, bool, int, long, float, type(None), datetime.date,
+    datetime.time, decimal.Decimal)
+CONTAINER_TYPES = (list, tuple, dict)
+MAX_INPUT_SIZE = 100
+
+
+class FragmentLog(object):
+    
+    """The fragment keys used in a process, and how they were rendered."""
+    
+    def __init__(self, filename=None, interval=60):
+        self.filename = filename
+        self.interval = interval
+        # Maps fragment keys to `{'template', 'lineno', 'parameters',
+        # 'timeout', 'inputs', 'input_types', 'hits'}` dictionaries, where
+        # `inputs` holds the plain inputs and `input_types` the type names of
+        # all of them.
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.flushed = time.time()
+    
+    def record(self, key, template_name, lineno, parameters, timeout,
+            inputs):
+        """Record a use of a fragment key."""
+        
+        entry = self.entries.get(key)
+        if entry is None:
+            values, types = describe(inputs)
+            entry = {'template': template_name, 'lineno': lineno,
+                'parameters': parameters, 'timeout': timeout,
+                'inputs': values, 'input_types': types, 'hits': 0}
+            self.lock.acquire()
+            try:
+                entry = self.entries.setdefault(key, entry)
+            finally:
+                self.lock.release()
+        # This is unlocked, so counts may be slightly low under contention.
+        entry['hits'] += 1
+        
+        if self.filename and time.time() - self.flushed >= self.interval:
+            from djanjinja.pool import get_pool
+            
+            # Don't let other renders start flushes while this one waits.
+            self.flushed = time.time()
+            get_pool('background').submit(self.flush)
+    
+    def flush(self):
+        """Merge the recorded entries into the log file, and forget them."""
+        
+        import fcntl
+        
+        self.lock.acquire()
+        try:
+            entries, self.entries = self.entries, {}
+            self.flushed = time.time()
+        finally:
+            self.lock.release()
+        if not (entries and self.filename):
+            return
+        
+        log_file = open(self.filename, 'a+b')
+        try:
+            fcntl.flock(log_file.fileno(), fcntl.LOCK_EX)
+            try:
+                log_file.seek(0)
+                merged = read_entries(log_file)
+                for key, entry in entries.iteritems():
+                    if key in merged:
+                        entry['hits'] += merged[key]['hits']
+                    merged[key] = entry
+                log_file.seek(0)
+                log_file.truncate()
+                pickle.dump(merged, log_file, pickle.HIGHEST_PROTOCOL)
+                log_file.flush()
+            finally:
+                fcntl.flock(log_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            log_file.close()
+
+
+def get_log():
+    """Return the fragment log for this process, creating it if necessary."""
+    
+    global FRAGMENT_LOG
+    
+    if FRAGMENT_LOG is None:
+        from django.conf import settings
+        
+        FRAGMENT_LOG = FragmentLog(
+            getattr(settings, 'JINJA_FRAGMENT_LOG', None),
+            getattr(settings, 'JINJA_FRAGMENT_LOG_INTERVAL', 60))
+        atexit.register(FRAGMENT_LOG.flush)
+    return FRAGMENT_LOG
+
+
+def read_entries(log_file):
+    """Read the entries from a fragment log file (which may be empty)."""
+    
+    try:
+        return pickle.load(log_file)
+    except EOFError:
+        return {}
+
+
+def load(filename):
+    """Load the entries from a fragment log file, if it exists."""
+    
+    if not os.path.exists(filename):
+        return {}
+    log_file = open(filename, 'rb')
+    try:
+        return read_entries(log_file)
+    finally:
+        log_file.close()
+
+
+def describe(inputs):
+    
+    """
+    Split a fragment's inputs into the values to record, and their types.
+    
+    Returns a dictionary of the plain inputs, and a dictionary mapping the
+    name of every defined input to the dotted name of its type.
+    """
+    
+    from jinja2 import Undefined
+    
+    values, types = {}, {}
+    for name, value in inputs.iteritems():
+        if isinstance(value, Undefined):
+            continue
+        types[name] = '%s.%s' % (type(value).__module__,
+            type(value).__name__)
+        if plain_size(value, MAX_INPUT_SIZE) is not None:
+            values[name] = value
+    return values, types
+
+
+def plain_size(value, limit):
+    
+    """
+    Return the number of items in a plain value, or ``None``.
+    
+    ``None`` is returned for values which aren't plain, or which have more
+    than ``limit`` items. Only the types of values are checked, so this never
+    evaluates anything lazy.
+    """
+    
+    if isinstance(value, PLAIN_TYPES):
+        return 1
+    if type(value) not in CONTAINER_TYPES:
+        return None
+    if type(value) is dict:
+        items = value.keys() + value.values()
+    else:
+        items = value
+    size = 0
+    for item in items:
+        item_size = plain_size(item, limit - size)
+        if item_size is None:
+            return None
+        size += item_size
+        if size > limit:
+            return None
+    return size
+
+
+def warm(entries, limit=None, workers=4, factories=None, environment=None):
+    
+    """
+    Render the hottest of a set of recorded fragments into the cache.
+    
+    ``entries`` is a dictionary such as that returned by ``load()``. The
+    ``limit`` entries with the most hits (or all of them) are rendered on the
+    shared ``'warm'`` pool (see ``djanjinja.pool``), which has ``workers``
+    threads unless ``JINJA_WARM_THREADS`` says otherwise, or it was already
+    created by an earlier call. ``factories`` may map template names to
+    callables which take the key parameters and recorded inputs of a
+    fragment, and return the context to render it with. Templates are
+    loaded from ``environment``, or the global environment.
+    
+    Returns a dictionary mapping each fragment key to ``True`` if it was
+    stored, ``False`` if its template no longer has a ``{% cache %}`` tag on
+    the recorded line, ``None`` if it was skipped because some of its inputs
+    weren't recorded (and there was no factory), or the exception raised.
+    """
+    
+    from djanjinja import get_env
+    from djanjinja.pool import get_pool
+    
+    if environment is None:
+        environment = get_env()
+    keys = sorted(entries, key=lambda key: entries[key]['hits'], reverse=True)
+    if limit is not None:
+        keys = keys[:limit]
+    factories = factories or {}
+    
+    pool = get_pool('warm', size=workers)
+    jobs = [(key, pool.submit(warm_fragment, key, entries[key],
+        factories.get(entries[key]['template']), environment))
+        for key in keys]
+    
+    results = {}
+    for key, job in jobs:
+        try:
+            results[key] = job.get()
+        # pylint: disable-msg=W0703
+        except Exception, exc:
+            results[key] = exc
+    return results
+
+
+def warm_fragment(key, entry, factory, environment):
+    """Render a single recorded fragment into the cache."""
+    
+    from djanjinja.extensions.cache import CacheExtension
+    
+    if factory is None:
+        # Rendering without an input would store the wrong output under the
+        # real key (e.g. `{{ user }}` would just render as nothing).
+        if set(entry.get('input_types', ())) - set(entry['inputs']):
+            return None
+        context = entry['inputs']
+    else:
+        context = factory(entry['parameters'], entry['inputs'])
+    
+    template = fragment_template(environment, entry['template'],
+        entry['lineno'])
+    if template is None:
+        return False
+    
+    extension = environment.extensions[CacheExtension.identifier]
+    extension._cache_set(key, template.render(context), entry['timeout'])
+    return True
+
+
+def fragment_template(environment, name, lineno):
+    """Compile the body of the ``{% cache %}`` tag on a line of a template."""
+    
+    from jinja2 import nodes
+    from djanjinja.extensions.cache import CacheExtension
+    
+    source, filename = environment.loader.get_source(environment, name)[:2]
+    template_ast = environment.parse(source, name, filename)
+    for block in template_ast.find_all(nodes.CallBlock):
+        method = block.call.node
+        if (block.lineno == lineno and
+                isinstance(method, nodes.ExtensionAttribute) and
+                method.identifier == CacheExtension.identifier):
+            return environment.from_string(nodes.Template(block.body,
+                lineno=1))
+    return None
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cheap checks for changes to template sources.
+
+Jinja2 can either never notice changes to templates (until the process is
+restarted), or, with ``auto_reload``, check the source of a template every
+time it is loaded. If you set ``JINJA_TEMPLATE_CHECK_INTERVAL`` to a number of
+seconds, DjanJinja will instead check each template at most once per interval.
+If you also set ``JINJA_TEMPLATE_WATCHER = True``, the checks will be made by a
+background thread (one per process), so that no template sources are fetched
+while handling requests at all.
+
+When a template is found to have changed, it and all of its dependents are
+invalidated in the environment (see ``Environment.invalidate()``), and the
+tracker's ``generation`` is incremented; other caches can compare against it
+to find out when templates have changed.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+
+class SourceTracker(object):
+    
+    """Track the sources of loaded templates, and notice when they change."""
+    
+    def __init__(self, interval, watch=False):
+        self.interval = interval
+        self.watch = watch
+        # Maps template names to the checksums of their latest known sources,
+        # and to the times they were last checked.
+        self.checksums = {}
+        self.checked = {}
+        # Incremented whenever a template is found to have changed.
+        self.generation = 0
+        # Callables to be passed the name of each changed template.
+        self.listeners = []
+        self.lock = threading.Lock()
+        # The ID of the process in which the watcher thread was started.
+        self.watcher_pid = None
+    
+    def loaded(self, name, source):
+        
+        """
+        Record a template's source as loaded, returning its `uptodate()`.
+        
+        Sources are fetched for other reasons than loading the template (e.g.
+        to inline it into another), so a fetched source which differs from the
+        latest known one is treated just as if ``check()`` had found it.
+        """
+        
+        loaded_checksum = checksum(source)
+        self.lock.acquire()
+        try:
+            changed = (name in self.checksums and
+                self.checksums[name] != loaded_checksum)
+            self.checksums[name] = loaded_checksum
+            self.checked[name] = time.time()
+            if changed:
+                self.generation += 1
+        finally:
+            self.lock.release()
+        if changed:
+            self.changed(name)
+        return lambda: self.uptodate(name, loaded_checksum)
+    
+    def uptodate(self, name, loaded_checksum):
+        """Return whether a loaded template is up-to-date, checking if due."""
+        
+        if self.watch:
+            # Threads don't survive a `fork()`, so make sure this process has
+            # its own watcher.
+            if self.watcher_pid != os.getpid():
+                self.start()
+        elif time.time() - self.checked.get(name, 0) >= self.interval:
+            self.check(name)
+        return self.checksums.get(name) == loaded_checksum
+    
+    def check(self, name):
+        """Check whether a template's source has changed."""
+        
+        from django.template import loader, TemplateDoesNotExist
+        
+        self.lock.acquire()
+        try:
+            self.checked[name] = time.time()
+        finally:
+            self.lock.release()
+        try:
+            current = checksum(loader.find_template_source(name)[0])
+        except TemplateDoesNotExist:
+            current = None
+        
+        self.lock.acquire()
+        try:
+            if current == self.checksums.get(name):
+                return
+            self.checksums[name] = current
+            self.generation += 1
+        finally:
+            self.lock.release()
+        self.changed(name)
+    
+    def changed(self, name):
+        """Tell the listeners that a template has changed."""
+        
+        for listener in self.listeners:
+            listener(name)
+    
+    def check_all(self):
+        """Check every loaded template for changes."""
+        
+        for name in list(self.checksums):
+            self.check(name)
+    
+    def start(self):
+        """Start a thread which checks every template once per interval."""
+        
+        self.lock.acquire()
+        try:
+            if self.watcher_pid == os.getpid():
+                return
+            self.watcher_pid = os.getpid()
+        finally:
+            self.lock.release()
+        
+        thread = threading.Thread(target=self.run, name='djanjinja-watcher')
+        thread.setDaemon(True)
+        thread.start()
+    
+    def run(self):
+        """Check every template once per interval, forever."""
+        
+        while True:
+            time.sleep(self.interval)
+            self.check_all()
+
+
+def checksum(source):
+    """Return a checksum for a template source (which may be unicode)."""
+    
+    if isinstance(source, unicode):
+        source = source.encode('utf-8')
+    return hashlib.sha1(source).hexdigest()
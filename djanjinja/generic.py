@@ -8,12 +8,39 @@ may house some more useful generic views, which have been made to use Jinja2
 instead of Django's built-in template language.
 """
 
+import hashlib
 import mimetypes
 
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.encoding import smart_str
+from jinja2 import TemplateNotFound
+from jinja2.utils import LRUCache
+
+from djanjinja import get_env
 from djanjinja.middleware import RequestContextMiddleware
 from djanjinja.views import DEFAULT_CONTENT_TYPE
 
 
+# Holds rendered static pages when they are not being stored in the Django
+# cache. The size is the number of template/parameter combinations kept.
+STATIC_PAGES = LRUCache(getattr(settings, 'JINJA_STATIC_PAGES_SIZE', 1000))
+
+STATIC_PAGE_KEY_FORMAT = 'jinja_static_%(hash)s'
+
+# Maps template names to their inferred mimetypes.
+MIMETYPES = {}
+
+
+def guess_mimetype(template):
+    """Infer (and memoize) the mimetype for a given template name."""
+    
+    if template not in MIMETYPES:
+        MIMETYPES[template] = (mimetypes.guess_type(template)[0] or
+            DEFAULT_CONTENT_TYPE)
+    return MIMETYPES[template]
+
+
 def direct_to_template(request, template=None, extra_context=None,
     mimetype=None, *args, **kwargs):
     
@@ -24,26 +51,182 @@ def direct_to_template(request, template=None, extra_context=None,
     ``django.views.generic.simple.direct_to_template`` generic view. This
     function exports an identical calling signature, only it uses the Jinja2
     templating system instead.
-    """
     
-    # Ensure the request has a `Context` attribute. This means the middleware
-    # does not have to be installed.
-    if not hasattr(request, 'Context'):
-        RequestContextMiddleware.process_request(request)
+    If the keyword argument ``static`` is true, the page is rendered with a
+    plain context (i.e. no context processors are run) and the result is
+    cached; see ``render_static()`` for more information.
+    """
     
-    # Build the context, optionally accepting additional context values.
-    context = request.Context(dict=(extra_context or {}))
+    # `static` is taken from the keyword arguments, so that extra positional
+    # arguments from the URLconf still end up in `params`.
+    static = kwargs.pop('static', False)
     
     # Build the `params` variable from the parameters passed into the view
     # from the URLconf.
     params = kwargs.copy()
     for i, value in enumerate(args):
         params[i] = value
-    context['params'] = params
     
     # Ensure the mimetype is sensible; if not provided, it will be inferred
     # from the name of the template. If that fails, fall back to the default.
     if not mimetype:
-        mimetype = mimetypes.guess_type(template)[0] or DEFAULT_CONTENT_TYPE
+        mimetype = guess_mimetype(template)
+    
+    if static:
+        context = (extra_context or {}).copy()
+        context['params'] = params
+        return render_static(request, template, context, mimetype=mimetype)
+    
+    # Ensure the request has a `Context` attribute. This means the middleware
+    # does not have to be installed.
+    if not hasattr(request, 'Context'):
+        RequestContextMiddleware.process_request(request)
+    
+    # Build the context, optionally accepting additional context values.
+    context = request.Context(dict=(extra_context or {}))
+    context['params'] = params
     
     return context.render_response(template, mimetype=mimetype)
+
+
+def render_static(request, template, context, mimetype=DEFAULT_CONTENT_TYPE):
+    
+    """
+    Render a template which does not depend on the request, with caching.
+    
+    The rendered page is cached per template name, mimetype and context; by
+    default it is kept in memory, but if the ``JINJA_STATIC_PAGES_BACKEND``
+    setting is ``'django'``, the Django cache is used instead (with the
+    timeout given by ``JINJA_STATIC_PAGES_TIMEOUT``). The context may only
+    hold plain data (see ``canonical()``), so that the same context always
+    gives the same key. Each cached page records a checksum of the sources of
+    the template and everything it depends on, so whenever the environment
+    reloads any of them, pages rendered from the old sources are discarded.
+    
+    Responses carry an ``ETag`` header, and conditional ``GET`` requests
+    which match it receive a '304 Not Modified' response.
+    """
+    
+    environment = get_env()
+    template_obj = environment.get_template(template)
+    checksum = source_checksum(environment, template_obj)
+    key = hashlib.sha1(repr(canonical((template, mimetype, context))))
+    key = key.hexdigest()
+    
+    page = get_static_page(key)
+    if page is None or page[0] != checksum:
+        content = smart_str(template_obj.render(context),
+            encoding=settings.DEFAULT_CHARSET)
+        page = (checksum, content, '"%s"' % hashlib.sha1(content).hexdigest())
+        set_static_page(key, page)
+    
+    etag = page[2]
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(page[1], mimetype=mimetype)
+    response['ETag'] = etag
+    return response
+
+
+def canonical(value):
+    
+    """
+    Return a canonical form of some plain data, for use in a cache key.
+    
+    Plain data are strings, numbers, dates and times, and lists, tuples and
+    dictionaries of them; dictionaries are turned into sorted lists of pairs.
+    Raises ``TypeError`` for anything else, since the ``repr()`` of other
+    objects may vary from process to process (e.g. by including an address).
+    """
+    
+    from djanjinja.fragments import PLAIN_TYPES
+    
+    if isinstance(value, PLAIN_TYPES):
+        return value
+    if isinstance(value, dict):
+        return sorted((canonical(key), canonical(item))
+            for key, item in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical(item) for item in value)
+    raise TypeError("Static pages can only be rendered with plain data, not "
+        "%r." % (type(value),))
+
+
+def etag_matches(header, etag):
+    """Return whether an ``If-None-Match`` header matches an ``ETag``."""
+    
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag in ('*', etag):
+            return True
+    return False
+
+
+def source_checksum(environment, template):
+    
+    """
+    Get the checksum of the sources of a template and its dependencies.
+    
+    The dependencies (found from ``environment.dependencies``) are loaded
+    through the environment, so any which have changed are reloaded as usual.
+    The checksum of each template's own source is stored on the template
+    object itself, so its source is only fetched again when the environment
+    loads a fresh copy of it.
+    """
+    
+    checksums, pending = {}, [template.name]
+    while pending:
+        name = pending.pop()
+        if name in checksums:
+            continue
+        try:
+            other = environment.get_template(name)
+        except TemplateNotFound:
+            checksums[name] = None
+            continue
+        checksums[name] = template_checksum(environment, other)
+        pending.extend(environment.dependencies.dependencies(name))
+    return hashlib.sha1(repr(sorted(checksums.items()))).hexdigest()
+
+
+def template_checksum(environment, template):
+    """Get (and store) the checksum of the source of one loaded template."""
+    
+    checksum = getattr(template, 'source_checksum', None)
+    if checksum is None:
+        source, filename = environment.loader.get_source(environment,
+            template.name)[:2]
+        if template.name not in environment.dependencies:
+            # Parsing records the dependencies, if the template was loaded
+            # from the bytecode cache.
+            environment.parse(source, template.name, filename)
+        checksum = hashlib.sha1(smart_str(source)).hexdigest()
+        template.source_checksum = checksum
+    return checksum
+
+
+def get_static_page(key):
+    """Fetch a ``(checksum, content, etag)`` page from the configured store."""
+    
+    if getattr(settings, 'JINJA_STATIC_PAGES_BACKEND', None) == 'django':
+        from djanjinja import caches
+        return caches.get_cache('JINJA_FRAGMENT_CACHE_BACKEND').get(
+            STATIC_PAGE_KEY_FORMAT % {'hash': key})
+    return STATIC_PAGES.get(key)
+
+
+def set_static_page(key, page):
+    """Store a ``(checksum, content, etag)`` page in the configured store."""
+    
+    if getattr(settings, 'JINJA_STATIC_PAGES_BACKEND', None) == 'django':
+        from djanjinja import caches
+        caches.get_cache('JINJA_FRAGMENT_CACHE_BACKEND').set(
+            STATIC_PAGE_KEY_FORMAT % {'hash': key},
+            page, getattr(settings, 'JINJA_STATIC_PAGES_TIMEOUT', None))
+    else:
+        STATIC_PAGES[key] = page
@@ -1,8 +1,143 @@
 # -*- coding: utf-8 -*-
 
-"""Replacement for the default Django 404/500 exception handlers."""
+"""
+Replacement for the default Django 404/500 exception handlers.
 
-from djanjinja.views import RequestContext, render_to_response
+If the ``JINJA_CACHE_ERROR_PAGES`` setting is ``True``, the error pages are
+rendered once (when the environment is bootstrapped) and served from memory
+thereafter. The 500 page is kept as a fully-rendered string; the 404 page is
+kept as a 'skeleton', split around the point where ``request_path`` is
+inserted, so that only the path needs to be substituted on each request.
+Whether the path should be escaped is worked out from how the template
+rendered a marker containing ``<``; if the template does anything else to the
+path (e.g. ``{{ request_path|lower }}``), it is rendered afresh for every 404
+instead. In this mode neither page is rendered with a ``RequestContext``, and
+any failure to render them results in a static fallback body being used
+instead.
+"""
+
+from django.conf import settings
+from django.http import HttpResponseNotFound, HttpResponseServerError
+from django.utils.encoding import smart_str
+import jinja2
+
+from djanjinja import get_env
+from djanjinja.views import (DEFAULT_CONTENT_TYPE, RequestContext,
+    render_to_response)
+
+
+# Served if the 500 template could not be rendered.
+SERVER_ERROR_FALLBACK = u'<h1>Server Error (500)</h1>'
+
+# Used (split around the request path) if the 404 template could not be
+# rendered.
+PAGE_NOT_FOUND_FALLBACK = (
+    u'<h1>Not Found</h1><p>The requested URL ', u' was not found.</p>')
+
+# Rendered in place of ``request_path`` when building a 404 skeleton. The
+# angle brackets show whether the template escaped it; it is in mixed case,
+# and longer than paths are usually truncated to, so that other filters show.
+REQUEST_PATH_MARKER = u'<%s>' % (u' '.join([u'DjanJinja request path'] * 16),)
+# Rendered in place of ``request_path`` to check a skeleton.
+CHECK_MARKER = u'<%s>' % (u' '.join([u'Check DjanJinja path'] * 16),)
+
+# Maps template names to pre-rendered, encoded 500 page bodies.
+SERVER_ERROR_PAGES = {}
+
+# Maps template names to pairs of ``(fragments, escape)``. The encoded 404 page
+# fragments should be joined with the encoded request path, which should be
+# HTML-escaped first if ``escape`` is true. If ``fragments`` is ``None``, the
+# page must be rendered for each request.
+PAGE_NOT_FOUND_SKELETONS = {}
+
+
+def cache_error_pages():
+    """Return whether pre-rendered error pages are enabled in the settings."""
+    
+    return getattr(settings, 'JINJA_CACHE_ERROR_PAGES', False)
+
+
+def prerender_server_error(template_name='500.html', environment=None):
+    """Render and store a 500 page, returning the encoded body."""
+    
+    try:
+        if environment is None:
+            environment = get_env()
+        content = environment.get_template(template_name).render()
+    # pylint: disable-msg=W0703
+    except Exception:
+        # Anything could have gone wrong here, but we're going to be serving
+        # this page when things have *already* gone wrong, so fall back to
+        # something which will definitely work.
+        content = SERVER_ERROR_FALLBACK
+    
+    SERVER_ERROR_PAGES[template_name] = smart_str(content,
+        encoding=settings.DEFAULT_CHARSET)
+    return SERVER_ERROR_PAGES[template_name]
+
+
+def prerender_page_not_found(template_name='404.html', environment=None):
+    """Render and store a 404 skeleton, returning ``(fragments, escape)``."""
+    
+    try:
+        if environment is None:
+            environment = get_env()
+        fragments, escape = split_skeleton(
+            environment.get_template(template_name))
+    # pylint: disable-msg=W0703
+    except Exception:
+        # The fallback skeleton is HTML, so the path must always be escaped.
+        fragments, escape = PAGE_NOT_FOUND_FALLBACK, True
+    
+    if fragments is not None:
+        fragments = [smart_str(fragment, encoding=settings.DEFAULT_CHARSET)
+            for fragment in fragments]
+    PAGE_NOT_FOUND_SKELETONS[template_name] = (fragments, escape)
+    return PAGE_NOT_FOUND_SKELETONS[template_name]
+
+
+def split_skeleton(template):
+    
+    """
+    Render a 404 template as a skeleton, returning ``(fragments, escape)``.
+    
+    The template is rendered with the marker as the path, and split around
+    it, as it is or HTML-escaped. The skeleton is only used if it gives
+    exactly the same page as rendering the template with a different path;
+    otherwise the template has filtered the path, or it renders differently
+    each time, so ``(None, None)`` is returned.
+    """
+    
+    content = template.render({'request_path': REQUEST_PATH_MARKER})
+    check = template.render({'request_path': CHECK_MARKER})
+    for escape in (False, True):
+        marker, check_marker = REQUEST_PATH_MARKER, CHECK_MARKER
+        if escape:
+            marker = unicode(jinja2.escape(marker))
+            check_marker = unicode(jinja2.escape(check_marker))
+        fragments = content.split(marker)
+        if check_marker.join(fragments) == check:
+            return fragments, escape
+    return None, None
+
+
+def render_page_not_found(template_name, request_path):
+    """Render a 404 page which couldn't be made into a skeleton."""
+    
+    try:
+        content = get_env().get_template(template_name).render(
+            {'request_path': request_path})
+    # pylint: disable-msg=W0703
+    except Exception:
+        content = jinja2.escape(request_path).join(PAGE_NOT_FOUND_FALLBACK)
+    return smart_str(content, encoding=settings.DEFAULT_CHARSET)
+
+
+def prerender(environment=None):
+    """Pre-render the default 404 and 500 pages for the given environment."""
+    
+    prerender_server_error(environment=environment)
+    prerender_page_not_found(environment=environment)
 
 
 def page_not_found(request, template_name='404.html'):
@@ -13,9 +148,29 @@ def page_not_found(request, template_name='404.html'):
     The default template is ``404.html``, and its context will contain
     ``request_path`` (the path of the requested URL) and any additional
     parameters provided by the registered context processors (this view uses
-    ``RequestContext``).
+    ``RequestContext``). If pre-rendered error pages are enabled, only
+    ``request_path`` is available.
     """
     
+    if cache_error_pages():
+        skeleton = PAGE_NOT_FOUND_SKELETONS.get(template_name)
+        if skeleton is None:
+            skeleton = prerender_page_not_found(template_name)
+        fragments, escape = skeleton
+        if fragments is None:
+            return HttpResponseNotFound(
+                render_page_not_found(template_name, request.path),
+                mimetype=DEFAULT_CONTENT_TYPE)
+        
+        request_path = request.path
+        if escape:
+            request_path = jinja2.escape(request_path)
+        request_path = smart_str(request_path,
+            encoding=settings.DEFAULT_CHARSET)
+        
+        return HttpResponseNotFound(request_path.join(fragments),
+            mimetype=DEFAULT_CONTENT_TYPE)
+    
     context = RequestContext(request, {'request_path': request.path})
     response = context.render_response(template_name)
     response.status_code = 404
@@ -32,4 +187,10 @@ def server_error(request, template_name='500.html'):
     raised.
     """
     
+    if cache_error_pages():
+        content = SERVER_ERROR_PAGES.get(template_name)
+        if content is None:
+            content = prerender_server_error(template_name)
+        return HttpResponseServerError(content, mimetype=DEFAULT_CONTENT_TYPE)
+    
     return render_to_response(template_name)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compile-time translation of templates.
+
+With ``USE_I18N`` on, each ``{% trans %}`` block and ``_()`` call goes through
+the Django translation machinery every time a template is rendered. If you set
+``JINJA_I18N_VARIANTS = True``, DjanJinja will instead compile a separate
+variant of each template for every active language, in which translations of
+literal strings have already been inlined as constants. Translations which
+depend on runtime values (i.e. plurals and non-literal messages) are left
+as-is.
+
+The variants are held by per-language overlays of the environment (see
+``Environment.for_language()``), each of which has its own template cache and
+stores its bytecode under language-qualified keys.
+"""
+
+from jinja2 import nodes
+from jinja2.visitor import NodeTransformer
+
+
+# The names under which a singular gettext function is installed.
+GETTEXT_NAMES = ('_', 'gettext')
+
+
+class TranslationInliner(NodeTransformer):
+    
+    """Replace ``gettext()`` calls on literal strings with their translation."""
+    
+    def __init__(self, language):
+        from django.utils.translation import trans_real
+        
+        self.language = language
+        self.translation = trans_real.translation(language)
+    
+    def visit_Call(self, node):
+        """Inline the call if it is a ``gettext()`` of a string literal."""
+        
+        node = self.generic_visit(node)
+        if (isinstance(node.node, nodes.Name) and
+                node.node.name in GETTEXT_NAMES and
+                len(node.args) == 1 and
+                isinstance(node.args[0], nodes.Const) and
+                isinstance(node.args[0].value, basestring) and
+                not (node.kwargs or node.dyn_args or node.dyn_kwargs)):
+            return nodes.Const(
+                self.translation.ugettext(node.args[0].value),
+                lineno=node.lineno, environment=node.environment)
+        return node
+
+
+def inline_translations(template_ast, language):
+    """Inline the translations for a language into a template AST."""
+    
+    return TranslationInliner(language).visit(template_ast)
@@ -31,7 +31,8 @@ class Bundle(object):
     TYPES = (
         'test',
         'filter', 'ctxfilter', 'envfilter',
-        'function', 'ctxfunction', 'envfunction'
+        'function', 'ctxfunction', 'envfunction',
+        'memofunction', 'asyncfilter', 'asyncfunction'
     )
     
     # Set these attributes now, to prevent pylint from flagging errors later.
@@ -42,11 +43,16 @@ class Bundle(object):
     function = None
     ctxfunction = None
     envfunction = None
+    memofunction = None
+    asyncfilter = None
+    asyncfunction = None
     
     def __init__(self):
         self.filters = {}
         self.globals = {}
         self.tests = {}
+        # The specifier the bundle was first loaded by, e.g. 'djanjinja.site'.
+        self.name = None
     
     def merge_into(self, environment=None):
         """Push this bundle onto the environment, returning a new env."""
@@ -116,7 +122,7 @@ def get_bundle(app_label, bundle_name):
     if hasattr(bundles, bundle_name):
         bundle = getattr(bundles, bundle_name)
         if isinstance(bundle, Bundle):
-            return bundle
+            return named(bundle, app_label, bundle_name)
     
     try:
         bundle_mod = import_module(
@@ -126,12 +132,20 @@ def get_bundle(app_label, bundle_name):
             'Could not find bundle %r in app %r' % (bundle_name, app_name))
     
     if hasattr(bundle_mod, 'bundle'):
-        return getattr(bundle_mod, 'bundle')
+        return named(getattr(bundle_mod, 'bundle'), app_label, bundle_name)
     raise ImproperlyConfigured(
         "Module '%s.bundles.%s' has no `bundle` attribute" % (
             app_name, bundle_name))
 
 
+def named(bundle, app_label, bundle_name):
+    """Give a bundle a name (unless it has one), and return it."""
+    
+    if getattr(bundle, 'name', None) is None:
+        bundle.name = '%s.%s' % (app_label, bundle_name)
+    return bundle
+
+
 def load(app_label, bundle_name, environment=None, reload=False):
     """Load a specified bundle into an/the environment."""
     
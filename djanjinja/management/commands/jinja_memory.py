@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""Print a report of the memory used by templates and DjanJinja's caches."""
+
+from django.core.management.base import NoArgsCommand
+
+
+class Command(NoArgsCommand):
+    
+    help = ("Report the memory used by compiled templates and DjanJinja's "
+        "caches in this process.")
+    
+    def handle_noargs(self, **options):
+        from djanjinja import memory
+        
+        return format_report(memory.report())
+
+
+def format_report(report):
+    """Format a report from ``djanjinja.memory.report()`` as text."""
+    
+    lines = []
+    
+    templates = report['templates']
+    for language in sorted(templates):
+        usage = templates[language]
+        lines.append('Templates%s: %d compiled, %s' % (
+            language and ' [%s]' % (language,) or '', usage['count'],
+            format_size(usage['bytes'])))
+    lines.append('Missing templates: %d' % (report['missing_templates'],))
+    
+    lines.append('Bytecode cache:')
+    for tier in report['bytecode']:
+        lines.append('  %s: %s' % (tier['type'], format_usage(tier)))
+    if not report['bytecode']:
+        lines.append('  (none)')
+    
+    lines.append('Fragment cache (%s): %s' % (report['fragments']['type'],
+        format_usage(report['fragments'])))
+    lines.append('Static pages: %s' % (format_usage(report['static_pages']),))
+    
+    lines.append('Bundles:')
+    for bundle in report['bundles']:
+        lines.append('  %s: %s' % (bundle['name'], format_counts(bundle)))
+    if not report['bundles']:
+        lines.append('  (none)')
+    
+    lines.append('Environment copies: %d' % (len(report['copies']),))
+    for i, copy in enumerate(report['copies']):
+        lines.append('  #%d: %s, %d templates' % (i + 1, format_counts(copy),
+            copy['templates']))
+    
+    return '\n'.join(lines) + '\n'
+
+
+def format_usage(usage):
+    """Format an ``{'entries', 'bytes'}`` dictionary."""
+    
+    if usage['entries'] is None:
+        return 'not held in this process'
+    return '%d entries, %s' % (usage['entries'], format_size(usage['bytes']))
+
+
+def format_counts(counts):
+    """Format a ``{'globals', 'filters', 'tests'}`` dictionary."""
+    
+    return '%(globals)d globals, %(filters)d filters, %(tests)d tests' % counts
+
+
+def format_size(size):
+    """Format a number of bytes in human-readable units."""
+    
+    if size is None:
+        return 'unknown size'
+    for unit in ('bytes', 'KB', 'MB'):
+        if size < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = 'GB'
+    if unit == 'bytes':
+        return '%d bytes' % (size,)
+    return '%.1f %s' % (size, unit)
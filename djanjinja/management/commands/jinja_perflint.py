@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""Check templates for patterns which are likely to make rendering slow."""
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    
+    help = ("Check templates for likely performance problems, exiting with "
+        "an error if any are found.")
+    args = '[template ...]'
+    
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='text',
+            choices=['text', 'json'],
+            help="The output format, 'text' or 'json' (default: text)."),
+        make_option('--ignore', dest='ignore', default='',
+            help='A comma-separated list of rules (or rule:name pairs) to '
+                'ignore.'),
+    )
+    
+    def handle(self, *names, **options):
+        import sys
+        
+        from djanjinja import perflint
+        
+        ignore = [rule.strip() for rule in options['ignore'].split(',')
+            if rule.strip()]
+        problems = perflint.lint(names=names or None, ignore=ignore)
+        
+        if options['format'] == 'json':
+            sys.stdout.write(format_json(problems))
+        else:
+            sys.stdout.write(format_text(problems))
+        if problems:
+            raise CommandError('%d performance problem(s) found.' % (
+                len(problems),))
+
+
+def format_text(problems):
+    """Format a list of problems as text, one per line."""
+    
+    return ''.join('%s:%s: %s: %s\n' % (
+        problem['filename'] or problem['template'], problem['lineno'],
+        problem['rule'], problem['message']) for problem in problems)
+
+
+def format_json(problems):
+    """Format a list of problems as a JSON document."""
+    
+    from django.utils import simplejson
+    
+    return simplejson.dumps({'problems': problems}, indent=2) + '\n'
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""Render the most-used recorded fragments into the fragment cache."""
+
+from optparse import make_option
+
+from django.core.management.base import CommandError, NoArgsCommand
+
+
+class Command(NoArgsCommand):
+    
+    help = ("Render the hottest fragments recorded in JINJA_FRAGMENT_LOG "
+        "into the fragment cache.")
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--limit', type='int', dest='limit', default=None,
+            help='The number of fragments to render (default: all).'),
+        make_option('--workers', type='int', dest='workers', default=4,
+            help='The number of fragments to render at once (default: 4).'),
+        make_option('--log', dest='log', default=None,
+            help='The fragment log file (default: JINJA_FRAGMENT_LOG).'),
+    )
+    
+    def handle_noargs(self, **options):
+        from django.conf import settings
+        
+        from djanjinja import fragments
+        
+        filename = options['log'] or getattr(settings, 'JINJA_FRAGMENT_LOG',
+            None)
+        if not filename:
+            raise CommandError('No fragment log given, and JINJA_FRAGMENT_LOG '
+                'is not set.')
+        
+        # Make sure this process's own records don't go unwarmed.
+        fragments.get_log().flush()
+        results = fragments.warm(fragments.load(filename),
+            limit=options['limit'], workers=options['workers'],
+            factories=get_factories())
+        
+        stored = len([result for result in results.values()
+            if result is True])
+        missed = len([result for result in results.values()
+            if result is False])
+        skipped = len([result for result in results.values()
+            if result is None])
+        lines = ['Warmed %d of %d fragments (%d not reached, %d skipped for '
+            'want of inputs).' % (stored, len(results), missed, skipped)]
+        for key, result in sorted(results.items()):
+            if isinstance(result, Exception):
+                lines.append('  %s: %s: %s' % (key, type(result).__name__,
+                    result))
+        return '\n'.join(lines) + '\n'
+
+
+def get_factories():
+    """Import the ``JINJA_FRAGMENT_CONTEXT_FACTORIES``, by template name."""
+    
+    from django.conf import settings
+    from django.utils.importlib import import_module
+    
+    factories = {}
+    for template_name, path in getattr(settings,
+            'JINJA_FRAGMENT_CONTEXT_FACTORIES', {}).iteritems():
+        module_name, attr = path.rsplit('.', 1)
+        factories[template_name] = getattr(import_module(module_name), attr)
+    return factories
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+Memoization of template functions and macros within a single render.
+
+Each render of a template (including everything it includes or imports) gets
+its own ``MemoStore``, which holds the results of memoized calls by their
+arguments. Functions can be memoized with the ``memofunction`` decorator of
+environments and bundles:
+    
+    @bundle.memofunction
+    def badge(user):
+        ...
+
+and macro calls with the ``{% memo %}`` tag (see
+``djanjinja.extensions.memo``). Calls with unhashable arguments are never
+memoized.
+
+The store is kept on each context's evaluation context, and on the
+``RenderVars`` dictionary which contexts made by includes and imports share,
+rather than among the context's variables, so templates can't see it.
+
+Hit and miss counts are kept both per store and, by function name, for the
+whole process; see ``stats()`` and ``reset_stats()``.
+"""
+
+from functools import wraps
+import threading
+
+from jinja2 import contextfunction
+from jinja2.runtime import Macro
+
+
+# Maps function names to `[hits, misses]` lists, for the whole process.
+STATS = {}
+STATS_LOCK = threading.Lock()
+
+
+class MemoStore(object):
+    
+    """The memoized results of function calls within a single render."""
+    
+    def __init__(self):
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def call(self, function, args, kwargs, context=None):
+        """Call a function, or return the result of an identical call."""
+        
+        try:
+            key = (function_key(function), args,
+                tuple(sorted(kwargs.iteritems())))
+            hash(key)
+        except TypeError:
+            return call_function(function, args, kwargs, context)
+        
+        try:
+            result = self.results[key]
+        except KeyError:
+            self.misses += 1
+            record(function, 1)
+            result = self.results[key] = call_function(function, args,
+                kwargs, context)
+        else:
+            self.hits += 1
+            record(function, 0)
+        return result
+
+
+class RenderVars(dict):
+    
+    """The variables of a render, carrying its memo store as an attribute."""
+    
+    memo_store = None
+
+
+def attach_store(context, store):
+    """Attach a memo store to a context, and to the variables it shares."""
+    
+    # Derived contexts (e.g. of scoped blocks) share the evaluation context.
+    context.eval_ctx.memo_store = store
+    if not isinstance(context.parent, RenderVars):
+        context.parent = RenderVars(context.parent)
+    context.parent.memo_store = store
+
+
+def get_store(context):
+    """Return the memo store for the render a context belongs to."""
+    
+    store = getattr(context.eval_ctx, 'memo_store', None)
+    if store is None:
+        # Contexts made by other template classes won't have a store yet.
+        store = getattr(context.parent, 'memo_store', None) or MemoStore()
+        attach_store(context, store)
+    return store
+
+
+def memoize(function):
+    """Wrap a function so that it is memoized within each render."""
+    
+    @contextfunction
+    @wraps(function)
+    def wrapper(context, *args, **kwargs):
+        return get_store(context).call(function, args, kwargs, context)
+    # Lets `djanjinja.perflint` tell memoized functions apart.
+    wrapper.memoized = True
+    return wrapper
+
+
+def call_function(function, args, kwargs, context):
+    """Call a function, passing the context first if it wants it."""
+    
+    if context is not None and getattr(function, 'contextfunction', False):
+        return function(context, *args, **kwargs)
+    return function(*args, **kwargs)
+
+
+def function_key(function):
+    
+    """
+    Return the key under which to memoize a function's results.
+    
+    Macros are re-created on every render (and every import), so they are
+    identified by the code object of their compiled body instead, along with
+    the values it closes over (e.g. the loop variables of a macro defined in a
+    ``{% for %}`` loop). If any of those are unhashable, the call won't be
+    memoized.
+    """
+    
+    if isinstance(function, Macro):
+        return (function._func.func_code,
+            tuple(cell_contents(cell)
+                for cell in function._func.func_closure or ()))
+    return function
+
+
+def cell_contents(cell):
+    """Return the value in a closure cell, or ``None`` if it is empty."""
+    
+    try:
+        return cell.cell_contents
+    except ValueError:
+        return None
+
+
+def function_name(function):
+    """Return the name under which to record a function's statistics."""
+    
+    if isinstance(function, Macro):
+        return function.name
+    return getattr(function, '__name__', repr(function))
+
+
+def record(function, miss):
+    """Record a hit (or a miss) for a function in the process statistics."""
+    
+    STATS_LOCK.acquire()
+    try:
+        counts = STATS.setdefault(function_name(function), [0, 0])
+        counts[miss] += 1
+    finally:
+        STATS_LOCK.release()
+
+
+def stats():
+    """Return a dictionary mapping function names to ``(hits, misses)``."""
+    
+    STATS_LOCK.acquire()
+    try:
+        return dict((name, tuple(counts))
+            for name, counts in STATS.iteritems())
+    finally:
+        STATS_LOCK.release()
+
+
+def reset_stats():
+    """Reset the process statistics."""
+    
+    STATS_LOCK.acquire()
+    try:
+        STATS.clear()
+    finally:
+        STATS_LOCK.release()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Accounting for the memory used by templates and DjanJinja's caches.
+
+``report()`` describes what the template layer is holding on to in the
+current process: the compiled templates in each environment's cache, the
+tiers of the bytecode cache, any in-process fragment and static page caches,
+and the globals, filters and tests added by each bundle and held by each copy
+of the environment. Sizes are approximate (they're based on
+``sys.getsizeof()`` and don't count shared objects twice), but cheap enough to
+compute on a live worker. The ``jinja_memory`` management command prints the
+report.
+"""
+
+import os
+import sys
+
+
+def report(environment=None):
+    
+    """
+    Return a report on the memory used by the template layer.
+    
+    The report is a dictionary with the following keys:
+    
+    ``templates``
+        A dictionary mapping ``None`` (for the environment itself) and the
+        language of each of its variants to a ``{'count', 'bytes'}``
+        dictionary describing the compiled templates in its cache.
+    ``missing_templates``
+        The number of names in the cache of missing templates.
+    ``bytecode``
+        A list of ``{'type', 'entries', 'bytes'}`` dictionaries, one for each
+        tier of the bytecode cache. Tiers outside this process (e.g.
+        memcached) have ``None`` for both numbers.
+    ``fragments``
+        A ``{'type', 'entries', 'bytes'}`` dictionary describing the cache
+        used by ``{% cache %}``, with ``None`` numbers if it isn't held in
+        this process.
+    ``static_pages``
+        A ``{'entries', 'bytes'}`` dictionary describing the in-memory cache
+        of static pages.
+    ``bundles``
+        A list of ``{'name', 'globals', 'filters', 'tests'}`` dictionaries,
+        one for each bundle loaded into the environment.
+    ``copies``
+        A list of ``{'globals', 'filters', 'tests', 'templates'}``
+        dictionaries, one for each live copy of any environment (see
+        ``Environment.copy()``).
+    """
+    
+    from djanjinja import caches, get_env
+    from djanjinja.environment import ENVIRONMENT_COPIES
+    from djanjinja.generic import STATIC_PAGES
+    
+    if environment is None:
+        environment = get_env()
+    
+    seen = set()
+    templates = {None: cache_usage(environment.cache, seen)}
+    for language, variant in environment.variants.items():
+        templates[language] = cache_usage(variant.cache, seen)
+    
+    pages = lru_values(STATIC_PAGES)
+    return {
+        'templates': templates,
+        'missing_templates': len(environment.missing_templates or ()),
+        'bytecode': bytecode_tiers(environment.bytecode_cache),
+        'fragments': django_cache_usage(
+            caches.get_cache('JINJA_FRAGMENT_CACHE_BACKEND')),
+        'static_pages': {'entries': len(pages),
+            'bytes': sum(len(page[1]) for page in pages)},
+        'bundles': sorted([dict(name=bundle.name, **namespace_counts(bundle))
+            for bundle in environment.loaded_bundles],
+            key=lambda bundle: bundle['name']),
+        'copies': [dict(templates=len(copy.cache or ()),
+            **namespace_counts(copy)) for copy in ENVIRONMENT_COPIES.keys()],
+    }
+
+
+def namespace_counts(obj):
+    """Count the globals, filters and tests of an environment or bundle."""
+    
+    return {'globals': len(obj.globals), 'filters': len(obj.filters),
+        'tests': len(obj.tests)}
+
+
+def lru_values(cache):
+    """Return the values in a ``jinja2.utils.LRUCache`` (or ``None``)."""
+    
+    if cache is None:
+        return []
+    try:
+        return cache.values()
+    except KeyError:
+        # Another thread evicted something while we were looking.
+        return []
+
+
+def cache_usage(cache, seen):
+    """Count the templates in an environment's cache, and their size."""
+    
+    templates = lru_values(cache)
+    return {'count': len(templates),
+        'bytes': sum(template_size(template, seen) for template in templates)}
+
+
+def template_size(template, seen):
+    
+    """
+    Estimate the size of a compiled template.
+    
+    This counts the template object, its render functions and their code;
+    anything in ``seen`` (a set of object IDs) has already been counted, and
+    is skipped.
+    """
+    
+    size = sizeof(template, seen) + sizeof(template.__dict__, seen)
+    for function in [template.root_render_func] + template.blocks.values():
+        size += sizeof(function, seen) + code_size(function.func_code, seen)
+    return size
+
+
+def code_size(code, seen):
+    """Estimate the size of a code object and everything in it."""
+    
+    if id(code) in seen:
+        return 0
+    size = sizeof(code, seen)
+    for attr in ('co_code', 'co_lnotab', 'co_names', 'co_varnames',
+            'co_freevars', 'co_cellvars'):
+        size += sizeof(getattr(code, attr), seen)
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            size += code_size(const, seen)
+        else:
+            size += sizeof(const, seen)
+    return size
+
+
+def sizeof(obj, seen):
+    """Return the size of an object, unless it has already been counted."""
+    
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    return sys.getsizeof(obj)
+
+
+def bytecode_tiers(bytecode_cache):
+    """Describe each tier of a bytecode cache."""
+    
+    from djanjinja.bccache import MmapBytecodeCache, VariantBytecodeCache
+    
+    tiers = []
+    while bytecode_cache is not None:
+        tier = {'type': type(bytecode_cache).__name__, 'entries': None,
+            'bytes': None}
+        tiers.append(tier)
+        if isinstance(bytecode_cache, VariantBytecodeCache):
+            bytecode_cache = bytecode_cache.cache
+        elif isinstance(bytecode_cache, MmapBytecodeCache):
+            tier['entries'] = len(bytecode_cache.index)
+            if os.path.exists(bytecode_cache.filename):
+                tier['bytes'] = os.path.getsize(bytecode_cache.filename)
+            bytecode_cache = bytecode_cache.fallback
+        else:
+            bytecode_cache = None
+    return tiers
+
+
+def django_cache_usage(django_cache):
+    """Describe a Django cache, counting its entries if held in-process."""
+    
+    from djanjinja.caches import MemcachedCache
+    
+    usage = {'type': type(django_cache).__module__.rsplit('.', 1)[-1],
+        'entries': None, 'bytes': None}
+    if isinstance(django_cache, MemcachedCache):
+        usage['type'] = 'memcached'
+        return usage
+    # The local-memory backend keeps a dictionary of pickled values.
+    entries = getattr(django_cache, '_cache', None)
+    if isinstance(entries, dict) and hasattr(django_cache, '_expire_info'):
+        values = entries.values()
+        usage['entries'] = len(values)
+        usage['bytes'] = sum(len(value) for value in values
+            if isinstance(value, basestring))
+    return usage
@@ -4,10 +4,11 @@
 djanjinja.middleware - Helpful middleware for using Jinja2 from Django.
 
 This module contains middleware which helps you use Jinja2 from within your
-views. At the moment it only contains ``RequestContextMiddleware``, but may
-expand in future.
+views: ``RequestContextMiddleware``, and ``QueryProfileMiddleware`` for
+finding the template lines which run database queries.
 """
 
+from djanjinja import profiling
 from djanjinja.views import RequestContext
 
 
@@ -32,3 +33,37 @@ class RequestContextMiddleware(object):
         """
         
         request.Context = RequestContext.with_request(request)
+
+
+class QueryProfileMiddleware(object):
+    
+    """Report the queries run by each request's templates, by line."""
+    
+    def process_request(self, request):
+        
+        """
+        Decide whether to profile the templates rendered for a request.
+        
+        If ``JINJA_PROFILE_QUERIES`` is a fraction, that fraction of requests
+        are profiled; see ``djanjinja.profiling`` for more information.
+        """
+        
+        profiling.begin_request()
+    
+    def process_response(self, request, response):
+        
+        """
+        Attach the query profile of a request to it and its response.
+        
+        The profile is stored as the ``jinja_query_profile`` attribute of the
+        request, and the slowest few template lines are listed in the
+        ``X-Jinja-Query-Profile`` header of the response.
+        """
+        
+        profile = profiling.end_request()
+        if profile is not None and profile.queries:
+            request.jinja_query_profile = profile
+            response['X-Jinja-Query-Profile'] = '; '.join(
+                profiling.format_line(line)
+                for line in profile.as_list()[:profiling.HEADER_LINES])
+        return response
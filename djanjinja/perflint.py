@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+Static checks for slow patterns in templates.
+
+``lint()`` parses templates and looks for code which is likely to be slow when
+a page is rendered; ``./manage.py jinja_perflint`` runs it over every template
+the loader can find. Each problem is reported as a dictionary with the keys:
+
+``template``, ``filename``, ``lineno``
+    Where the problem is (``filename`` is ``None`` for templates which aren't
+    in one of the template directories).
+
+``rule``
+    The kind of problem; one of those in ``RULES``.
+
+``name``
+    The name of the function, method or filter concerned, if any.
+
+``message``
+    A description of the problem.
+
+Most of the rules only apply inside the body of a ``{% for %}`` loop, and not
+inside ``{% cache %}`` blocks, since cached code runs rarely. Calls are
+recognised by the names of the functions registered by the environment's
+loaded bundles (see ``djanjinja.loader``); since templates are not executed,
+the checks are heuristics, and may need to be ignored in places.
+"""
+
+from jinja2 import nodes
+from jinja2.exceptions import TemplateSyntaxError
+from jinja2.parser import Parser
+
+from djanjinja.extensions.cache import CacheExtension
+
+
+RULES = {
+    'syntax-error': "The template could not be parsed.",
+    'url-in-loop': "url() is called in a loop; reversing URLs is slow, so "
+        "pass them in or cache the fragment.",
+    'query-in-loop': "%(name)s() is called in a loop, which probably runs a "
+        "database query each time.",
+    'dynamic-include-in-loop': "A template chosen at render time is "
+        "included in a loop, so it is looked up on each iteration.",
+    'uncached-call-in-loop': "%(name)s() is called in a loop, but isn't "
+        "memoized or inside a cache block.",
+    'length-of-queryset': "|%(name)s fetches every row of a queryset; use "
+        ".count() instead.",
+}
+
+# Queryset methods which return querysets, and those which run a query.
+# Ones which are also common on other objects (e.g. `get()`) are left out.
+QUERYSET_METHODS = frozenset(['all', 'annotate', 'dates', 'distinct',
+    'exclude', 'extra', 'filter', 'order_by', 'reverse', 'select_related',
+    'values_list'])
+QUERY_METHODS = QUERYSET_METHODS.union(['aggregate', 'count', 'exists',
+    'in_bulk', 'latest'])
+
+# Filters which force a queryset to be evaluated in full.
+LENGTH_FILTERS = frozenset(['count', 'length'])
+
+
+class PerfLinter(object):
+    
+    """Find likely performance problems in the AST of a single template."""
+    
+    def __init__(self, environment, name, filename=None):
+        self.environment = environment
+        self.name = name
+        self.filename = filename
+        self.functions = bundle_functions(environment)
+        self.problems = []
+    
+    def lint(self, template_ast):
+        """Check a template's AST, returning the list of problems found."""
+        
+        self.visit(template_ast, False, False)
+        return self.problems
+    
+    def report(self, node, rule, name=None):
+        """Record a problem with a node."""
+        
+        message = RULES[rule] % {'name': name}
+        self.problems.append({'template': self.name,
+            'filename': self.filename, 'lineno': node.lineno, 'rule': rule,
+            'name': name, 'message': message})
+    
+    def visit(self, node, in_loop, cached):
+        """Check a node and its children."""
+        
+        hot = in_loop and not cached
+        if isinstance(node, nodes.For):
+            for child in (node.target, node.iter):
+                self.visit(child, in_loop, cached)
+            # The body and filter of a loop run once for each item.
+            for child in node.body + [node.test]:
+                if child is not None:
+                    self.visit(child, True, cached)
+            for child in node.else_:
+                self.visit(child, in_loop, cached)
+            return
+        elif isinstance(node, nodes.Macro):
+            # We can't tell where macros are called from.
+            for child in node.body:
+                self.visit(child, False, False)
+            return
+        elif isinstance(node, nodes.CallBlock) and is_cache_call(node.call):
+            self.visit(node.call, in_loop, cached)
+            for child in node.body:
+                self.visit(child, in_loop, True)
+            return
+        
+        if isinstance(node, nodes.Call) and hot:
+            self.check_call(node)
+        elif isinstance(node, nodes.Include) and hot:
+            if not is_literal_name(node.template):
+                self.report(node, 'dynamic-include-in-loop')
+        elif isinstance(node, nodes.Filter):
+            if node.name in LENGTH_FILTERS and is_queryset(node.node):
+                self.report(node, 'length-of-queryset', node.name)
+        
+        for child in node.iter_child_nodes():
+            self.visit(child, in_loop, cached)
+    
+    def check_call(self, node):
+        """Check a call made in the body of a loop."""
+        
+        if isinstance(node.node, nodes.Name):
+            name = node.node.name
+            if name == 'url':
+                self.report(node, 'url-in-loop', name)
+            elif (name in self.functions and
+                    not getattr(self.functions[name], 'memoized', False)):
+                self.report(node, 'uncached-call-in-loop', name)
+        elif (isinstance(node.node, nodes.Getattr) and
+                node.node.attr in QUERY_METHODS):
+            self.report(node, 'query-in-loop', node.node.attr)
+
+
+def lint(names=None, environment=None, ignore=()):
+    
+    """
+    Check templates for likely performance problems.
+    
+    Checks the templates with the given names, or every template listed by
+    ``djanjinja.environment.list_templates()``, loading them from
+    ``environment`` (or the global environment). Problems whose rule, or
+    whose ``'rule:name'``, is in ``ignore`` are left out. Returns a list of
+    problems, sorted by template and line.
+    """
+    
+    from djanjinja import get_env
+    from djanjinja.environment import list_templates
+    
+    if environment is None:
+        environment = get_env()
+    if names is None:
+        names = list_templates()
+    
+    problems = []
+    for name in names:
+        problems.extend(problem for problem in lint_template(environment, name)
+            if problem['rule'] not in ignore and
+            '%s:%s' % (problem['rule'], problem['name']) not in ignore)
+    problems.sort(key=lambda problem: (problem['template'],
+        problem['lineno']))
+    return problems
+
+
+def lint_template(environment, name):
+    """Check a single template, returning the problems found."""
+    
+    source = environment.loader.get_source(environment, name)[0]
+    filename = template_path(name)
+    linter = PerfLinter(environment, name, filename)
+    try:
+        # Parse the template directly, bypassing the environment's own
+        # transformations (e.g. inlined includes).
+        template_ast = Parser(environment, source, name, filename).parse()
+    except TemplateSyntaxError, exc:
+        problem = {'template': name, 'filename': filename,
+            'lineno': exc.lineno, 'rule': 'syntax-error', 'name': None,
+            'message': '%s %s' % (RULES['syntax-error'], exc.message)}
+        return [problem]
+    return linter.lint(template_ast)
+
+
+def bundle_functions(environment):
+    """Map the names of the loaded bundles' global functions to them."""
+    
+    functions = {}
+    for bundle in environment.loaded_bundles:
+        for name, value in bundle.globals.iteritems():
+            if callable(value):
+                functions[name] = value
+    return functions
+
+
+def template_path(name):
+    """Return the path to the file a template is loaded from, if known."""
+    
+    import os
+    
+    from djanjinja.environment import get_template_dirs
+    
+    for template_dir in get_template_dirs():
+        path = os.path.join(template_dir, *name.split('/'))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def is_cache_call(node):
+    """Return whether a call is the call made by a ``{% cache %}`` block."""
+    
+    return (isinstance(node.node, nodes.ExtensionAttribute) and
+        node.node.identifier == CacheExtension.identifier)
+
+
+def is_literal_name(node):
+    """Return whether an include names its template(s) with literals."""
+    
+    if isinstance(node, (nodes.Tuple, nodes.List)):
+        return all(is_literal_name(item) for item in node.items)
+    return isinstance(node, nodes.Const)
+
+
+def is_queryset(node):
+    """Return whether an expression looks like it evaluates to a queryset."""
+    
+    if isinstance(node, nodes.Call):
+        return (isinstance(node.node, nodes.Getattr) and
+            node.node.attr in QUERYSET_METHODS)
+    if isinstance(node, nodes.Getattr):
+        return node.attr == 'objects' or node.attr.endswith('_set')
+    return False
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+"""
+A minimal, bounded pool of worker threads.
+
+Jobs submitted to a ``ThreadPool`` are run by a fixed number of daemon
+threads, which are started lazily (and again in each process, since threads
+don't survive a ``fork()``). The active Django language is carried over from
+the submitting thread to the job, since it is thread-local, and each worker
+closes its database connection after every job, as Django does after every
+request. A pool's queue may be bounded, in which case ``try_submit()`` lets
+the caller run a job itself when the pool is busy.
+
+Python 2 has no event loop to render templates on, so DjanJinja's asynchronous
+APIs (e.g. ``djanjinja.views.render_to_string_async()``) run work on these
+pools instead, and return ``Job`` objects, which work like futures.
+"""
+
+from functools import wraps
+import os
+import Queue
+import sys
+import threading
+import time
+
+
+# Shared pools, by name (see `get_pool()`).
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class JobTimeout(Exception):
+    """Raised when waiting for the result of a job takes too long."""
+
+
+class Job(object):
+    
+    """A function call to be run by a pool, and its eventual result."""
+    
+    def __init__(self, function, args, kwargs, language=None):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.language = language
+        self.result = None
+        self.exc_info = None
+        # When the job was started, unless it was cancelled first.
+        self.start_time = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.started = threading.Event()
+        self.finished = threading.Event()
+    
+    def cancel(self):
+        """Stop the job from running, returning whether it hadn't started."""
+        
+        self.lock.acquire()
+        try:
+            if self.start_time is None:
+                self.cancelled = True
+            return self.cancelled
+        finally:
+            self.lock.release()
+    
+    def run(self):
+        """Run the job (unless cancelled), recording its result or exception."""
+        
+        from django.utils import translation
+        
+        self.lock.acquire()
+        try:
+            if self.cancelled:
+                return
+            self.start_time = time.time()
+        finally:
+            self.lock.release()
+        self.started.set()
+        
+        if self.language is not None:
+            translation.activate(self.language)
+        try:
+            try:
+                self.result = self.function(*self.args, **self.kwargs)
+            # pylint: disable-msg=W0703
+            except Exception:
+                self.exc_info = sys.exc_info()
+        finally:
+            if self.language is not None:
+                translation.deactivate()
+            self.finished.set()
+    
+    def get(self, timeout=None, from_start=False):
+        
+        """
+        Wait for the job to finish, and return its result.
+        
+        Re-raises any exception raised by the job, and raises ``JobTimeout``
+        if it doesn't finish within ``timeout`` seconds. If ``from_start`` is
+        true, the job is given ``timeout`` seconds to start, and then
+        ``timeout`` seconds from when it started to finish, so that time spent
+        waiting in the queue doesn't count against it.
+        """
+        
+        if from_start and timeout is not None:
+            self.started.wait(timeout)
+            if not self.started.isSet():
+                raise JobTimeout(self.function)
+            timeout = max(0, self.start_time + timeout - time.time())
+        self.finished.wait(timeout)
+        if not self.finished.isSet():
+            raise JobTimeout(self.function)
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class ThreadPool(object):
+    
+    """
+    A fixed-size pool of daemon threads which run submitted jobs.
+    
+    If ``queue_size`` is given, ``try_submit()`` returns ``None`` rather than
+    leave more than that many jobs waiting for a thread.
+    """
+    
+    def __init__(self, size, name='djanjinja-worker', queue_size=0):
+        self.size = size
+        self.name = name
+        self.queue_size = queue_size
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        # The number of jobs submitted but not yet finished.
+        self.pending = 0
+        # The ID of the process in which the threads were started.
+        self.pid = None
+    
+    def submit(self, function, *args, **kwargs):
+        """Submit a function call to the pool, returning a ``Job``."""
+        
+        return self.put(function, args, kwargs)
+    
+    def try_submit(self, function, *args, **kwargs):
+        """Submit a function call, or return ``None`` if the pool is full."""
+        
+        return self.put(function, args, kwargs, block=False)
+    
+    def put(self, function, args, kwargs, block=True):
+        """Queue a ``Job`` for a call, starting the threads if necessary."""
+        
+        from django.utils import translation
+        
+        if self.pid != os.getpid():
+            self.start()
+        self.lock.acquire()
+        try:
+            if (not block and self.queue_size and
+                    self.pending >= self.size + self.queue_size):
+                return None
+            self.pending += 1
+        finally:
+            self.lock.release()
+        job = Job(function, args, kwargs, language=translation.get_language())
+        self.queue.put(job)
+        return job
+    
+    def start(self):
+        """Start the pool's threads in this process."""
+        
+        self.lock.acquire()
+        try:
+            if self.pid == os.getpid():
+                return
+            # Jobs queued before a fork have no threads left to run them.
+            self.queue = Queue.Queue()
+            self.pending = 0
+            for i in range(self.size):
+                thread = threading.Thread(target=self.work,
+                    name='%s-%d' % (self.name, i))
+                thread.setDaemon(True)
+                thread.start()
+            self.pid = os.getpid()
+        finally:
+            self.lock.release()
+    
+    def work(self):
+        """Run jobs from the queue, forever."""
+        
+        from django.db import connection
+        
+        queue = self.queue
+        while True:
+            try:
+                queue.get().run()
+            finally:
+                self.lock.acquire()
+                try:
+                    self.pending -= 1
+                finally:
+                    self.lock.release()
+                # Django's connections are thread-local, so each worker has
+                # its own; don't leave it open between jobs.
+                try:
+                    connection.close()
+                # pylint: disable-msg=W0703
+                except Exception:
+                    pass
+
+
+def get_pool(name, size=4, queue_size=0):
+    
+    """
+    Return the shared pool with a given name, creating it if necessary.
+    
+    The size of the pool is taken from the ``JINJA_<NAME>_THREADS`` setting
+    if it exists, and from ``size`` otherwise; likewise, the size of its queue
+    comes from ``JINJA_<NAME>_QUEUE_SIZE`` or ``queue_size`` (``0`` means the
+    queue is unbounded).
+    """
+    
+    pool = POOLS.get(name)
+    if pool is None:
+        from django.conf import settings
+        
+        POOLS_LOCK.acquire()
+        try:
+            pool = POOLS.get(name)
+            if pool is None:
+                size = getattr(settings,
+                    'JINJA_%s_THREADS' % (name.upper(),), size)
+                queue_size = getattr(settings,
+                    'JINJA_%s_QUEUE_SIZE' % (name.upper(),), queue_size)
+                pool = POOLS[name] = ThreadPool(size,
+                    name='djanjinja-%s' % (name,), queue_size=queue_size)
+        finally:
+            POOLS_LOCK.release()
+    return pool
+
+
+def background(function):
+    
+    """
+    Wrap a function so that calls to it run on the ``'background'`` pool.
+    
+    The wrapper returns a ``Job``; in templates, pass it through the ``wait``
+    filter to get its result. Several calls can thus be started before any of
+    their results are needed.
+    """
+    
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        return get_pool('background').submit(function, *args, **kwargs)
+    return wrapper
+
+
+def wait(value, timeout=None):
+    """Return the result of a ``Job`` (or any other value, unchanged)."""
+    
+    if isinstance(value, Job):
+        return value.get(timeout)
+    return value
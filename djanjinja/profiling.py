@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+Attribution of database queries to the template lines which run them.
+
+Lazy querysets and related-object lookups mean that many of a page's queries
+are actually run by its templates. If ``JINJA_PROFILE_QUERIES`` is ``True``,
+every render (with ``Template.render()``) records each query it runs, along
+with its time and the template name and source line which caused it; if it
+is a number between 0 and 1, only that fraction of renders (or of requests,
+with ``QueryProfileMiddleware``) are profiled. Lines are found using Jinja2's
+debug information, from the innermost template frame on the stack when the
+query was run, so queries run in included templates and macros are
+attributed to those.
+
+After each profiled render, the ``render_profiled`` signal is sent with the
+template and its ``QueryProfile``. Queries are only seen in the rendering
+thread, so parallel fragments (see ``djanjinja.extensions.cache``) are not
+profiled.
+"""
+
+import random
+import sys
+import threading
+import time
+
+from django.dispatch import Signal
+
+
+# Sent after each profiled render.
+render_profiled = Signal(providing_args=['template', 'profile'])
+
+# Holds the profile of the render in progress in each thread, and the profile
+# of the current request (see `begin_request()`).
+LOCAL = threading.local()
+
+# The number of lines listed in the `X-Jinja-Query-Profile` response header.
+HEADER_LINES = 3
+
+
+class QueryProfile(object):
+    
+    """The queries run by one or more renders, by template line."""
+    
+    def __init__(self):
+        # Maps `(template_name, lineno)` pairs to `{'template', 'lineno',
+        # 'queries', 'time', 'statements'}` dictionaries, where `statements`
+        # maps each distinct SQL statement (before parameters are filled in)
+        # to the number of times it was run.
+        self.lines = {}
+        self.queries = 0
+        self.time = 0.0
+    
+    def record(self, sql, elapsed, frame):
+        """Record a query, attributing it to a template line on the stack."""
+        
+        key = template_line(frame)
+        line = self.lines.get(key)
+        if line is None:
+            line = self.lines[key] = {'template': key[0], 'lineno': key[1],
+                'queries': 0, 'time': 0.0, 'statements': {}}
+        line['queries'] += 1
+        line['time'] += elapsed
+        line['statements'][sql] = line['statements'].get(sql, 0) + 1
+        self.queries += 1
+        self.time += elapsed
+    
+    def merge(self, other):
+        """Add the queries recorded by another profile to this one."""
+        
+        for key, other_line in other.lines.iteritems():
+            line = self.lines.setdefault(key, {'template': key[0],
+                'lineno': key[1], 'queries': 0, 'time': 0.0,
+                'statements': {}})
+            line['queries'] += other_line['queries']
+            line['time'] += other_line['time']
+            for sql, count in other_line['statements'].iteritems():
+                line['statements'][sql] = (
+                    line['statements'].get(sql, 0) + count)
+        self.queries += other.queries
+        self.time += other.time
+    
+    def as_list(self):
+        """Return the lines, slowest first."""
+        
+        return sorted(self.lines.values(),
+            key=lambda line: (-line['time'], -line['queries']))
+
+
+class ProfilingCursor(object):
+    
+    """A database cursor which records its queries in a profile."""
+    
+    def __init__(self, cursor, profile):
+        self.cursor = cursor
+        self.profile = profile
+    
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.profile.record(sql, time.time() - start, sys._getframe(1))
+    
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.profile.record(sql, time.time() - start, sys._getframe(1))
+    
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+    
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def sampled():
+    """Return whether the render about to start should be profiled."""
+    
+    from django.conf import settings
+    
+    # Requests (see `begin_request()`) are sampled as a whole.
+    if hasattr(LOCAL, 'request'):
+        return LOCAL.request is not None
+    rate = getattr(settings, 'JINJA_PROFILE_QUERIES', False)
+    if isinstance(rate, bool):
+        return rate
+    return random.random() < rate
+
+
+def start(template):
+    
+    """
+    Start profiling a render, if it should be, returning the profile.
+    
+    Returns ``None`` if the render isn't to be profiled, or if it's nested in
+    a render which already is. In that case, any queries it runs are recorded
+    (against its own lines) by the outer render's profile.
+    """
+    
+    from django.db import connection
+    
+    if getattr(LOCAL, 'profile', None) is not None or not sampled():
+        return None
+    
+    profile = LOCAL.profile = QueryProfile()
+    # Django's connections are thread-local, so this only affects queries
+    # run by the current thread. Keep any `cursor()` already set on the
+    # connection itself (e.g. by another profiler), to be restored later.
+    LOCAL.cursor = connection.__dict__.get('cursor')
+    cursor = connection.cursor
+    connection.cursor = lambda: ProfilingCursor(cursor(), profile)
+    return profile
+
+
+def stop(template, profile):
+    """Finish profiling a render started with ``start()``."""
+    
+    from django.db import connection
+    
+    if LOCAL.cursor is None:
+        del connection.cursor
+    else:
+        connection.cursor = LOCAL.cursor
+    LOCAL.profile = LOCAL.cursor = None
+    if getattr(LOCAL, 'request', None) is not None:
+        LOCAL.request.merge(profile)
+    render_profiled.send(sender=template.__class__, template=template,
+        profile=profile)
+
+
+def begin_request():
+    """Decide whether to profile the renders of the current request."""
+    
+    # Delete any earlier decision, so that this one is made afresh.
+    end_request()
+    LOCAL.request = sampled() and QueryProfile() or None
+
+
+def end_request():
+    """Return the profile of the current request (if any), and forget it."""
+    
+    profile = getattr(LOCAL, 'request', None)
+    if hasattr(LOCAL, 'request'):
+        del LOCAL.request
+    return profile
+
+
+def template_line(frame):
+    """Find the innermost template line on a stack of frames."""
+    
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            return (template.name,
+                template.get_corresponding_lineno(frame.f_lineno))
+        frame = frame.f_back
+    return (None, None)
+
+
+def format_line(line):
+    """Describe a line from ``QueryProfile.as_list()`` in a few words."""
+    
+    repeated = line['queries'] - len(line['statements'])
+    return '%s:%s: %d queries in %.3fs%s' % (
+        line['template'] or '(no template)', line['lineno'] or '-',
+        line['queries'], line['time'],
+        repeated and ' (%d repeated)' % (repeated,) or '')
+
+
+def format_report(profile):
+    """Format a profile as text, one line per template line."""
+    
+    lines = ['%d queries in %.3fs' % (profile.queries, profile.time)]
+    lines.extend('  ' + format_line(line) for line in profile.as_list())
+    return '\n'.join(lines) + '\n'
@@ -9,10 +9,12 @@ template-rendering shortcuts, and features an extended ``RequestContext``.
 """
 
 from functools import partial
+import time
 
 from django import template
 from django.conf import settings
 from django.http import HttpResponse
+from django.utils.encoding import smart_str
 
 from djanjinja import get_env
 
@@ -22,21 +24,44 @@ DEFAULT_CONTENT_TYPE = getattr(settings, 'DEFAULT_CONTENT_TYPE', 'text/html')
 
 class RequestContext(template.RequestContext):
     
-    """A ``RequestContext`` with a pre-specified request attribute."""
+    """
+    A ``RequestContext`` with a pre-specified request attribute.
+    
+    If ``JINJA_CONCURRENT_CONTEXT_PROCESSORS`` is ``True``, the context
+    processors are run concurrently instead of one after another (see
+    ``run_processors()``), and the time each took is recorded in the
+    ``processor_timings`` attribute.
+    """
     
     request = None
+    processor_timings = None
     
     def __init__(self, *args, **kwargs):
         # If the class has a `request` attribute which is not `None`, use that
         # to initialize the `RequestContext`.
         if self.request is not None:
-            super(RequestContext, self).__init__(
-                self.request, *args, **kwargs)
+            args = (self.request,) + args
+        
+        if getattr(settings, 'JINJA_CONCURRENT_CONTEXT_PROCESSORS', False):
+            self.init_concurrently(*args, **kwargs)
         else:
             # Otherwise, just act as if the normal ``RequestContext``
             # constructor was called.
             super(RequestContext, self).__init__(*args, **kwargs)
     
+    def init_concurrently(self, request, dict=None, processors=None,
+            **kwargs):
+        """Initialize the context, running the processors concurrently."""
+        
+        from django.template.context import get_standard_processors
+        
+        template.Context.__init__(self, dict, **kwargs)
+        processors = get_standard_processors() + tuple(processors or ())
+        self.processor_timings = []
+        for processor, result, elapsed in run_processors(processors, request):
+            self.update(result)
+            self.processor_timings.append((processor_name(processor), elapsed))
+    
     @classmethod
     def with_request(cls, request):
         """Return a `RequestContext` subclass for a specified request."""
@@ -56,6 +81,106 @@ class RequestContext(template.RequestContext):
         """Render a given template name to a response, using this context."""
         
         return render_to_response(filename, context=self, mimetype=mimetype)
+    
+    def render_string_async(self, filename):
+        """Start rendering a template name to a string, returning a job."""
+        
+        return render_to_string_async(filename, context=self)
+    
+    def render_response_async(self, filename, mimetype=DEFAULT_CONTENT_TYPE):
+        """Start rendering a template name to a response, returning a job."""
+        
+        return render_to_response_async(filename, context=self,
+            mimetype=mimetype)
+    
+    def render_block_string(self, filename, block_name):
+        """Render a single block of a template name, using this context."""
+        
+        return render_block(filename, block_name, context=self)
+    
+    def render_block_response(self, filename, block_name,
+            mimetype=DEFAULT_CONTENT_TYPE):
+        """Render a single block of a template name to a response."""
+        
+        return render_block_to_response(filename, block_name, context=self,
+            mimetype=mimetype)
+
+
+def timeout_default(default):
+    
+    """
+    Declare the value a context processor contributes if it times out.
+    
+    For example:
+        
+        @timeout_default({'notification_count': None})
+        def notifications(request):
+            ...
+    
+    Processors without a declared default contribute nothing on timing out.
+    """
+    
+    def decorator(processor):
+        processor.timeout_default = default
+        return processor
+    return decorator
+
+
+def run_processors(processors, request):
+    
+    """
+    Run context processors concurrently, yielding their results in order.
+    
+    The processors are run on a pool of ``JINJA_CONTEXT_PROCESSOR_THREADS``
+    threads (4 by default), and their results are yielded as
+    ``(processor, result, seconds)`` triples in the order the processors were
+    given, so that later processors still take precedence. The pool is shared
+    by every request thread, so at most ``JINJA_CONTEXT_PROCESSOR_QUEUE_SIZE``
+    processors (4 by default) wait for it; while it is that busy, processors
+    are run in the calling thread instead.
+    
+    If ``JINJA_CONTEXT_PROCESSOR_TIMEOUT`` is set, processors which haven't
+    finished that many seconds after they started are given up on; their
+    declared ``timeout_default`` (see ``timeout_default()``) is used as their
+    result, and their time is ``None``. Processors which haven't even started
+    by then are taken back from the pool, and run in the calling thread.
+    """
+    
+    from djanjinja.pool import JobTimeout, get_pool
+    
+    pool = get_pool('context_processor', queue_size=4)
+    timeout = getattr(settings, 'JINJA_CONTEXT_PROCESSOR_TIMEOUT', None)
+    jobs = [(processor, pool.try_submit(timed, processor, request))
+        for processor in processors]
+    
+    for processor, job in jobs:
+        if job is None:
+            result, elapsed = timed(processor, request)
+        else:
+            try:
+                result, elapsed = job.get(timeout, from_start=True)
+            except JobTimeout:
+                if job.cancel():
+                    result, elapsed = timed(processor, request)
+                else:
+                    result, elapsed = (
+                        getattr(processor, 'timeout_default', {}), None)
+        yield processor, result, elapsed
+
+
+def timed(function, *args):
+    """Call a function, returning its result and the time it took."""
+    
+    started = time.time()
+    result = function(*args)
+    return result, time.time() - started
+
+
+def processor_name(processor):
+    """Return the dotted name of a context processor."""
+    
+    return '%s.%s' % (getattr(processor, '__module__', None),
+        getattr(processor, '__name__', repr(processor)))
 
 
 def context_to_dict(context):
@@ -77,7 +202,13 @@ def context_to_dict(context):
 
 
 def render_to_string(filename, context=None, environment=None):
-    """Renders a given template name to a string."""
+    
+    """
+    Renders a given template name to a string.
+    
+    ``filename`` may also be a list of template names, in which case the first
+    template which exists will be used.
+    """
     
     if context is None:
         context = {}
@@ -85,19 +216,105 @@ def render_to_string(filename, context=None, environment=None):
     if environment is None:
         environment = get_env()
     
-    return environment.get_template(filename).render(
+    return environment.get_or_select_template(filename).render(
         context_to_dict(context))
 
 
 def render_to_response(filename, context=None, mimetype=DEFAULT_CONTENT_TYPE,
         environment=None):
-    """Renders a given template name to a ``django.http.HttpResponse``."""
+    """Renders a given template name (or list) to a ``HttpResponse``."""
     
     return HttpResponse(
         render_to_string(filename, context=context, environment=environment),
         mimetype=mimetype)
 
 
+def render_to_string_async(filename, context=None, environment=None):
+    
+    """
+    Start rendering a given template name (or list) to a string.
+    
+    The template is rendered on the ``'render'`` pool (see
+    ``djanjinja.pool``), and a ``djanjinja.pool.Job`` is returned; call its
+    ``get()`` method to wait for the result. This lets a view render several
+    templates at once, or do other work while a template renders.
+    """
+    
+    from djanjinja.pool import get_pool
+    
+    # Flatten the context here, rather than sharing it between threads.
+    return get_pool('render').submit(render_to_string, filename,
+        context=context_to_dict(context), environment=environment)
+
+
+def render_to_response_async(filename, context=None,
+        mimetype=DEFAULT_CONTENT_TYPE, environment=None):
+    """Start rendering a given template name (or list) to a response."""
+    
+    from djanjinja.pool import get_pool
+    
+    return get_pool('render').submit(render_to_response, filename,
+        context=context_to_dict(context), mimetype=mimetype,
+        environment=environment)
+
+
+def render_block(filename, block_name, context=None, environment=None):
+    
+    """
+    Renders a single block of a given template name (or list) to a string.
+    
+    The block is rendered as it would appear in the whole page, using the
+    most-derived definition of it in the template's inheritance chain; see
+    ``djanjinja.blocks``. This is handy for answering AJAX requests with part
+    of a page. Raises ``djanjinja.blocks.BlockNotFound`` if there is no such
+    block.
+    """
+    
+    if context is None:
+        context = {}
+    
+    if environment is None:
+        environment = get_env()
+    
+    return environment.get_or_select_template(filename).render_block(
+        block_name, context_to_dict(context))
+
+
+def render_block_to_response(filename, block_name, context=None,
+        mimetype=DEFAULT_CONTENT_TYPE, environment=None):
+    """Renders a single block of a template name (or list) to a response."""
+    
+    return HttpResponse(
+        render_block(filename, block_name, context=context,
+            environment=environment),
+        mimetype=mimetype)
+
+
+def stream_to_response(filename, context=None, mimetype=DEFAULT_CONTENT_TYPE,
+        environment=None):
+    
+    """
+    Renders a given template name (or list) to a streamed ``HttpResponse``.
+    
+    The response content is an iterator over the template's output (via
+    ``Template.generate()``), so the page is never held in memory as a whole.
+    Note that any middleware which reads ``response.content`` will defeat
+    this.
+    """
+    
+    if context is None:
+        context = {}
+    
+    if environment is None:
+        environment = get_env()
+    
+    template = environment.get_or_select_template(filename)
+    return HttpResponse(
+        (smart_str(chunk, encoding=settings.DEFAULT_CHARSET)
+            for chunk in template.generate(context_to_dict(context))),
+        mimetype=mimetype)
+
+
 def shortcuts_for_environment(environment):
     """Returns shortcuts pre-configured for a given environment."""
     
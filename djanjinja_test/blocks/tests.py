@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for rendering single blocks of templates."""
+
+from django.test import TestCase
+import jinja2
+from jinja2.exceptions import TemplateRuntimeError
+
+import djanjinja
+from djanjinja import views
+from djanjinja.blocks import BlockNotFound
+
+
+class RenderBlockTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env()
+    
+    def test_overridden_block(self):
+        self.assertEqual(views.render_block('blocks_page.txt', 'title'),
+            u'Page')
+    
+    def test_inherited_block(self):
+        self.assertEqual(
+            views.render_block('blocks_page.txt', 'footer', {'year': 2010}),
+            u'footer 2010')
+    
+    def test_super_and_definitions(self):
+        # `greeting` is set by the parent, `shout` and `who` by the child.
+        self.assertEqual(views.render_block('blocks_page.txt', 'content'),
+            u'Hello, WORLD! base content')
+    
+    def test_matches_full_render(self):
+        page = self.env.get_template('blocks_page.txt').render(year=2010)
+        for name in ('title', 'content', 'footer'):
+            self.assert_(views.render_block('blocks_page.txt', name,
+                {'year': 2010}) in page)
+    
+    def test_missing_block(self):
+        self.assertRaises(BlockNotFound, views.render_block,
+            'blocks_page.txt', 'sidebar')
+    
+    def test_resolution_is_cached(self):
+        template = self.env.get_template('blocks_page.txt')
+        template.render_block('title')
+        resolution = template.block_resolution
+        template.render_block('content')
+        self.assert_(template.block_resolution is resolution)
+        self.assertEqual(len(resolution.chain), 2)
+    
+    def test_dynamic_extends(self):
+        env = self.env.copy()
+        env.loader = jinja2.DictLoader({
+            'dynamic.txt': '{% extends parent %}{% block a %}a{% endblock %}'})
+        self.assertRaises(TemplateRuntimeError,
+            env.get_template('dynamic.txt').render_block, 'a')
+    
+    def test_response(self):
+        response = views.render_block_to_response('blocks_page.txt',
+            'content', mimetype='text/plain')
+        self.assertEqual(response.content, 'Hello, WORLD! base content')
+        self.assertEqual(response['Content-Type'], 'text/plain')
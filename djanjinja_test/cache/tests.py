@@ -2,9 +2,23 @@
 
 """Tests for views which render templates which use the caching extras."""
 
+from contextlib import contextmanager
+import os
+from StringIO import StringIO
+import sys
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core import cache
+from django.core.management import call_command
 from django.test import TestCase
 
 import djanjinja
+from djanjinja import bccache, caches, fragments, memory
+from djanjinja.bccache import MmapBytecodeCache
+from djanjinja.environment import compile_variant
+from djanjinja.extensions.cache import CacheExtension
 
 
 CACHE_GLOBAL_RESPONSE = u'value'
@@ -42,4 +56,332 @@ class CacheTest(TestCase):
         # render should be stored and the `call()` method should not be called
         # again.
         template.render({'call_state': call_state})
-        self.assertEqual(call_state.called, 1)
\ No newline at end of file
+        self.assertEqual(call_state.called, 1)
+
+
+class MmapBytecodeCacheTest(TestCase):
+    
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+    
+    def tearDown(self):
+        os.remove(self.filename)
+    
+    def environment(self):
+        env = djanjinja.get_env().copy()
+        env.bytecode_cache = MmapBytecodeCache(self.filename)
+        return env
+    
+    def test_shared(self):
+        # The first 'worker' compiles the template and stores the bytecode.
+        first = self.environment()
+        self.assertEqual(first.get_template('context.txt').render(a=1, b=2),
+            u'a = 1; b = 2')
+        self.assertEqual(len(first.bytecode_cache.index), 1)
+        
+        # The second loads it from the shared file rather than compiling.
+        second = self.environment()
+        second.compile = None
+        self.assertEqual(second.get_template('context.txt').render(a=1, b=2),
+            u'a = 1; b = 2')
+    
+    def test_checksum(self):
+        env = self.environment()
+        bucket = env.bytecode_cache.get_bucket(env, 'name', None, u'source')
+        self.assertEqual(bucket.code, None)
+        bucket.code = env.compile(u'source', 'name')
+        env.bytecode_cache.set_bucket(bucket)
+        
+        # The same source gives a hit, a different source a miss.
+        bucket = env.bytecode_cache.get_bucket(env, 'name', None, u'source')
+        self.assertNotEqual(bucket.code, None)
+        bucket = env.bytecode_cache.get_bucket(env, 'name', None, u'changed')
+        self.assertEqual(bucket.code, None)
+    
+    def test_clear(self):
+        env = self.environment()
+        env.get_template('plain.txt')
+        env.bytecode_cache.clear()
+        self.assertEqual(env.bytecode_cache.index, {})
+        self.assertEqual(os.path.getsize(self.filename),
+            len(MmapBytecodeCache.header))
+    
+    def test_incompatible_file(self):
+        stale = open(self.filename, 'wb')
+        stale.write('DJBC' + '\0' * 16 + 'records')
+        stale.close()
+        inode = os.stat(self.filename).st_ino
+        
+        # The file is replaced, so that new records can be read back.
+        first = self.environment()
+        first.get_template('plain.txt')
+        self.assertNotEqual(os.stat(self.filename).st_ino, inode)
+        self.assertEqual(open(self.filename, 'rb').read(
+            len(MmapBytecodeCache.header)), MmapBytecodeCache.header)
+        
+        second = self.environment()
+        second.compile = None
+        second.get_template('plain.txt')
+    
+    def test_clear_replaces_file(self):
+        first, second = self.environment(), self.environment()
+        first.get_template('plain.txt')
+        second.bytecode_cache.load_bytecode(
+            second.bytecode_cache.get_bucket(second, 'plain.txt', None, u''))
+        old_file = second.bytecode_cache.file
+        
+        # The file is replaced, not truncated under the other process.
+        inode = os.stat(self.filename).st_ino
+        first.bytecode_cache.clear()
+        self.assertNotEqual(os.stat(self.filename).st_ino, inode)
+        self.assertEqual(os.fstat(old_file.fileno()).st_ino, inode)
+        
+        # The other process notices, and reopens the new file.
+        first.get_template('context.txt')
+        second.bytecode_cache.lock.acquire()
+        try:
+            second.bytecode_cache._refresh()
+        finally:
+            second.bytecode_cache.lock.release()
+        self.assert_(second.bytecode_cache.file is not old_file)
+        self.assertEqual(sorted(second.bytecode_cache.index),
+            sorted(first.bytecode_cache.index))
+    
+    def test_reopen_after_fork(self):
+        bytecode_cache = self.environment().bytecode_cache
+        bytecode_cache.clear()
+        inherited = bytecode_cache.file
+        # Pretend that the file was opened by a parent process.
+        bytecode_cache.pid = -1
+        bytecode_cache.clear()
+        self.assert_(bytecode_cache.file is not inherited)
+        self.assertEqual(bytecode_cache.pid, os.getpid())
+
+
+class DedicatedCacheTest(TestCase):
+    
+    def setUp(self):
+        settings.JINJA_BYTECODE_CACHE_BACKEND = 'locmem://?max_entries=50'
+        settings.JINJA_FRAGMENT_CACHE_BACKEND = 'locmem://?max_entries=100'
+    
+    def tearDown(self):
+        del settings.JINJA_BYTECODE_CACHE_BACKEND
+        del settings.JINJA_FRAGMENT_CACHE_BACKEND
+    
+    def test_fragments(self):
+        env = djanjinja.get_env()
+        template = env.from_string(
+            '{% cache "dedicated_fragment" %}value{% endcache %}')
+        self.assertEqual(template.render(), u'value')
+        key = env.extensions[CacheExtension.identifier]._generate_key(
+            'dedicated_fragment')
+        fragment_cache = caches.get_cache('JINJA_FRAGMENT_CACHE_BACKEND')
+        self.assertEqual(fragment_cache.get(key), u'value')
+        self.assertEqual(cache.cache.get(key), None)
+    
+    def test_bytecode(self):
+        bytecode_cache = bccache.get_cache()
+        self.assertTrue(bytecode_cache.client.cache is
+            caches.get_cache('JINJA_BYTECODE_CACHE_BACKEND'))
+        self.assertFalse(bytecode_cache.client.cache is
+            caches.get_cache('JINJA_FRAGMENT_CACHE_BACKEND'))
+    
+    def test_memcached(self):
+        class Client(object):
+            def __init__(self, servers):
+                self.servers, self.data = servers, {}
+            def get(self, key):
+                return self.data.get(key, (None,))[0]
+            def get_multi(self, keys):
+                return dict((key, self.data[key][0]) for key in keys
+                    if key in self.data)
+            def set(self, key, value, timeout):
+                self.data[key] = (value, timeout)
+        
+        uri = 'memcached://10.0.0.5:11211;10.0.0.6:11211/?timeout=60'
+        settings.JINJA_BYTECODE_CACHE_BACKEND = uri
+        memcached_client = caches.memcached_client
+        caches.memcached_client = Client
+        try:
+            memcached = caches.get_cache('JINJA_BYTECODE_CACHE_BACKEND')
+            # Bytecode is stored as it is, not Base64-encoded.
+            self.assertTrue(bccache.get_cache().client is memcached)
+        finally:
+            caches.memcached_client = memcached_client
+            del caches.CACHES[uri]
+        
+        self.assertTrue(isinstance(memcached, caches.MemcachedCache))
+        self.assertEqual(memcached.client.servers,
+            ['10.0.0.5:11211', '10.0.0.6:11211'])
+        memcached.set(u'key', '\x00code')
+        memcached.set('other', 'value', 10)
+        self.assertEqual(memcached.client.data, {'key': ('\x00code', 60),
+            'other': ('value', 10)})
+        self.assertEqual(memcached.get('missing', 'default'), 'default')
+        self.assertEqual(memcached.get_many([u'key', 'missing']),
+            {u'key': '\x00code'})
+    
+    def test_pooled_client(self):
+        class Pool(object):
+            reserved = 0
+            @contextmanager
+            def reserve(self, block=False):
+                self.reserved += 1
+                yield {'key': 'value'}
+        
+        pool = Pool()
+        client = caches.PooledClient(pool)
+        self.assertEqual(client.get('key'), 'value')
+        self.assertEqual(pool.reserved, 1)
+
+
+class MemoryTest(TestCase):
+    
+    def test_report(self):
+        env = djanjinja.get_env()
+        env.get_template('plain.txt')
+        copy = env.copy()
+        copy.load('djanjinja', 'site')
+        
+        report = memory.report()
+        self.assertTrue(report['templates'][None]['count'] >= 1)
+        self.assertTrue(report['templates'][None]['bytes'] > 0)
+        self.assertEqual(report['fragments']['type'], 'locmem')
+        self.assertTrue(report['fragments']['entries'] is not None)
+        self.assertEqual(report['bytecode'][0]['type'], 'DjangoBytecodeCache')
+        self.assertTrue(dict(globals=len(copy.globals),
+            filters=len(copy.filters), tests=len(copy.tests),
+            templates=len(copy.cache)) in report['copies'])
+        
+        report = memory.report(copy)
+        self.assertTrue({'name': 'djanjinja.site', 'globals': 2,
+            'filters': 0, 'tests': 0} in report['bundles'])
+    
+    def test_command(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('jinja_memory')
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue(output.startswith('Templates: '))
+        self.assertTrue('Bytecode cache:\n  DjangoBytecodeCache: not held in '
+            'this process\n' in output)
+
+
+class FragmentRecordingTest(TestCase):
+    
+    ARTICLES = [{'id': 1, 'title': 'A'}, {'id': 2, 'title': 'B'}]
+    
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        settings.JINJA_RECORD_FRAGMENTS = True
+        settings.JINJA_FRAGMENT_LOG = self.filename
+        fragments.FRAGMENT_LOG = None
+        
+        self.env = djanjinja.get_env().copy()
+        # Make sure the template is compiled with recording on.
+        self.env.bytecode_cache = None
+        self.env.cache.clear()
+        extension = self.env.extensions[CacheExtension.identifier]
+        self.keys = [extension._generate_key(('article', 1)),
+            extension._generate_key(('article', 2)),
+            extension._generate_key('footer')]
+    
+    def tearDown(self):
+        os.remove(self.filename)
+        del settings.JINJA_RECORD_FRAGMENTS
+        del settings.JINJA_FRAGMENT_LOG
+        fragments.FRAGMENT_LOG = None
+        for key in self.keys:
+            cache.cache.delete(key)
+    
+    def render(self):
+        return self.env.get_template('cache_record.txt').render(
+            articles=self.ARTICLES, suffix='!')
+    
+    def test_bytecode_variant(self):
+        self.assertEqual(compile_variant(self.env), 'record')
+        del settings.JINJA_RECORD_FRAGMENTS
+        try:
+            self.assertEqual(compile_variant(self.env), None)
+        finally:
+            settings.JINJA_RECORD_FRAGMENTS = True
+    
+    def test_record(self):
+        self.assertEqual(self.render(), u'[A!][B!]\nfooter!')
+        self.render()
+        fragments.get_log().flush()
+        
+        entries = fragments.load(self.filename)
+        self.assertEqual(sorted(entries), sorted(self.keys))
+        self.assertEqual(entries[self.keys[0]], {
+            'template': 'cache_record.txt', 'lineno': 1,
+            'parameters': ('article', 1), 'timeout': None,
+            'inputs': {'article': self.ARTICLES[0], 'suffix': '!'},
+            'input_types': {'article': '__builtin__.dict',
+                'suffix': '__builtin__.str'},
+            'hits': 2})
+        self.assertEqual(entries[self.keys[2]]['inputs'], {'suffix': '!'})
+    
+    def test_record_lazy_inputs(self):
+        # Other inputs are recorded by type alone, without being pickled.
+        class Article(object):
+            def __init__(self, id, title):
+                self.id, self.title = id, title
+            
+            def __getstate__(self):
+                raise AssertionError('The article was pickled.')
+        
+        self.env.get_template('cache_record.txt').render(suffix='!',
+            articles=[Article(1, 'A'), Article(2, 'B')])
+        entry = fragments.get_log().entries[self.keys[0]]
+        self.assertEqual(entry['inputs'], {'suffix': '!'})
+        self.assertEqual(entry['input_types']['article'],
+            'djanjinja_test.cache.tests.Article')
+        
+        # Without a factory, such fragments can't be warmed.
+        for key in self.keys:
+            cache.cache.delete(key)
+        results = fragments.warm(fragments.get_log().entries,
+            environment=self.env)
+        self.assertEqual(results, {self.keys[0]: None, self.keys[1]: None,
+            self.keys[2]: True})
+        self.assertEqual(cache.cache.get(self.keys[0]), None)
+    
+    def test_plain_size(self):
+        self.assertEqual(fragments.plain_size([1, (u'a', {'b': None})], 10),
+            4)
+        self.assertEqual(fragments.plain_size(range(11), 10), None)
+        self.assertEqual(fragments.plain_size([object()], 10), None)
+    
+    def test_warm(self):
+        self.render()
+        fragments.get_log().flush()
+        for key in self.keys:
+            cache.cache.delete(key)
+        
+        results = fragments.warm(fragments.load(self.filename),
+            environment=self.env)
+        self.assertEqual(results, dict.fromkeys(self.keys, True))
+        self.assertEqual(cache.cache.get(self.keys[1]), u'[B!]')
+        self.assertEqual(cache.cache.get(self.keys[2]), u'footer!')
+        
+        # Warming again reuses the same threads.
+        threads = threading.activeCount()
+        fragments.warm(fragments.load(self.filename), environment=self.env)
+        self.assertEqual(threading.activeCount(), threads)
+    
+    def test_warm_factory(self):
+        self.render()
+        for key in self.keys:
+            cache.cache.delete(key)
+        
+        factory = lambda parameters, inputs: dict(inputs, suffix='?')
+        results = fragments.warm(fragments.get_log().entries, limit=1,
+            factories={'cache_record.txt': factory}, environment=self.env)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(cache.cache.get(results.keys()[0])[-2:], u'?]')
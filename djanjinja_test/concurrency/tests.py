@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for concurrency: single-flight compilation (and compilation leases),
+per-thread template caches, parallel context processors, thread pools,
+asynchronous rendering, parallel fragments and bulk rendering.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core import cache
+from django.http import HttpRequest
+from django.test import TestCase
+from jinja2 import TemplateSyntaxError
+
+import djanjinja
+from djanjinja import batch, caches
+from djanjinja.batch import RenderError
+from djanjinja.bccache import DjangoBytecodeCache
+from djanjinja.extensions.cache import CacheExtension, PendingFragments
+from djanjinja.loader import Bundle
+from djanjinja import pool as pool_module
+from djanjinja.pool import JobTimeout, ThreadPool, wait
+from djanjinja.views import (RequestContext, render_to_response_async,
+    render_to_string_async, timeout_default)
+
+
+class LeasingClient(object):
+    
+    """A stand-in for a memcached client, with an atomic ``add()``."""
+    
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+    
+    def add(self, key, value, timeout=None):
+        self.lock.acquire()
+        try:
+            if key in self.data:
+                return False
+            self.data[key] = value
+            return True
+        finally:
+            self.lock.release()
+    
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class SingleFlightTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.env.bytecode_cache = None
+        self.compiled = []
+        self.count_compiles(self.env)
+    
+    def count_compiles(self, env, delay=0.1):
+        """Make compiling templates in an environment slow, and count it."""
+        
+        compile = env.compile
+        def slow_compile(*args, **kwargs):
+            self.compiled.append(args[1])
+            time.sleep(delay)
+            return compile(*args, **kwargs)
+        env.compile = slow_compile
+    
+    def load_concurrently(self, env, name, threads=5):
+        """Load a template from several threads at once."""
+        
+        templates = []
+        def load():
+            templates.append(env.get_template(name))
+        workers = [threading.Thread(target=load) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return templates
+    
+    def test_threads(self):
+        templates = self.load_concurrently(self.env, 'plain.txt')
+        self.assertEqual(self.compiled, ['plain.txt'])
+        self.assertEqual(len(set(map(id, templates))), 1)
+        self.assertEqual(self.env.compile_locks, {})
+    
+    def test_lease_wait(self):
+        client = LeasingClient()
+        self.env.bytecode_cache = DjangoBytecodeCache(client,
+            lease_timeout=5)
+        bucket = self.env.bytecode_cache.get_bucket(self.env, 'plain.txt',
+            'plain.txt', self.env.loader.get_source(self.env, 'plain.txt')[0])
+        # Another 'process' holds the lease, and stores the bytecode shortly.
+        client.add(self.env.bytecode_cache.lease_prefix + bucket.key, '1')
+        def compile_elsewhere():
+            time.sleep(0.2)
+            other = djanjinja.get_env().copy()
+            other.bytecode_cache = DjangoBytecodeCache(client)
+            other.get_template('plain.txt')
+        threading.Thread(target=compile_elsewhere).start()
+        
+        self.assertEqual(self.env.get_template('plain.txt').render(),
+            djanjinja.get_template('plain.txt').render())
+        self.assertEqual(self.compiled, [])
+    
+    def test_lease_expiry(self):
+        client = LeasingClient()
+        self.env.bytecode_cache = DjangoBytecodeCache(client,
+            lease_timeout=0.2)
+        bucket = self.env.bytecode_cache.get_bucket(self.env, 'plain.txt',
+            'plain.txt', self.env.loader.get_source(self.env, 'plain.txt')[0])
+        # A lease which is never released doesn't stop us compiling.
+        client.add(self.env.bytecode_cache.lease_prefix + bucket.key, '1')
+        self.env.get_template('plain.txt')
+        self.assertEqual(self.compiled, ['plain.txt'])
+        self.assertTrue(self.env.bytecode_cache.prefix + bucket.key in
+            client.data)
+
+
+class ThreadCacheTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.env.thread_cache = threading.local()
+    
+    def test_lookup(self):
+        template = self.env.get_template('plain.txt')
+        # Subsequent lookups in this thread don't touch the shared cache.
+        self.env.cache.clear()
+        self.assertTrue(self.env.get_template('plain.txt') is template)
+        
+        # But other threads have their own.
+        templates = []
+        def load():
+            templates.append(self.env.get_template('plain.txt'))
+        worker = threading.Thread(target=load)
+        worker.start()
+        worker.join()
+        self.assertFalse(templates[0] is template)
+    
+    def test_invalidate(self):
+        template = self.env.get_template('plain.txt')
+        self.env.invalidate('plain.txt')
+        self.assertFalse(self.env.get_template('plain.txt') is template)
+    
+    def test_overlay(self):
+        template = self.env.get_template('plain.txt')
+        overlay = self.env.overlay(cache_size=50)
+        self.assertFalse(overlay.get_template('plain.txt') is template)
+
+
+def sleeper(seconds, **values):
+    """Return a context processor which sleeps before returning values."""
+    
+    def processor(request):
+        time.sleep(seconds)
+        return values
+    return processor
+
+
+class ContextProcessorTest(TestCase):
+    
+    def setUp(self):
+        settings.JINJA_CONCURRENT_CONTEXT_PROCESSORS = True
+    
+    def tearDown(self):
+        del settings.JINJA_CONCURRENT_CONTEXT_PROCESSORS
+        if hasattr(settings, 'JINJA_CONTEXT_PROCESSOR_TIMEOUT'):
+            del settings.JINJA_CONTEXT_PROCESSOR_TIMEOUT
+    
+    def test_concurrent(self):
+        started = time.time()
+        context = RequestContext(HttpRequest(), processors=[
+            sleeper(0.2, a=1, b=1), sleeper(0.2, b=2), sleeper(0, c=3)])
+        self.assertTrue(time.time() - started < 0.35)
+        # Later processors take precedence, however long they took.
+        self.assertEqual((context['a'], context['b'], context['c']), (1, 2, 3))
+        self.assertEqual(len(context.processor_timings),
+            len(settings.TEMPLATE_CONTEXT_PROCESSORS) + 3)
+        name, elapsed = context.processor_timings[-2]
+        self.assertEqual(name, __name__ + '.processor')
+        self.assertTrue(elapsed >= 0.2)
+    
+    def test_timeout(self):
+        settings.JINJA_CONTEXT_PROCESSOR_TIMEOUT = 0.1
+        context = RequestContext(HttpRequest(), processors=[
+            timeout_default({'a': 'default'})(sleeper(0.5, a='slow')),
+            sleeper(0.5, b='slow')])
+        self.assertEqual(context['a'], 'default')
+        self.assertFalse('b' in context)
+        self.assertEqual(context.processor_timings[-1][1], None)
+    
+    def test_busy_pool(self):
+        # While the pool is busy, processors run in the request thread.
+        pool = ThreadPool(1, queue_size=1)
+        release = threading.Event()
+        pool.submit(release.wait)
+        pool.submit(release.wait)
+        pool_module.POOLS['context_processor'], old_pool = pool, (
+            pool_module.POOLS.get('context_processor'))
+        try:
+            context = RequestContext(HttpRequest(), processors=[
+                sleeper(0, a=1)])
+        finally:
+            release.set()
+            pool_module.POOLS['context_processor'] = old_pool
+        self.assertEqual(context['a'], 1)
+
+
+class ThreadPoolTest(TestCase):
+    
+    def setUp(self):
+        self.pool = ThreadPool(1, queue_size=1)
+        self.release = threading.Event()
+        self.blocker = self.pool.submit(self.release.wait)
+        self.blocker.started.wait(1)
+    
+    def tearDown(self):
+        self.release.set()
+    
+    def test_bounded_queue(self):
+        queued = self.pool.try_submit(lambda: 'queued')
+        self.assertNotEqual(queued, None)
+        self.assertEqual(self.pool.try_submit(lambda: 'full'), None)
+        self.release.set()
+        self.assertEqual(queued.get(1), 'queued')
+    
+    def test_cancel(self):
+        calls = []
+        queued = self.pool.submit(calls.append, 1)
+        self.assertTrue(queued.cancel())
+        self.assertFalse(self.blocker.cancel())
+        self.release.set()
+        self.assertEqual(self.pool.submit(calls.append, 2).get(1), None)
+        self.assertEqual(calls, [2])
+    
+    def test_timeout_from_start(self):
+        # Time spent in the queue doesn't count against a job.
+        queued = self.pool.submit(time.sleep, 0.1)
+        self.assertRaises(JobTimeout, queued.get, 0.1, from_start=True)
+        self.release.set()
+        self.assertEqual(queued.get(0.3, from_start=True), None)
+    
+    def test_closes_connection(self):
+        from django.db import connection
+        
+        # Closing the in-memory test database is a no-op, so just record it.
+        closed = []
+        wrapper_class = type(connection)
+        close = wrapper_class.close
+        wrapper_class.close = lambda self: closed.append(
+            threading.currentThread().getName())
+        try:
+            self.release.set()
+            self.pool.submit(lambda: None).get(1)
+        finally:
+            wrapper_class.close = close
+        self.assertTrue('djanjinja-worker-0' in closed)
+
+
+class AsyncTest(TestCase):
+    
+    def test_render(self):
+        job = render_to_string_async('context.txt', {'a': 1, 'b': 2})
+        self.assertEqual(job.get(), 'a = 1; b = 2')
+        response = render_to_response_async('plain.txt').get()
+        self.assertEqual(response.content, 'Hello, World!')
+    
+    def test_function(self):
+        env = djanjinja.get_env().copy()
+        # The `wait` filter is only added along with asynchronous functions.
+        self.assertFalse('wait' in env.filters)
+        
+        @env.asyncfunction
+        def slow(value):
+            time.sleep(0.2)
+            return value
+        
+        template = env.from_string('{% set a = slow(1) %}{% set b = slow(2) %}'
+            '{{ a|wait }}{{ b|wait }}')
+        started = time.time()
+        self.assertEqual(template.render(), '12')
+        self.assertTrue(time.time() - started < 0.35)
+        self.assertFalse('wait' in djanjinja.get_env().filters)
+    
+    def test_bundle(self):
+        bundle = Bundle()
+        self.assertFalse('wait' in bundle.filters)
+        bundle.asyncfilter(lambda value: value, name='slow')
+        self.assertEqual(bundle.filters['wait'], wait)
+    
+    def test_fragment_cache(self):
+        env = djanjinja.get_env()
+        key = env.extensions[CacheExtension.identifier]._generate_key(
+            'async_fragment')
+        settings.JINJA_ASYNC_FRAGMENT_CACHE = True
+        try:
+            self.assertEqual(env.from_string(
+                '{% cache "async_fragment" %}value{% endcache %}').render(),
+                'value')
+        finally:
+            del settings.JINJA_ASYNC_FRAGMENT_CACHE
+        
+        deadline = time.time() + 1
+        while cache.cache.get(key) is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.cache.get(key), 'value')
+
+
+class ParallelFragmentTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.env.parallel_fragments = True
+        self.threads = set()
+        
+        @self.env.function
+        def slow(value):
+            self.threads.add(threading.currentThread().getName())
+            time.sleep(0.2)
+            return value
+        
+        extension = self.env.extensions[CacheExtension.identifier]
+        self.keys = [extension._generate_key('outer')] + [
+            extension._generate_key((prefix, n))
+            for prefix in ('parallel', 'parallel-inner') for n in range(4)]
+    
+    def tearDown(self):
+        for key in self.keys:
+            cache.cache.delete(key)
+    
+    def render(self):
+        return self.env.get_template('cache_parallel.txt').render(
+            numbers=range(4), suffix='!')
+    
+    def test_render(self):
+        started = time.time()
+        self.assertEqual(self.render(),
+            '<0!><1!><2!><3!>\n(0)(1)(2)(3)')
+        self.assertTrue(time.time() - started < 0.8)
+        self.assertTrue(threading.currentThread().getName() not in
+            self.threads)
+        # The outer fragment is cached with its parallel fragments in place.
+        self.assertEqual(cache.cache.get(self.keys[0]), '(0)(1)(2)(3)')
+        self.assertEqual(cache.cache.get(self.keys[1]), '<0!>')
+        
+        # Hits come straight from the cache.
+        self.threads.clear()
+        self.assertEqual(self.render(),
+            '<0!><1!><2!><3!>\n(0)(1)(2)(3)')
+        self.assertEqual(self.threads, set())
+    
+    def test_lookup(self):
+        # Parallel fragments are looked up on the pool, not in the render.
+        lookups = []
+        get = cache.cache.get
+        def recording_get(key, *args):
+            if key in self.keys:
+                lookups.append(threading.currentThread().getName())
+            return get(key, *args)
+        cache.cache.get = recording_get
+        try:
+            self.render()
+        finally:
+            del cache.cache.get
+        self.assertEqual(len(lookups), 9)
+        self.assertEqual(lookups.count(threading.currentThread().getName()), 1)
+    
+    def test_disabled(self):
+        self.env.parallel_fragments = False
+        self.assertEqual(self.render(),
+            '<0!><1!><2!><3!>\n(0)(1)(2)(3)')
+        self.assertEqual(self.threads,
+            set([threading.currentThread().getName()]))
+    
+    def test_enclosing_loop(self):
+        self.assertRaises(TemplateSyntaxError, self.env.from_string,
+            '{% for n in numbers %}{% cache n parallel %}{{ loop.index }}'
+            '{% endcache %}{% endfor %}')
+        # A loop inside the fragment has its own `loop`.
+        self.env.from_string('{% cache "x" parallel %}{% for n in numbers %}'
+            '{{ loop.index }}{% endfor %}{% endcache %}')
+    
+    
+    def test_filtered(self):
+        # Fragments whose output may be transformed are rendered in place.
+        current = threading.currentThread().getName()
+        for source in ('{% filter upper %}{% cache ("parallel", 0) parallel %}'
+                '<{{ slow(0) }}{{ suffix }}>{% endcache %}{% endfilter %}',
+                '{% macro fragment() %}{% cache ("parallel", 0) parallel %}'
+                '<{{ slow(0) }}{{ suffix }}>{% endcache %}{% endmacro %}'
+                '{{ fragment()|upper }}'):
+            cache.cache.delete(self.keys[1])
+            self.threads.clear()
+            self.assertEqual(self.env.from_string(source).render(suffix='a'),
+                '<0A>')
+            self.assertEqual(self.threads, set([current]))
+    
+    def test_included(self):
+        # Included templates render their fragments in place too, when their
+        # output is captured.
+        self.assertEqual(self.env.from_string('{% filter upper %}'
+            '{% include "cache_parallel.txt" %}{% endfilter %}').render(
+                numbers=range(4), suffix='a'),
+            '<0A><1A><2A><3A>\n(0)(1)(2)(3)')
+        self.assertEqual(self.threads,
+            set([threading.currentThread().getName()]))
+    
+    def test_block_reference(self):
+        template = self.env.from_string('{% block a %}'
+            '{% cache ("parallel", 0) parallel %}<{{ slow(0) }}{{ suffix }}>'
+            '{% endcache %}{% endblock %} {{ self.a()|upper }}')
+        cache.cache.delete(self.keys[1])
+        self.assertEqual(template.render(suffix='a'), '<0a> <0A>')
+    
+    def test_forged_placeholder(self):
+        # A placeholder in the data is left alone.
+        self.assertEqual(self.env.get_template('cache_parallel.txt').render(
+            numbers=range(1), suffix=u'\x00fragment:0\x00'),
+            u'<0\x00fragment:0\x00>\n(0)')
+        self.assertTrue(len(PendingFragments().token) >= 16)
+
+
+class RenderManyTest(TestCase):
+    
+    def test_processes(self):
+        contexts = ({'a': i, 'b': -i} for i in xrange(250))
+        results = list(djanjinja.render_many('context.txt', contexts,
+            workers=2, batch_size=20))
+        self.assertEqual(results, [('a = %d; b = %d' % (i, -i), None)
+            for i in xrange(250)])
+    
+    def test_errors(self):
+        items = [('plain.txt', {}), ('does_not_exist.txt', {}),
+            ('context.txt', {'a': 1, 'b': 2})]
+        for workers in (0, 2):
+            results = list(djanjinja.render_many(None, items, workers=workers,
+                batch_size=2))
+            self.assertEqual(results[0], ('Hello, World!', None))
+            self.assertEqual(results[1][0], None)
+            self.assertTrue(isinstance(results[1][1], RenderError))
+            self.assertTrue('does_not_exist.txt' in results[1][1].traceback)
+            self.assertEqual(results[2], ('a = 1; b = 2', None))
+    
+    def test_grouped(self):
+        items = [('plain.txt', {}), ('context.txt', {'a': 1, 'b': 2}),
+            ('plain.txt', {}), ('context.txt', {'a': 3, 'b': 4})]
+        self.assertEqual(list(djanjinja.render_many(None, items, workers=2,
+            batch_size=5)), [('Hello, World!', None), ('a = 1; b = 2', None),
+            ('Hello, World!', None), ('a = 3; b = 4', None)])
+        # Each batch renders a single template.
+        batches = batch.iter_batches(sorted(enumerate(items),
+            key=lambda item: item[1][0]), 5)
+        self.assertEqual([(indices, [name for name, context in pairs])
+            for indices, pairs in batches],
+            [([1, 3], ['context.txt'] * 2), ([0, 2], ['plain.txt'] * 2)])
+    
+    def test_close_connections(self):
+        from django.db import connection
+        
+        closed = []
+        close = type(connection).close
+        type(connection).close = lambda self: closed.append('connection')
+        uri = 'memcached://10.0.0.5:11211/'
+        memcached_client = caches.memcached_client
+        caches.memcached_client = lambda servers: object()
+        try:
+            memcached = caches.CACHES[uri] = caches.MemcachedCache(['server'])
+            client = memcached.client
+            batch.close_connections()
+        finally:
+            type(connection).close = close
+            caches.memcached_client = memcached_client
+            del caches.CACHES[uri]
+        self.assertEqual(closed, ['connection'])
+        self.assertFalse(memcached.client is client)
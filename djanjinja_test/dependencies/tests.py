@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the template dependency graph."""
+
+from django.core import cache
+from django.test import TestCase
+
+import djanjinja
+from djanjinja import dependencies
+from djanjinja.bccache import DjangoBytecodeCache
+from djanjinja.dependencies import DependencyGraph
+
+
+class DictClient(object):
+    
+    """A stand-in for a memcached client, which counts round trips."""
+    
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+    
+    def get(self, key):
+        self.round_trips += 1
+        return self.data.get(key)
+    
+    def get_many(self, keys):
+        self.round_trips += 1
+        return dict((key, self.data[key]) for key in keys if key in self.data)
+    
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+
+class DependenciesTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.env.dependencies = DependencyGraph()
+        # Make sure templates are actually compiled.
+        self.env.bytecode_cache = None
+    
+    def test_compile_time(self):
+        self.env.get_template('deps_page.txt')
+        self.assertEqual(self.env.dependencies.dependencies('deps_page.txt'),
+            set(['deps_base.txt', 'deps_nav.txt']))
+        self.assertEqual(self.env.dependencies.dependents('deps_nav.txt'),
+            set(['deps_page.txt']))
+    
+    def test_render_time(self):
+        # Dynamically-named dependencies are recorded as they are loaded.
+        self.env.get_template('deps_page.txt').render(nav_name='plain.txt')
+        self.assertTrue('plain.txt' in
+            self.env.dependencies.dependencies('deps_page.txt'))
+        self.assertEqual(self.env.dependencies.closure('deps_page.txt'),
+            set(['deps_page.txt', 'deps_base.txt', 'deps_nav.txt',
+                'plain.txt']))
+    
+    def test_invalidate(self):
+        self.env.get_template('deps_page.txt').render(nav_name='plain.txt')
+        self.assertEqual(self.env.invalidate('deps_nav.txt'),
+            set(['deps_nav.txt', 'deps_page.txt']))
+        self.assertFalse('deps_page.txt' in self.env.cache)
+        self.assertFalse('deps_nav.txt' in self.env.cache)
+        self.assertTrue('deps_base.txt' in self.env.cache)
+    
+    def test_prefetch(self):
+        client = DictClient()
+        self.env.bytecode_cache = DjangoBytecodeCache(client)
+        self.env.get_template('deps_page.txt').render(nav_name='plain.txt')
+        
+        # A new environment with an empty cache, but the same graph and
+        # bytecode cache, should fetch all of the bytecode in one go.
+        other = self.env.overlay(cache_size=50)
+        other.prefetch_dependencies = True
+        client.round_trips = 0
+        other.get_template('deps_page.txt').render(nav_name='plain.txt')
+        self.assertEqual(client.round_trips, 1)
+    
+    def test_persisted(self):
+        # Two processes compiling different templates, each with its own
+        # graph, shouldn't lose each other's edges.
+        first, second = self.env.copy(), self.env.copy()
+        for environment in (first, second):
+            environment.dependencies = DependencyGraph()
+            environment.prefetch_dependencies = True
+        try:
+            first.get_template('deps_page.txt')
+            second.get_template('deps_nav.txt')
+            second.get_template('deps_base.txt')
+            
+            graph = DependencyGraph()
+            dependencies.load_graph(graph, ['deps_page.txt', 'deps_nav.txt',
+                'deps_base.txt', 'missing.txt'])
+            self.assertEqual(graph.as_dict(), {
+                'deps_page.txt': ['deps_base.txt', 'deps_nav.txt'],
+                'deps_nav.txt': [], 'deps_base.txt': []})
+        finally:
+            for name in ('deps_page.txt', 'deps_nav.txt', 'deps_base.txt'):
+                cache.cache.delete(dependencies.graph_cache_key(name))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for interval-based checking of template sources."""
+
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase
+
+import djanjinja
+from djanjinja import environment
+from djanjinja.freshness import SourceTracker
+
+
+class FreshnessTest(TestCase):
+    
+    def setUp(self):
+        self.template_dir = tempfile.mkdtemp()
+        self.template_dirs = settings.TEMPLATE_DIRS
+        settings.TEMPLATE_DIRS = (self.template_dir,) + self.template_dirs
+        self.write(u'one')
+        
+        self.tracker = environment.TEMPLATE_TRACKER = SourceTracker(3600)
+        self.env = djanjinja.get_env().copy()
+        self.env.auto_reload = True
+        self.env.bytecode_cache = None
+        self.invalidated = []
+        self.tracker.listeners.append(self.invalidated.append)
+    
+    def tearDown(self):
+        environment.TEMPLATE_TRACKER = None
+        settings.TEMPLATE_DIRS = self.template_dirs
+        shutil.rmtree(self.template_dir)
+    
+    def write(self, content):
+        template_file = open(os.path.join(self.template_dir, 'fresh.txt'), 'w')
+        try:
+            template_file.write(content)
+        finally:
+            template_file.close()
+    
+    def render(self):
+        return self.env.get_template('fresh.txt').render()
+    
+    def test_interval(self):
+        self.assertEqual(self.render(), u'one')
+        self.write(u'two')
+        # The interval hasn't elapsed, so the change isn't noticed yet.
+        self.assertEqual(self.render(), u'one')
+        self.assertEqual(self.tracker.generation, 0)
+        
+        self.tracker.checked['fresh.txt'] = 0
+        self.assertEqual(self.render(), u'two')
+        self.assertEqual(self.tracker.generation, 1)
+        self.assertEqual(self.invalidated, ['fresh.txt'])
+    
+    def test_check_all(self):
+        self.assertEqual(self.render(), u'one')
+        self.write(u'two')
+        self.tracker.check_all()
+        self.assertEqual(self.invalidated, ['fresh.txt'])
+        # Checking again shouldn't find any further changes.
+        self.tracker.check_all()
+        self.assertEqual(self.tracker.generation, 1)
+        self.assertEqual(self.render(), u'two')
+    
+    def test_changed_on_fetch(self):
+        self.assertEqual(self.render(), u'one')
+        self.write(u'two')
+        # Fetching the source for any other reason notices the change too.
+        self.env.loader.get_source(self.env, 'fresh.txt')
+        self.assertEqual(self.tracker.generation, 1)
+        self.assertEqual(self.invalidated, ['fresh.txt'])
+        self.assertEqual(self.render(), u'two')
+        self.assertEqual(self.tracker.generation, 1)
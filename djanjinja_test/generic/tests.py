@@ -2,8 +2,13 @@
 
 """Tests for views which render templates using the generic views."""
 
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpRequest
 from django.test import TestCase
 
+import djanjinja
+from djanjinja import generic
+
 
 PLAIN_RESPONSE = 'Hello, World!'
 CONTEXT_RESPONSE = 'a = 1; b = 2'
@@ -12,6 +17,12 @@ REQ_CONTEXT_RESPONSE = 'user.is_anonymous() => True'
 
 class GenericTest(TestCase):
     
+    def setUp(self):
+        generic.STATIC_PAGES.clear()
+    
+    def tearDown(self):
+        generic.STATIC_PAGES.clear()
+    
     def test_plain(self):
         response = self.client.get('/generic/plain/')
         self.assertEqual(response.status_code, 200)
@@ -26,3 +37,77 @@ class GenericTest(TestCase):
         response = self.client.get('/generic/req_context/')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, REQ_CONTEXT_RESPONSE)
+    
+    def test_static(self):
+        response = self.client.get('/generic/static/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, CONTEXT_RESPONSE)
+        
+        # A conditional GET with the same ETag should not return any content.
+        etag = response['ETag']
+        response = self.client.get('/generic/static/',
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+        self.assertEqual(response['ETag'], etag)
+        
+        # Weak tags and lists of tags match too.
+        for header in ('W/%s' % (etag,), '"other", %s' % (etag,), '*'):
+            response = self.client.get('/generic/static/',
+                HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304)
+        response = self.client.get('/generic/static/',
+            HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_static_revalidation(self):
+        self.client.get('/generic/static/')
+        self.assertEqual(len(generic.STATIC_PAGES), 1)
+        key = generic.STATIC_PAGES.keys()[0]
+        checksum, content, etag = generic.STATIC_PAGES[key]
+        
+        # Cached content is served while the source checksum matches...
+        generic.STATIC_PAGES[key] = (checksum, 'cached', etag)
+        self.assertEqual(self.client.get('/generic/static/').content,
+            'cached')
+        
+        # ...but is re-rendered when it doesn't.
+        generic.STATIC_PAGES[key] = ('stale', 'cached', etag)
+        self.assertEqual(self.client.get('/generic/static/').content,
+            CONTEXT_RESPONSE)
+    
+    def test_static_dependencies(self):
+        request = HttpRequest()
+        generic.render_static(request, 'blocks_page.txt', {'year': 2010})
+        key = generic.STATIC_PAGES.keys()[0]
+        checksum, content, etag = generic.STATIC_PAGES[key]
+        generic.STATIC_PAGES[key] = (checksum, 'cached', etag)
+        self.assertEqual(generic.render_static(request, 'blocks_page.txt',
+            {'year': 2010}).content, 'cached')
+        
+        # A changed parent template invalidates the page too.
+        parent = djanjinja.get_env().get_template('blocks_base.txt')
+        parent.source_checksum = 'changed'
+        try:
+            self.assertEqual(generic.render_static(request, 'blocks_page.txt',
+                {'year': 2010}).content, content)
+        finally:
+            del parent.source_checksum
+    
+    def test_static_key(self):
+        self.assertEqual(generic.canonical({'b': [1, {'c': 2}], 'a': u'x'}),
+            [('a', u'x'), ('b', (1, [('c', 2)]))])
+        self.assertRaises(TypeError, generic.canonical, {'a': object()})
+    
+    def test_positional_args(self):
+        # Extra positional arguments are parameters, not the `static` flag.
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        response = generic.direct_to_template(request, 'context.txt',
+            {'a': 1, 'b': 2}, None, 'extra')
+        self.assertEqual(response.content, CONTEXT_RESPONSE)
+        self.assertEqual(len(generic.STATIC_PAGES), 0)
+    
+    def test_guess_mimetype(self):
+        self.assertEqual(generic.guess_mimetype('plain.txt'), 'text/plain')
+        self.assertEqual(generic.MIMETYPES['plain.txt'], 'text/plain')
@@ -10,5 +10,8 @@ urlpatterns = patterns('djanjinja.generic',
         {'template': 'context.txt', 'extra_context': {'a': 1, 'b': 2}},
         name='generic-context'),
     url(r'^req_context/$', 'direct_to_template',
-        {'template': 'req_context.txt'}, name='generic-req_context')
+        {'template': 'req_context.txt'}, name='generic-req_context'),
+    url(r'^static/$', 'direct_to_template',
+        {'template': 'context.txt', 'extra_context': {'a': 1, 'b': 2},
+         'static': True}, name='generic-static'),
 )
\ No newline at end of file
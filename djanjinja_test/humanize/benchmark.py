@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare the speed of the native humanize filters with Django's originals.
+
+Run ``paver benchmark``, or ``python -m djanjinja_test.humanize.benchmark``
+with ``DJANGO_SETTINGS_MODULE`` set.
+"""
+
+import datetime
+import timeit
+
+from django.contrib.humanize.templatetags import humanize as django_humanize
+
+from djanjinja.bundles import humanize
+
+
+TODAY = datetime.date.today()
+
+# The values each filter is called with, typical of a data table.
+VALUES = {
+    'intcomma': [0, 7, 999, 1000, 45000, -1234567, 12345678901234L,
+        1234.5678, u'1234567', u'n/a'],
+    'intword': [1000, 1200000, 1200000000, 1200000000000, 10 ** 16],
+    'apnumber': [0, 1, 5, 9, 10, u'7', u'n/a'],
+    'naturalday': [TODAY, TODAY - datetime.timedelta(days=1),
+        TODAY + datetime.timedelta(days=1),
+        TODAY + datetime.timedelta(days=30), None],
+    'ordinal': [1, 2, 3, 4, 11, 12, 13, 21, 102, 111, u'n/a'],
+}
+
+
+def time_filter(function, values, number):
+    """Return the seconds taken to call a filter on some values, repeatedly."""
+    
+    def run():
+        for value in values:
+            function(value)
+    return timeit.Timer(run).timeit(number)
+
+
+def compare(number=10000):
+    
+    """
+    Time each native filter and its original on the values in ``VALUES``.
+    
+    Returns a dictionary mapping each filter's name to a ``(native,
+    original)`` pair of the seconds taken to call it ``number`` times on each
+    value.
+    """
+    
+    results = {}
+    for name, values in VALUES.iteritems():
+        results[name] = (
+            time_filter(getattr(humanize, name), values, number),
+            time_filter(getattr(django_humanize, name), values, number))
+    return results
+
+
+def main(number=10000):
+    """Print a table comparing the native and original filters."""
+    
+    print '%-12s %10s %10s %8s' % ('filter', 'native', 'django', 'speedup')
+    for name, (native, original) in sorted(compare(number).items()):
+        print '%-12s %9.3fs %9.3fs %7.1fx' % (name, native, original,
+            original / native)
+
+
+if __name__ == '__main__':
+    main()
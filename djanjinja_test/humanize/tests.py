@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the native humanize filters."""
+
+import datetime
+
+from django.contrib.humanize.templatetags import humanize as django_humanize
+from django.test import TestCase
+from django.utils import translation
+
+import djanjinja
+from djanjinja.bundles import humanize
+
+from djanjinja_test.humanize import benchmark
+
+
+FILTERS = ['apnumber', 'intcomma', 'intword', 'naturalday', 'ordinal']
+
+
+class HumanizeTest(TestCase):
+    
+    def assertIdentical(self, name, values):
+        native = getattr(humanize, name)
+        original = getattr(django_humanize, name)
+        for value in values:
+            expected, result = original(value), native(value)
+            self.assertEqual(result, expected,
+                '%s(%r) == %r, not %r' % (name, value, result, expected))
+            self.assertEqual(type(result), type(expected))
+    
+    def test_intcomma(self):
+        self.assertIdentical('intcomma', benchmark.VALUES['intcomma'] + [
+            -1, -12, -123, -1234, 10 ** 30, -10 ** 30, 0.5, -1234.5,
+            u'', u'-', u'--1234', u'12345abc', u'1234 5678', '123456',
+            u'1,234', None, True, 1.5e20])
+        for number in range(-10000, 10000, 7):
+            self.assertEqual(humanize.intcomma(number),
+                django_humanize.intcomma(number))
+    
+    def test_intword(self):
+        self.assertIdentical('intword', benchmark.VALUES['intword'] + [
+            999999, 1000000, 999999999, 1000000000, -5000000, u'3000000'])
+    
+    def test_apnumber(self):
+        self.assertIdentical('apnumber', benchmark.VALUES['apnumber'] +
+            range(-2, 12) + [u'10', 3.7])
+    
+    def test_ordinal(self):
+        self.assertIdentical('ordinal', range(-120, 250) + [u'21', 2.9,
+            u'n/a'])
+    
+    def test_naturalday(self):
+        today = datetime.date.today()
+        now = datetime.datetime.now()
+        self.assertIdentical('naturalday', benchmark.VALUES['naturalday'] +
+            [now, now - datetime.timedelta(days=1), u'today',
+             today - datetime.timedelta(days=400)])
+        later = today + datetime.timedelta(days=10)
+        for format_string in ['Y', 'jS F Y', r'j \o\f F', 'D H:i', '']:
+            self.assertEqual(humanize.naturalday(later, format_string),
+                django_humanize.naturalday(later, format_string))
+        self.assertTrue('jS F Y' in humanize.DATE_FORMATS)
+    
+    def test_languages(self):
+        for language in ['fr', 'de', 'en-gb']:
+            translation.activate(language)
+            try:
+                for name in FILTERS:
+                    self.assertIdentical(name, benchmark.VALUES[name])
+            finally:
+                translation.deactivate()
+        self.assertTrue('fr' in humanize.WORDS)
+    
+    def test_bundle(self):
+        env = djanjinja.get_env().copy()
+        env.load('djanjinja', 'humanize')
+        for name in FILTERS:
+            self.assertTrue(env.filters[name] is getattr(humanize, name))
+        self.assertEqual(env.from_string(
+            '{{ 1234567|intcomma }} {{ 3|ordinal }}').render(),
+            u'1,234,567 3rd')
+    
+    def test_benchmark(self):
+        results = benchmark.compare(number=1)
+        self.assertEqual(sorted(results), FILTERS)
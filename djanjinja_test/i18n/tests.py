@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for per-language template variants."""
+
+from django.test import TestCase
+from django.utils import translation
+
+import djanjinja
+
+
+ENGLISH_RESPONSE = u'January February'
+GERMAN_RESPONSE = u'Januar Februar'
+
+
+class I18NVariantsTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.env.i18n_variants = True
+    
+    def tearDown(self):
+        translation.deactivate()
+    
+    def test_variants(self):
+        translation.activate('de')
+        template = self.env.get_template('i18n.txt')
+        self.assertEqual(template.render(), GERMAN_RESPONSE)
+        self.assertEqual(template.environment.language, 'de')
+        
+        translation.activate('en')
+        template = self.env.get_template('i18n.txt')
+        self.assertEqual(template.render(), ENGLISH_RESPONSE)
+        self.assertEqual(sorted(self.env.variants), ['de', 'en'])
+    
+    def test_inlined(self):
+        # The compiled variant should not call `gettext()` at all.
+        source = djanjinja.get_env().loader.get_source(
+            self.env, 'i18n.txt')[0]
+        code = self.env.for_language('de').compile(source, raw=True)
+        self.assertTrue(u'Januar' in code)
+        self.assertFalse(u'gettext' in code)
+    
+    def test_bytecode_keys(self):
+        bytecode_cache = self.env.for_language('de').bytecode_cache
+        self.assertEqual(bytecode_cache.get_cache_key('i18n.txt'),
+            self.env.bytecode_cache.get_cache_key('i18n.txt') + ':de')
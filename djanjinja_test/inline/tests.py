@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for compile-time inlining of included templates."""
+
+from django.test import TestCase
+
+import djanjinja
+from djanjinja.dependencies import DependencyGraph
+from djanjinja.environment import TemplateLoader
+from djanjinja.extensions.inline import InlineIncludeExtension
+
+
+INLINE_RESPONSE = u'<2><4>1'
+
+
+class InlineIncludeTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.env.dependencies = DependencyGraph()
+        self.env.add_extension(InlineIncludeExtension)
+    
+    def source(self, name):
+        return self.env.loader.get_source(self.env, name)[0]
+    
+    def test_inlined(self):
+        code = self.env.compile(self.source('inline_page.txt'),
+            'inline_page.txt', raw=True)
+        self.assertFalse('template = environment.' in code)
+        # The include shouldn't leak its assignments into the parent.
+        self.assertEqual(
+            self.env.get_template('inline_page.txt').render(items=[1, 2]),
+            INLINE_RESPONSE)
+    
+    def test_not_inlined(self):
+        for source in ['{% include name %}',
+                       '{% include "inline_item.txt" ignore missing %}',
+                       '{% include "inline_item.txt" without context %}',
+                       '{% include "deps_page.txt" %}']:
+            code = self.env.compile(source, 'test', raw=True)
+            self.assertTrue('template = environment.' in code, source)
+    
+    def test_recursive(self):
+        # Recursive includes are inlined only until they recurse.
+        code = self.env.compile(u'{% include "test" %}', 'test', raw=True)
+        self.assertTrue('template = environment.' in code)
+    
+    def test_checksum_source(self):
+        loader = self.env.loader
+        page = self.source('inline_page.txt')
+        # Unknown dependencies are found by parsing, without compiling.
+        self.assertEqual(
+            loader.checksum_source(self.env, 'inline_page.txt', page),
+            page + u'\0' + self.source('inline_item.txt'))
+        self.assertEqual(self.env.dependencies.dependencies('inline_page.txt'),
+            set(['inline_item.txt']))
+    
+    def test_nested(self):
+        sources = {'page.txt': 'P[{% include "a.txt" %}]',
+            'a.txt': 'A[{% include "b.txt" %}]', 'b.txt': 'B1'}
+        self.env.loader = TemplateLoader(
+            lambda name: (sources[name], None, lambda: True))
+        self.assertEqual(self.env.get_template('page.txt').render(),
+            u'P[A[B1]]')
+        # Templates inlined at any depth are dependencies of the page.
+        self.assertEqual(self.env.dependencies.dependencies('page.txt'),
+            set(['a.txt', 'b.txt']))
+        self.assertEqual(self.env.dependencies.dependencies('a.txt'),
+            set(['b.txt']))
+        
+        sources['b.txt'] = 'B2'
+        self.assertEqual(self.env.invalidate('b.txt'),
+            set(['page.txt', 'a.txt', 'b.txt']))
+        self.assertEqual(self.env.get_template('page.txt').render(),
+            u'P[A[B2]]')
+    
+    def test_nested_checksum_source(self):
+        loader = self.env.loader
+        outer = self.source('inline_outer.txt')
+        self.assertEqual(
+            loader.checksum_source(self.env, 'inline_outer.txt', outer),
+            u'\0'.join([outer, self.source('inline_inner.txt'),
+                self.source('inline_middle.txt')]))
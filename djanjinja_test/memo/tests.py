@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for memoization within a render."""
+
+from django.test import TestCase
+
+import djanjinja
+from djanjinja import memo
+from djanjinja.extensions.memo import MemoExtension
+from djanjinja.loader import Bundle
+
+
+class MemoTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.calls = []
+        
+        @self.env.memofunction
+        def double(number):
+            self.calls.append(number)
+            return number * 2
+        
+        @self.env.function
+        def count():
+            self.calls.append(None)
+            return ''
+        
+        memo.reset_stats()
+    
+    def test_function(self):
+        template = self.env.from_string(
+            '{{ double(1) }}{{ double(1) }}{{ double(2) }}')
+        self.assertEqual(template.render(), '224')
+        self.assertEqual(self.calls, [1, 2])
+        # Each render has its own store.
+        template.render()
+        self.assertEqual(self.calls, [1, 2, 1, 2])
+        self.assertEqual(memo.stats(), {'double': (2, 4)})
+    
+    def test_include(self):
+        self.env.cache.clear()
+        self.assertEqual(self.env.get_template('memo_page.txt').render(), '22')
+        self.assertEqual(self.calls, [1])
+    
+    def test_hidden(self):
+        # The store isn't one of the template's variables.
+        context = self.env.from_string('').new_context({'a': 1})
+        self.assertFalse([value for value in context.get_all().values()
+            if isinstance(value, memo.MemoStore)])
+        self.assertEqual(self.env.from_string('{{ double(1) }}'
+            '{% for _djanjinja_memo in [None] %}{{ double(1) }}{% endfor %}'
+            ).render(_djanjinja_memo=None), '22')
+        self.assertEqual(self.calls, [1])
+    
+    def test_scoped_block(self):
+        template = self.env.from_string('{% for n in [1, 2] %}'
+            '{% block b scoped %}{{ double(1) }}{% endblock %}{% endfor %}')
+        self.assertEqual(template.render(), '22')
+        self.assertEqual(self.calls, [1])
+    
+    def test_macro(self):
+        self.env.add_extension(MemoExtension)
+        template = self.env.from_string(
+            '{% macro twice(x) %}{{ count() }}{{ x * 2 }}{% endmacro %}'
+            '{% memo twice(1) %}{% memo twice(1) %}{% memo twice(x=2) %}')
+        self.assertEqual(template.render(), '224')
+        self.assertEqual(self.calls, [None, None])
+        self.assertEqual(memo.stats(), {'twice': (1, 2)})
+    
+    def test_macro_closure(self):
+        # A macro defined in a loop closes over a different value each time.
+        self.env.add_extension(MemoExtension)
+        template = self.env.from_string(
+            '{% for u in [1, 2, 3] %}{% macro m() %}{{ u }}{% endmacro %}'
+            '{% memo m() %}{{ m() }} {% endfor %}')
+        self.assertEqual(template.render(), u'11 22 33 ')
+    
+    def test_unhashable(self):
+        template = self.env.from_string('{{ double([1]) }}{{ double([1]) }}')
+        self.assertEqual(template.render(), '[1, 1][1, 1]')
+        self.assertEqual(self.calls, [[1], [1]])
+    
+    def test_bundle(self):
+        bundle = Bundle()
+        @bundle.memofunction
+        def triple(number):
+            return number * 3
+        self.assertTrue(getattr(bundle.globals['triple'], 'contextfunction'))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for compile-time minification."""
+
+from django.test import TestCase
+
+import djanjinja
+from djanjinja.environment import compile_variant
+from djanjinja.extensions.minify import MinifyExtension, minify
+
+
+MINIFIED_RESPONSE = u'''<html>
+<body>
+<p>
+Hello, world!
+</p>
+<pre>
+  Hello   indented
+        </pre>
+<textarea>  a   b  </textarea>
+<script type="text/javascript">
+            var x  =  1;
+        </script>
+</body>
+</html>'''
+
+
+class MinifyTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        self.env.add_extension(MinifyExtension)
+        # Make sure templates are actually compiled.
+        self.env.bytecode_cache = None
+        self.env.cache.clear()
+    
+    def test_render(self):
+        template = self.env.get_template('minify_page.html')
+        self.assertEqual(template.render(greeting='Hello'), MINIFIED_RESPONSE)
+        # The expressions in the template contain no runs of whitespace, so
+        # the savings are the same as for minifying the whole source.
+        source = self.env.loader.get_source(self.env, 'minify_page.html')[0]
+        source = source.rstrip('\n')
+        self.assertEqual(self.env.minify_savings['minify_page.html'],
+            len(source) - len(minify(source)[0]))
+    
+    def test_other_templates(self):
+        self.env.get_template('plain.txt')
+        self.assertFalse('plain.txt' in self.env.minify_savings)
+    
+    def test_bytecode_variant(self):
+        self.assertEqual(compile_variant(djanjinja.get_env()), None)
+        self.assertEqual(compile_variant(self.env),
+            'minify=.html,.htm,.xhtml,.xml')
+    
+    def test_minify(self):
+        self.assertEqual(minify(u'  a\n  <pre> b  '), (u' a\n<pre> b  ', 'pre'))
+        self.assertEqual(minify(u' </PRE>  c', 'pre'), (u' </PRE> c', None))
+        self.assertEqual(minify(u' </script>  c', 'pre'),
+            (u' </script>  c', 'pre'))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the template performance linter."""
+
+from StringIO import StringIO
+import os
+import sys
+
+from django.core.management import call_command
+from django.utils import simplejson
+from django.test import TestCase
+import jinja2
+
+import djanjinja
+from djanjinja import perflint
+from djanjinja.loader import Bundle
+
+
+class PerfLintTest(TestCase):
+    
+    def setUp(self):
+        self.env = djanjinja.get_env().copy()
+        bundle = Bundle()
+        
+        @bundle.memofunction
+        def badge(article):
+            return article
+        
+        self.env.loaded_bundles.add(bundle)
+        bundle.merge_into(self.env)
+    
+    def lint(self, **kwargs):
+        return [(problem['lineno'], problem['rule'], problem['name'])
+            for problem in perflint.lint(['perflint_page.txt'],
+                environment=self.env, **kwargs)]
+    
+    def test_lint(self):
+        self.assertEqual(self.lint(), [
+            (2, 'url-in-loop', 'url'),
+            (3, 'query-in-loop', 'all'),
+            (4, 'dynamic-include-in-loop', None),
+            (5, 'uncached-call-in-loop', 'setting'),
+            (8, 'length-of-queryset', 'length')])
+        
+        problem = perflint.lint(['perflint_page.txt'], environment=self.env)[0]
+        self.assertEqual(problem['template'], 'perflint_page.txt')
+        self.assertEqual(os.path.basename(problem['filename']),
+            'perflint_page.txt')
+    
+    def test_ignore(self):
+        self.assertEqual(self.lint(ignore=['url-in-loop',
+            'uncached-call-in-loop:setting', 'query-in-loop:filter']), [
+            (3, 'query-in-loop', 'all'),
+            (4, 'dynamic-include-in-loop', None),
+            (8, 'length-of-queryset', 'length')])
+    
+    def test_syntax_error(self):
+        self.env.loader = jinja2.DictLoader({
+            'broken.txt': '{% for item in items %}\n{% endif %}'})
+        problems = perflint.lint(['broken.txt'], environment=self.env)
+        self.assertEqual(len(problems), 1)
+        self.assertEqual(problems[0]['rule'], 'syntax-error')
+        self.assertEqual(problems[0]['lineno'], 2)
+        self.assertEqual(problems[0]['filename'], None)
+    
+    def test_command(self):
+        stdout, sys.stdout = sys.stdout, StringIO()
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            self.assertRaises(SystemExit, call_command, 'jinja_perflint',
+                'perflint_page.txt', format='json', ignore='url-in-loop')
+            output = sys.stdout.getvalue()
+            error = sys.stderr.getvalue()
+            
+            sys.stdout = StringIO()
+            call_command('jinja_perflint', 'plain.txt')
+            clean = sys.stdout.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        
+        problems = simplejson.loads(output)['problems']
+        self.assertEqual([problem['rule'] for problem in problems],
+            ['query-in-loop', 'dynamic-include-in-loop',
+             'uncached-call-in-loop', 'length-of-queryset'])
+        self.assertTrue('4 performance problem(s) found' in error)
+        self.assertEqual(clean, '')
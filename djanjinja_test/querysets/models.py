@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from django.db import models
+
+
+class Row(models.Model):
+    
+    number = models.IntegerField()
+
+
+class OrderedRow(models.Model):
+    
+    number = models.IntegerField()
+    
+    class Meta:
+        ordering = ['-number']
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the ``djanjinja.db`` bundle and query profiling."""
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.test import TestCase
+
+import djanjinja
+from djanjinja import profiling
+from djanjinja.bundles import db
+from djanjinja.middleware import QueryProfileMiddleware
+from djanjinja.views import stream_to_response
+
+from djanjinja_test.querysets.models import Row, OrderedRow
+
+
+class QuerysetTest(TestCase):
+    
+    def setUp(self):
+        for number in range(10):
+            Row.objects.create(number=number)
+            OrderedRow.objects.create(number=number)
+        self.env = djanjinja.get_env().copy()
+        self.env.load('djanjinja', 'db')
+    
+    def numbers(self, chunks):
+        return [[row.number for row in chunk] for chunk in chunks]
+    
+    def test_chunked_by_pk(self):
+        self.assertEqual(self.numbers(db.chunked(Row.objects.all(), 4)),
+            [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.assertEqual(self.numbers(db.chunked(Row.objects.all(), 5)),
+            [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]])
+    
+    def test_chunked_by_offset(self):
+        self.assertEqual(self.numbers(db.chunked(OrderedRow.objects.all(), 4)),
+            [[9, 8, 7, 6], [5, 4, 3, 2], [1, 0]])
+        queryset = Row.objects.order_by('-number')[2:7]
+        self.assertEqual(self.numbers(db.chunked(queryset, 2)),
+            [[7, 6], [5, 4], [3]])
+    
+    def test_chunked_iterable(self):
+        self.assertEqual(list(db.chunked(xrange(5), 2)), [[0, 1], [2, 3], [4]])
+    
+    def test_iterate(self):
+        queryset = Row.objects.all()
+        template = self.env.from_string(
+            '{% for row in iterate(rows, 3) %}{{ row.number }}{% endfor %}')
+        self.assertEqual(template.render(rows=queryset), '0123456789')
+        # The queryset itself never fetched (and cached) any rows.
+        self.assertEqual(queryset._result_cache, None)
+    
+    def test_stream(self):
+        response = stream_to_response('plain.txt')
+        self.assertEqual(''.join(response), 'Hello, World!')
+
+
+class QueryProfileTest(TestCase):
+    
+    def setUp(self):
+        for number in range(3):
+            Row.objects.create(number=number)
+        self.template = djanjinja.get_env().get_template('profile_page.txt')
+        self.profiles = []
+        profiling.render_profiled.connect(self.profiled)
+        settings.JINJA_PROFILE_QUERIES = True
+    
+    def tearDown(self):
+        del settings.JINJA_PROFILE_QUERIES
+        profiling.render_profiled.disconnect(self.profiled)
+    
+    def profiled(self, sender, template, profile, **kwargs):
+        self.profiles.append((template.name, profile))
+    
+    def render(self):
+        return self.template.render(rows=Row.objects.all(), Row=Row)
+    
+    def test_render(self):
+        self.render()
+        self.assertEqual(len(self.profiles), 1)
+        name, profile = self.profiles[0]
+        self.assertEqual(name, 'profile_page.txt')
+        self.assertEqual(profile.queries, 6)
+        
+        lines = dict(((line['template'], line['lineno']), line)
+            for line in profile.as_list())
+        self.assertEqual(sorted(lines), [('profile_item.txt', 1),
+            ('profile_page.txt', 1), ('profile_page.txt', 2),
+            ('profile_page.txt', 3)])
+        # The N+1 query runs the same statement for each row.
+        self.assertEqual(lines['profile_page.txt', 3]['queries'], 3)
+        self.assertEqual(len(lines['profile_page.txt', 3]['statements']), 1)
+        self.assertTrue('(2 repeated)' in profiling.format_line(
+            lines['profile_page.txt', 3]))
+        self.assertTrue(profiling.format_report(profile).startswith(
+            '6 queries in '))
+    
+    def test_disabled(self):
+        settings.JINJA_PROFILE_QUERIES = 0
+        self.render()
+        self.assertEqual(self.profiles, [])
+    
+    def test_middleware(self):
+        middleware = QueryProfileMiddleware()
+        request = HttpRequest()
+        middleware.process_request(request)
+        self.render()
+        self.render()
+        response = middleware.process_response(request, HttpResponse())
+        
+        self.assertEqual(request.jinja_query_profile.queries, 12)
+        self.assertTrue(response['X-Jinja-Query-Profile'].startswith(
+            'profile_page.txt:'))
+        self.assertEqual(
+            len(response['X-Jinja-Query-Profile'].split('; ')), 3)
+        
+        # Requests which aren't sampled aren't profiled at all.
+        settings.JINJA_PROFILE_QUERIES = 0
+        request = HttpRequest()
+        middleware.process_request(request)
+        self.render()
+        response = middleware.process_response(request, HttpResponse())
+        self.assertFalse(hasattr(request, 'jinja_query_profile'))
+        self.assertFalse(response.has_header('X-Jinja-Query-Profile'))
+        self.assertEqual(len(self.profiles), 2)
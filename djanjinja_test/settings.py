@@ -88,6 +88,17 @@ INSTALLED_APPS += (
     'djanjinja_test.shortcuts',
     'djanjinja_test.generic',
     'djanjinja_test.cache',
+    'djanjinja_test.i18n',
+    'djanjinja_test.dependencies',
+    'djanjinja_test.inline',
+    'djanjinja_test.freshness',
+    'djanjinja_test.concurrency',
+    'djanjinja_test.querysets',
+    'djanjinja_test.memo',
+    'djanjinja_test.minify',
+    'djanjinja_test.perflint',
+    'djanjinja_test.humanize',
+    'djanjinja_test.blocks',
 )
 
 
@@ -2,7 +2,12 @@
 
 """Tests for views which render templates using DjanJinja shortcuts."""
 
+from django.template import TemplateDoesNotExist
 from django.test import TestCase
+from jinja2.utils import LRUCache
+
+import djanjinja
+from djanjinja.environment import TemplateLoader, get_template_source
 
 
 PLAIN_RESPONSE = 'Hello, World!'
@@ -31,4 +36,38 @@ class ShortcutsTest(TestCase):
     def test_middleware(self):
         response = self.client.get('/shortcuts/middleware/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.content, MIDDLEWARE_RESPONSE)
\ No newline at end of file
+        self.assertEqual(response.content, MIDDLEWARE_RESPONSE)
+    
+    def test_select(self):
+        response = self.client.get('/shortcuts/select/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, CONTEXT_RESPONSE)
+
+
+class MissingTemplatesTest(TestCase):
+    
+    def setUp(self):
+        self.lookups = []
+        self.env = djanjinja.get_env().copy()
+        self.env.loader = TemplateLoader(self.get_template_source)
+        self.env.missing_templates = LRUCache(10)
+    
+    def get_template_source(self, name):
+        self.lookups.append(name)
+        return get_template_source(name)
+    
+    def test_negative_cache(self):
+        names = ['does_not_exist.txt', 'plain.txt']
+        for i in range(3):
+            self.assertEqual(self.env.select_template(names).name,
+                'plain.txt')
+        # The missing template should only have been looked for once.
+        self.assertEqual(self.lookups.count('does_not_exist.txt'), 1)
+        self.assertTrue(self.env.is_missing('does_not_exist.txt'))
+        self.assertFalse(self.env.is_missing('plain.txt'))
+    
+    def test_invalidate(self):
+        self.assertRaises(TemplateDoesNotExist, self.env.get_template,
+            'does_not_exist.txt')
+        self.env.invalidate('does_not_exist.txt')
+        self.assertFalse(self.env.is_missing('does_not_exist.txt'))
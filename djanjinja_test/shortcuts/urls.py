@@ -8,4 +8,5 @@ urlpatterns = patterns('djanjinja_test.shortcuts.views',
     url(r'^context/$', 'context', name='shortcuts-context'),
     url(r'^req_context/$', 'req_context', name='shortcuts-req_context'),
     url(r'^middleware/$', 'middleware', name='shortcuts-middleware'),
+    url(r'^select/$', 'select', name='shortcuts-select'),
 )
\ No newline at end of file
@@ -29,4 +29,11 @@ def req_context(request):
 def middleware(request):
     """Renders a template with ``request.Context`` using middleware."""
     
-    return request.Context({'a': 1, 'b': 2}).render_response('middleware.txt')
\ No newline at end of file
+    return request.Context({'a': 1, 'b': 2}).render_response('middleware.txt')
+
+
+def select(request):
+    """Renders the first existing template from a list to a response."""
+    
+    return render_to_response(['does_not_exist.txt', 'context.txt'],
+        {'a': 1, 'b': 2})
@@ -2,7 +2,16 @@
 
 """Tests for simple views which render templates."""
 
+import warnings
+
+from django.conf import settings
+from django.http import HttpRequest
 from django.test import TestCase
+import jinja2
+from jinja2.utils import LRUCache
+
+import djanjinja
+from djanjinja import handlers
 
 
 PLAIN_RESPONSE = 'Hello, World!'
@@ -33,3 +42,86 @@ class SimpleTest(TestCase):
         response = self.client.get('/this/does/not/exist/')
         self.assertEqual(response.status_code, 404)
         self.assertEqual(response.content, NOT_FOUND_RESPONSE)
+    
+    def test_cached_404(self):
+        settings.JINJA_CACHE_ERROR_PAGES = True
+        try:
+            handlers.prerender()
+            response = self.client.get('/this/does/not/exist/')
+        finally:
+            del settings.JINJA_CACHE_ERROR_PAGES
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content, NOT_FOUND_RESPONSE)
+        self.assertEqual(handlers.PAGE_NOT_FOUND_SKELETONS['404.html'],
+            (['NOT FOUND: ', ''], False))
+    
+    def test_cached_404_escaping(self):
+        request = HttpRequest()
+        request.path = '/<b>/'
+        settings.JINJA_CACHE_ERROR_PAGES = True
+        try:
+            escaped = handlers.page_not_found(request, '404_escaped.html')
+            filtered = handlers.page_not_found(request, '404_filtered.html')
+        finally:
+            del settings.JINJA_CACHE_ERROR_PAGES
+        
+        # An explicitly-escaped path is escaped in the skeleton too.
+        self.assertEqual(escaped.content, 'NOT FOUND: /&lt;b&gt;/')
+        self.assertEqual(handlers.PAGE_NOT_FOUND_SKELETONS['404_escaped.html'],
+            (['NOT FOUND: ', ''], True))
+        # Otherwise-filtered paths are rendered afresh.
+        self.assertEqual(filtered.status_code, 404)
+        self.assertEqual(filtered.content, 'NOT FOUND: /&lt;B&gt;/')
+        self.assertEqual(
+            handlers.PAGE_NOT_FOUND_SKELETONS['404_filtered.html'],
+            (None, None))
+    
+    def test_split_skeleton(self):
+        env = djanjinja.get_env()
+        self.assertEqual(handlers.split_skeleton(
+            env.from_string('a{{ request_path }}b')), ([u'a', u'b'], False))
+        # A path used in different ways can't be substituted.
+        self.assertEqual(handlers.split_skeleton(env.from_string(
+            '{{ request_path }}{{ request_path|e }}')), (None, None))
+        self.assertEqual(handlers.split_skeleton(env.from_string(
+            '{{ request_path|truncate(50)|e }}')), (None, None))
+    
+    def test_cached_500(self):
+        settings.JINJA_CACHE_ERROR_PAGES = True
+        try:
+            response = handlers.server_error(HttpRequest())
+            fallback = handlers.server_error(HttpRequest(),
+                template_name='does_not_exist.html')
+        finally:
+            del settings.JINJA_CACHE_ERROR_PAGES
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.content, SERVER_ERROR_RESPONSE)
+        self.assertEqual(fallback.status_code, 500)
+        self.assertEqual(fallback.content, handlers.SERVER_ERROR_FALLBACK)
+    
+    def test_preload(self):
+        report = djanjinja.preload(['*.txt', '404.html', 'does_not_exist'])
+        self.assertEqual(report['bundles'], list(settings.DJANJINJA_BUNDLES))
+        for name in ['plain.txt', 'context.txt', '404.html']:
+            self.assertTrue(name in report['templates'])
+            self.assertTrue(name in djanjinja.get_env().cache)
+        self.assertEqual(report['errors'].keys(), ['does_not_exist'])
+        self.assertTrue(report['total'] >= sum(report['templates'].values()))
+        self.assertEqual(report['cache_size'],
+            getattr(settings, 'JINJA_CACHE_SIZE', 50))
+        self.assertEqual(report['evicted'], 0)
+    
+    def test_preload_evicted(self):
+        env = djanjinja.get_env()
+        cache = env.cache
+        env.cache = LRUCache(2)
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                report = djanjinja.preload(
+                    ['plain.txt', 'context.txt', '404.html'])
+        finally:
+            env.cache = cache
+        self.assertEqual((report['cache_size'], report['evicted']), (2, 1))
+        self.assertEqual(len(caught), 1)
+        self.assertTrue('JINJA_CACHE_SIZE' in str(caught[0].message))
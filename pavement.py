@@ -16,6 +16,18 @@ def lint(options):
     run_pylint('djanjinja_test', rcfile=rcfile, disable_msg='C0111')
 
 
+@task
+def benchmark(options):
+    """Compare the native humanize filters with Django's originals."""
+    
+    import os
+    
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'djanjinja_test.settings'
+    
+    from djanjinja_test.humanize import benchmark
+    benchmark.main()
+
+
 def run_pylint(directory, **options):
     """Run PyLint on a given directory, with some command-line options."""
     
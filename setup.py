@@ -7,7 +7,8 @@ setup(
     name='DjanJinja',
     version='0.8',
     description='Easy Django and Jinja2 integration.',
-    packages=['djanjinja', 'djanjinja.bundles', 'djanjinja.extensions'],
+    packages=['djanjinja', 'djanjinja.bundles', 'djanjinja.extensions',
+        'djanjinja.management', 'djanjinja.management.commands'],
     url='http://bitbucket.org/zacharyvoase/djanjinja/',
     
     author='Zachary Voase',